@@ -7,7 +7,7 @@ from BeautifulSoup import BeautifulSoup
 import aqt
 from aqt.qt import *
 from aqt.utils import openHelp
-from power_format_pack import const
+from power_format_pack import utility
 
 
 def onHtmlEdit(self):
@@ -18,12 +18,11 @@ def onHtmlEdit(self):
     d.connect(form.buttonBox, SIGNAL("helpRequested()"), lambda: openHelp("editor"))
     org_html = self.note.fields[self.currentField]
     html_without_data = org_html
-    start_md_data = org_html.find(const.START_HTML_MARKER)
-    end_md_data = org_html.find(const.END_HTML_MARKER, start_md_data)
-    contains_data = start_md_data != -1 and end_md_data != -1
+    start_md_data, end_md_data = utility.find_md_data(org_html)
+    contains_data = start_md_data != -1
     if contains_data:
-        md_data = org_html[start_md_data:(end_md_data + len(const.END_HTML_MARKER))]
-        html_without_data = org_html[:start_md_data] + org_html[end_md_data + len(const.END_HTML_MARKER):]
+        md_data = org_html[start_md_data:end_md_data]
+        html_without_data = org_html[:start_md_data] + org_html[end_md_data:]
     form.textEdit.setPlainText(html_without_data)
     form.textEdit.moveCursor(QTextCursor.End)
     d.exec_()
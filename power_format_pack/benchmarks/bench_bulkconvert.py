@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014-2017 Stefan van den Akker <neftas@protonmail.com>
+#
+# This file is part of Power Format Pack.
+#
+# Power Format Pack is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Power Format Pack is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Power Format Pack. If not, see http://www.gnu.org/licenses/.
+
+"""
+Measure the throughput of `BulkConverter` for combinations of process
+count, batch size and chunk size, to choose the defaults in `const`.
+The notes live in an SQLite file, like a collection, so that the cost of
+writing and committing them is part of the measurement. Run with:
+
+    python -m power_format_pack.benchmarks.bench_bulkconvert --notes 50000
+"""
+
+import argparse
+import itertools
+import os
+import shutil
+import sqlite3
+import tempfile
+import timeit
+
+from power_format_pack import const
+from power_format_pack.bulkconvert import BulkConverter
+
+FIELD_SEPARATOR = u"\x1f"
+
+SAMPLE_FIELDS = (
+    u"<div>**bold** and *italic* with `code`</div>",
+    u"<div>1. first</div><div>2. second</div><div>3. third</div>",
+    u"<div>```python</div><div>def fn(n):</div><div>&nbsp; &nbsp; return n * 2</div><div>```</div>",
+    u"<div>| a | b |</div><div>|---|---|</div><div>| 1 | 2 |</div>",
+    u"<div>![](image (1).jpg) and [a link](http://example.com)</div>",
+)
+
+
+class Note(object):
+
+    def __init__(self, col, note_id, fields):
+        self.col = col
+        self.id = note_id
+        self.fields = fields
+
+    def keys(self):
+        return [u"Front", u"Back"]
+
+    def flush(self):
+        self.col.db.execute("update notes set flds = ? where id = ?",
+                            (FIELD_SEPARATOR.join(self.fields), self.id))
+
+
+class Collection(object):
+    """
+    The part of `anki.collection._Collection` that `BulkConverter` uses.
+    """
+
+    def __init__(self, path, num_notes):
+        self.db = sqlite3.connect(path)
+        self.db.execute("create table notes (id integer primary key, flds text)")
+        self.db.executemany("insert into notes values (?, ?)", (
+            (i, FIELD_SEPARATOR.join((SAMPLE_FIELDS[i % len(SAMPLE_FIELDS)],
+                                      SAMPLE_FIELDS[(i + 1) % len(SAMPLE_FIELDS)])))
+            for i in xrange(num_notes)))
+        self.db.commit()
+
+    def getNote(self, note_id):
+        flds = self.db.execute("select flds from notes where id = ?", (note_id,)).fetchone()[0]
+        return Note(self, note_id, flds.split(FIELD_SEPARATOR))
+
+    def save(self):
+        self.db.commit()
+
+
+def run(num_notes, processes, batch_size, chunk_size):
+    """
+    Convert `num_notes` synthetic notes and return the number of notes per
+    second.
+    """
+    prefs = {const.MARKDOWN_CLASSFUL_PYGMENTS: False, const.MARKDOWN_SYNTAX_STYLE: "tango"}
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        col = Collection(os.path.join(tmp_dir, "collection.db"), num_notes)
+        converter = BulkConverter(prefs, processes, batch_size, chunk_size)
+        start = timeit.default_timer()
+        converter.run(col, range(num_notes), None, const.MARKDOWN_CONVERT)
+        col.save()
+        return num_notes / (timeit.default_timer() - start)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def parse_sizes(s):
+    return [int(size) for size in s.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--notes", type=int, default=2000)
+    parser.add_argument("--processes", type=parse_sizes, default=[1, BulkConverter({}).get_processes()])
+    parser.add_argument("--batch-sizes", type=parse_sizes, default=[100, const.BULK_BATCH_SIZE, 2000])
+    parser.add_argument("--chunk-sizes", type=parse_sizes, default=[1, const.BULK_CHUNK_SIZE, 100])
+    args = parser.parse_args()
+
+    print "{:>9} {:>10} {:>10} {:>12}".format("processes", "batch size", "chunk size", "notes/sec")
+    for processes, batch_size, chunk_size in itertools.product(
+            sorted(set(args.processes)), args.batch_sizes, args.chunk_sizes):
+        if processes == 1 and chunk_size != args.chunk_sizes[0]:
+            # the chunk size only matters for a pool of processes
+            continue
+        notes_per_second = run(args.notes, processes, batch_size, chunk_size)
+        print "{:>9} {:>10} {:>10} {:>12.1f}".format(processes, batch_size, chunk_size, notes_per_second)
+
+
+if __name__ == "__main__":
+    main()
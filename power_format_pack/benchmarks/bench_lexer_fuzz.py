@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014-2017 Stefan van den Akker <neftas@protonmail.com>
+#
+# This file is part of Power Format Pack.
+#
+# Power Format Pack is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Power Format Pack is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Power Format Pack. If not, see http://www.gnu.org/licenses/.
+
+"""
+Fuzz every Pygments lexer with mangled code and report its worst-case
+throughput, slowest lexer first. Every lexer runs in a child process that
+is stopped when one input takes longer than the timeout; such an input is
+reported as a hang, with the SHA-1 that `HighlightWatchdog` records code
+blocks by. Run with:
+
+    python -m power_format_pack.benchmarks.bench_lexer_fuzz
+"""
+
+import argparse
+import codecs
+import json
+import multiprocessing
+import os
+import random
+import sys
+import timeit
+
+import power_format_pack
+
+# the vendored Pygments imports itself as a top-level package
+sys.path.insert(0, os.path.dirname(power_format_pack.__file__))
+
+from pygments import lexers
+from pygments.lexers._mapping import LEXERS
+from pygments.util import itervalues
+
+from power_format_pack.markdown.extensions.codehilite import HighlightWatchdog
+
+SEEDS = [
+    u"def f(x, *args):\n    \"\"\"Doc.\"\"\"\n    return [i for i in x if i] + {'a': 1.5e3}  # c\n",
+    u"int main(void) {\n    /* comment */\n    printf(\"%d\\n\", a[0] ? 'c' : 0x1F);\n}\n",
+    u"<html><head><style>p { color: #fff; }</style></head><!-- c -->\n"
+    u"<body><p class='a'>&amp; {{ var }} {% if x %}y{% endif %}</p></body></html>\n",
+    u"{\"a\": [1, 2.5, -3e10, true, null], \"b\": {\"c\": \"d\\u00e9\"}}\n",
+    u"SELECT n.id FROM notes n WHERE n.flds LIKE '%foo%' ORDER BY n.id;\n",
+    u"for f in *.txt; do echo \"${f%.txt}\" | sed 's/a/b/g'; done # c\n<<EOF\nx\nEOF\n",
+    u"(defun f (n) \"doc\" (if (<= n 1) 1 `(,n ,@(f (- n 1)))))\n; c\n",
+]
+# characters that open or close strings, comments and other nested states
+DELIMITERS = u"\"'`{}[]()<>/*#;:\\$@%!?=|&\n\t "
+
+
+def mangle(rnd, text, edits):
+    """
+    Return `text` after `edits` random insertions of delimiters, deletions
+    and repetitions of parts of it.
+    """
+    for _ in xrange(edits):
+        start = rnd.randrange(len(text) + 1)
+        end = min(len(text), start + rnd.randrange(1, 40))
+        operation = rnd.random()
+        if operation < 0.5:
+            text = text[:start] + rnd.choice(DELIMITERS) * rnd.randrange(1, 4) + text[start:]
+        elif operation < 0.7:
+            text = text[:start] + text[end:]
+        else:
+            text = text[:end] + text[start:end] * rnd.randrange(1, 20) + text[end:]
+    return text
+
+
+def get_inputs(name, count, seed=0):
+    """
+    Return `count` mangled inputs for the lexer called `name`; the same
+    ones on every run.
+    """
+    rnd = random.Random(u"{}:{}".format(seed, name))
+    inputs = list()
+    for _ in xrange(count):
+        text = u"".join(rnd.choice(SEEDS) for _ in xrange(rnd.randrange(1, 5)))
+        inputs.append(mangle(rnd, text, rnd.randrange(1, 30)) or text)
+    return inputs
+
+
+def lex_inputs(name, inputs, send):
+    """
+    Lex every input with the lexer called `name` and `send` the time each
+    one took, after an empty message once the lexer is created.
+    """
+    lexer = lexers.find_lexer_class(name)()
+    send(None)
+    for text in inputs:
+        start = timeit.default_timer()
+        for _ in lexer.get_tokens_unprocessed(text):
+            pass
+        send(timeit.default_timer() - start)
+
+
+def _run_in_child(connection, name, inputs):
+    try:
+        lex_inputs(name, inputs, connection.send)
+    except Exception as e:
+        connection.send(repr(e))
+    connection.close()
+
+
+def run_lexer(name, inputs, timeout):
+    """
+    Return the times it took to lex each of `inputs` with the lexer called
+    `name`, and an error, `"hang"` when an input took more than `timeout`
+    seconds, or `None`.
+    """
+    times = list()
+    if sys.platform.startswith("win"):
+        # no fork, so no way to stop a hang either
+        try:
+            lex_inputs(name, inputs, lambda elapsed: elapsed is not None and times.append(elapsed))
+        except Exception as e:
+            return times, repr(e)
+        return times, None
+    parent, child = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_run_in_child, args=(child, name, inputs))
+    process.start()
+    child.close()
+    error = None
+    # creating the lexer may compile many regular expressions
+    limits = [timeout * 10] + [timeout] * len(inputs)
+    for limit in limits:
+        if not parent.poll(limit):
+            process.terminate()
+            error = "hang"
+            break
+        try:
+            message = parent.recv()
+        except EOFError:
+            error = "exited"
+            break
+        if isinstance(message, basestring):
+            error = message
+            break
+        if message is not None:
+            times.append(message)
+    process.join()
+    return times, error
+
+
+def summarize(name, inputs, times, error):
+    """
+    Return a dictionary with the worst and median throughput in characters
+    per second of the lexer called `name`, and the watchdog key of its
+    slowest input.
+    """
+    rates = sorted((len(text) / max(elapsed, 1e-9), index)
+                   for index, (text, elapsed) in enumerate(zip(inputs, times)))
+    if error == "hang":
+        worst_index = len(times)
+    elif rates:
+        worst_index = rates[0][1]
+    else:
+        worst_index = None
+    return {
+        "name": name,
+        "inputs": len(times),
+        "worst_chars_per_sec": 0.0 if error == "hang" else (rates[0][0] if rates else None),
+        "median_chars_per_sec": rates[len(rates) // 2][0] if rates else None,
+        # CodeHilite strips the newlines around a code block before hashing
+        "worst_sha1": (HighlightWatchdog.get_hash(inputs[worst_index].strip(u"\n"))
+                       if worst_index is not None else None),
+        "error": error
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("-k", "--pattern", help="only fuzz lexers whose name contains PATTERN")
+    parser.add_argument("--inputs", type=int, default=20, help="number of inputs per lexer")
+    parser.add_argument("--timeout", type=float, default=5.0,
+                        help="seconds an input may take before it counts as a hang")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random inputs")
+    parser.add_argument("--json", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    names = sorted(info[1] for info in itervalues(LEXERS))
+    results = list()
+    for name in names:
+        if args.pattern and args.pattern.lower() not in name.lower():
+            continue
+        inputs = get_inputs(name, args.inputs, args.seed)
+        times, error = run_lexer(name, inputs, args.timeout)
+        results.append(summarize(name, inputs, times, error))
+        sys.stderr.write(".")
+        sys.stderr.flush()
+    sys.stderr.write("\n")
+
+    results.sort(key=lambda result: (result["worst_chars_per_sec"] is None,
+                                     result["worst_chars_per_sec"]))
+    print "{:<40} {:>16} {:>16}  {:<12} {}".format("lexer", "worst chars/s", "median chars/s",
+                                                   "worst sha1", "error")
+    for result in results:
+        print "{:<40} {:>16} {:>16}  {:<12} {}".format(
+            result["name"][:40],
+            "-" if result["worst_chars_per_sec"] is None else "{:.0f}".format(result["worst_chars_per_sec"]),
+            "-" if result["median_chars_per_sec"] is None else "{:.0f}".format(result["median_chars_per_sec"]),
+            (result["worst_sha1"] or "-")[:12], result["error"] or "")
+    if args.json:
+        with codecs.open(args.json, "w", encoding="utf8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
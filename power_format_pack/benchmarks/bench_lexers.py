@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014-2017 Stefan van den Akker <neftas@protonmail.com>
+#
+# This file is part of Power Format Pack.
+#
+# Power Format Pack is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Power Format Pack is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Power Format Pack. If not, see http://www.gnu.org/licenses/.
+
+"""
+Benchmark the lexer lookups of Pygments for every alias, name and filename
+pattern, next to the linear scans over `LEXERS` they replace, the guessing
+of languages, the tokenizing with and without merged rules, the lexing
+of an edited text from scratch and incrementally, the creation of HTML
+formatters for every style and the highlighting of a note with many code
+blocks. Run with:
+
+    python -m power_format_pack.benchmarks.bench_lexers
+"""
+
+import os
+import sys
+
+import power_format_pack
+from power_format_pack.benchmarks import harness
+
+# the vendored Pygments imports itself as a top-level package
+sys.path.insert(0, os.path.dirname(power_format_pack.__file__))
+
+from pygments import incremental, lexers
+from pygments.formatters import HtmlFormatter, get_formatter_by_name
+from pygments.lexers._mapping import LEXERS
+from pygments.util import itervalues
+
+from power_format_pack.markdown.extensions import codehilite
+
+ALIASES = sorted(set(alias for info in itervalues(LEXERS) for alias in info[2]))
+NAMES = sorted(info[1] for info in itervalues(LEXERS))
+GUESS_SAMPLES = [
+    "#!/usr/bin/env python\nimport sys",
+    "#include <stdio.h>\nint main(void) { return 0; }",
+    "<?php echo 'hi'; ?>",
+    "{% extends 'base.html' %}{{ title }}",
+    "SELECT * FROM notes WHERE id = 1;",
+]
+TOKENIZE_SOURCE = open(os.path.join(os.path.dirname(power_format_pack.__file__), "markdowner.py")).read().decode("utf-8")
+TOKENIZE_LANGUAGES = ["python", "java", "c", "common-lisp", "js", "bash"]
+SNIPPETS = ["def f{0}(x):\n    return x + {0}".format(i) for i in xrange(20)]
+EDITS = [(i * 997 % len(TOKENIZE_SOURCE), u"x = {0}\n".format(i)) for i in xrange(1, 21)]
+STYLES = sorted(os.path.splitext(fn)[0] for fn in os.listdir(os.path.join(os.path.dirname(power_format_pack.__file__),
+                                                                       "pygments", "styles"))
+                if fn.endswith(".py") and not fn.startswith("_"))
+FILENAMES = sorted(set(pattern.replace("*", "example").replace("?", "x").replace("[", "").replace("]", "")
+                       for info in itervalues(LEXERS) for pattern in info[3]))
+
+
+def linear_find_alias(alias):
+    for module_name, name, aliases, _, _ in itervalues(LEXERS):
+        if alias.lower() in aliases:
+            return module_name, name
+
+
+def linear_find_filename(fn):
+    return [(module_name, name, pattern)
+            for module_name, name, _, patterns, _ in itervalues(LEXERS)
+            for pattern in patterns if lexers._fn_matches(fn, pattern)]
+
+
+def guess_lexer_linear(text):
+    best_lexer = [0.0, None]
+    for lexer in lexers._iter_lexerclasses():
+        rv = lexer.analyse_text(text)
+        if rv == 1.0:
+            return lexer
+        if rv > best_lexer[0]:
+            best_lexer[:] = (rv, lexer)
+    return best_lexer[1]
+
+
+def get_lexer_by_name(aliases):
+    for alias in aliases:
+        lexers.get_lexer_by_name(alias)
+
+
+def find_alias_linear(aliases):
+    for alias in aliases:
+        linear_find_alias(alias)
+
+
+def find_alias_indexed(aliases):
+    index = lexers._get_indexes()[0]
+    for alias in aliases:
+        index.get(alias.lower())
+
+
+def find_filename_linear(filenames):
+    for fn in filenames:
+        linear_find_filename(fn)
+
+
+def find_filename_indexed(filenames):
+    for fn in filenames:
+        lexers._find_filename_matches(fn)
+
+
+def find_lexer_class(names):
+    for name in names:
+        lexers.find_lexer_class(name)
+
+
+def guess_linear(samples):
+    for text in samples:
+        guess_lexer_linear(text)
+
+
+def guess_uncached(samples):
+    for text in samples:
+        lexers._guess_cache.clear()
+        lexers._guess_lexer_class(text)
+
+
+def guess_cached(samples):
+    for text in samples:
+        try:
+            lexers.guess_lexer(text)
+        except lexers.ClassNotFound:
+            pass
+
+
+def tokenize(merge_rules):
+    def run(languages):
+        for alias in languages:
+            lexer = lexers.get_lexer_by_name(alias)
+            lexer.merge_rules = merge_rules
+            for _ in lexer.get_tokens_unprocessed(TOKENIZE_SOURCE):
+                pass
+    return run
+
+
+def get_edited_texts(lexer):
+    text = lexer._preprocess_text(TOKENIZE_SOURCE)
+    for pos, insertion in EDITS:
+        start = text.index("\n", pos) + 1
+        text = text[:start] + insertion + text[start:]
+        yield text
+
+
+def relex_full(edits):
+    lexer = lexers.get_lexer_by_name("python")
+    for text in get_edited_texts(lexer):
+        incremental.lex(lexer, text)
+
+
+def relex_incremental(edits):
+    lexer = lexers.get_lexer_by_name("python")
+    lexed = incremental.lex(lexer, lexer._preprocess_text(TOKENIZE_SOURCE))
+    for text in get_edited_texts(lexer):
+        lexed = incremental.relex(lexer, lexed, text)
+
+
+def create_formatters(styles):
+    for style in styles:
+        HtmlFormatter(style=style, noclasses=True, hl_lines=[1])
+
+
+def format_inline_styles(styles):
+    lexer = lexers.get_lexer_by_name("python")
+    tokens = list(lexer.get_tokens(TOKENIZE_SOURCE))
+    for style in styles[:3]:
+        codehilite.format_tokens(tokens, HtmlFormatter(style=style, noclasses=True))
+
+
+def hilite_uncached(snippets):
+    for src in snippets:
+        lexer = lexers.get_lexer_by_name("python")
+        formatter = get_formatter_by_name("html", style="default", noclasses=True)
+        codehilite.highlight(src, lexer, formatter)
+
+
+def hilite_cached(snippets):
+    for src in snippets:
+        codehilite.CodeHilite(src, lang="python", noclasses=True).hilite()
+
+
+def get_benchmarks():
+    yield "get_lexer_by_name/all_aliases", get_lexer_by_name, ALIASES
+    yield "alias_lookup/linear", find_alias_linear, ALIASES
+    yield "alias_lookup/indexed", find_alias_indexed, ALIASES
+    yield "find_lexer_class/all_names", find_lexer_class, NAMES
+    yield "filename_lookup/linear", find_filename_linear, FILENAMES
+    yield "filename_lookup/indexed", find_filename_indexed, FILENAMES
+    yield "guess_lexer/linear", guess_linear, GUESS_SAMPLES
+    yield "guess_lexer/analysers", guess_uncached, GUESS_SAMPLES
+    yield "guess_lexer/cached", guess_cached, GUESS_SAMPLES
+    yield "tokenize/one_by_one", tokenize(False), TOKENIZE_LANGUAGES
+    yield "tokenize/merged", tokenize(True), TOKENIZE_LANGUAGES
+    yield "relex_20_edits/full", relex_full, EDITS
+    yield "relex_20_edits/incremental", relex_incremental, EDITS
+    yield "html_formatter/all_styles", create_formatters, STYLES
+    yield "format_inline_styles/3_styles", format_inline_styles, STYLES
+    yield "hilite_20_snippets/uncached", hilite_uncached, SNIPPETS
+    yield "hilite_20_snippets/cached", hilite_cached, SNIPPETS
+
+
+if __name__ == "__main__":
+    harness.main(get_benchmarks(), __doc__.strip().split("\n")[0])
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014-2017 Stefan van den Akker <neftas@protonmail.com>
+#
+# This file is part of Power Format Pack.
+#
+# Power Format Pack is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Power Format Pack is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Power Format Pack. If not, see http://www.gnu.org/licenses/.
+
+"""
+Benchmark the Markdown converter of the add-on over the synthetic corpus.
+Run with:
+
+    python -m power_format_pack.benchmarks.bench_markdown
+"""
+
+from power_format_pack.benchmarks import corpus, harness
+from power_format_pack.blockrenderer import BlockRenderer
+from power_format_pack.converterpool import ConverterPool
+
+# the inline patterns of a card with plain text, as in most fields
+PLAIN_TEXT = u"A line of plain text, without any markup, as most fields have.\n" * 20
+
+# a paragraph of 20 KB full of footnote references and abbreviations
+REFERENCES = (u" ".join(u"The HTML spec[^{0}] and the CSS spec[^{1}] of the W3C.".format(i % 10, i % 10 + 1)
+                        for i in xrange(350)) +
+              u"\n\n" + u"".join(u"[^{0}]: Note {0}.\n".format(i) for i in xrange(11)) +
+              u"\n*[HTML]: Hyper Text Markup Language\n*[CSS]: Cascading Style Sheets\n"
+              u"*[W3C]: World Wide Web Consortium\n")
+
+
+# a long field of paragraphs, lists and code, of which one paragraph is
+# edited on every run
+LONG_FIELD = u"\n\n".join(
+    [u"Paragraph {0} with *emphasis*, `code`, a [link][1] and HTML.".format(i) for i in xrange(60)] +
+    [u"* item {0}\n* item **{0}**".format(i) for i in xrange(20)] +
+    [u"```python\ndef f{0}(x):\n    return x * {0}\n```".format(i) for i in xrange(20)] +
+    [u"[1]: http://example.com/", u"*[HTML]: Hyper Text Markup Language"])
+
+
+def convert_inline(filter_patterns):
+    md = ConverterPool.create_converter((False, u"tango", False))
+    md.treeprocessors["inline"].filterPatterns = filter_patterns
+
+    def run(text):
+        md.reset()
+        return md.convert(text)
+    return run
+
+
+def convert_edited(max_entries):
+    key = (False, u"tango", False)
+    md = ConverterPool.create_converter(key)
+    renderer = BlockRenderer(max_entries)
+    edits = [0]
+
+    def run(text):
+        edits[0] += 1
+        md.reset()
+        return renderer.convert(md, key, text.replace(u"Paragraph 30", u"Paragraph 30.{}".format(edits[0])))
+    return run
+
+
+def serialize_tree():
+    md = ConverterPool.create_converter((False, u"tango", False))
+    trees = dict()
+
+    def run(text):
+        # the tree is built on the first run, which is not measured
+        if text not in trees:
+            lines = text.split(u"\n")
+            for preprocessor in md.preprocessors.values():
+                lines = preprocessor.run(lines)
+            root = md.parser.parseDocument(lines).getroot()
+            for treeprocessor in md.treeprocessors.values():
+                new_root = treeprocessor.run(root)
+                if new_root is not None:
+                    root = new_root
+            trees[text] = root
+        return md.serializer(trees[text])
+    return run
+
+
+def get_benchmarks():
+    """
+    Yield tuples of name, function and argument for every card in the
+    corpus.
+    """
+    cards = corpus.get_cards()
+    cards["plain/medium"] = PLAIN_TEXT
+    cards["references/20k"] = REFERENCES
+    for card, md in cards.iteritems():
+        yield "inline_all_patterns/" + card, convert_inline(False), md
+        yield "inline_filtered_patterns/" + card, convert_inline(True), md
+        yield "serialize/" + card, serialize_tree(), md
+    yield "edit_whole_text/long_field", convert_edited(0), LONG_FIELD
+    yield "edit_block/long_field", convert_edited(2048), LONG_FIELD
+
+
+if __name__ == "__main__":
+    harness.main(get_benchmarks(), __doc__.strip().split("\n")[0])
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014-2017 Stefan van den Akker <neftas@protonmail.com>
+#
+# This file is part of Power Format Pack.
+#
+# Power Format Pack is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Power Format Pack is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Power Format Pack. If not, see http://www.gnu.org/licenses/.
+
+"""
+Report the import cost per module of loading the add-on, once as it starts
+now (with lazy modules) and once with every lazy module imported up front,
+as it did before. Every measurement runs in a fresh interpreter. Run with
+the Python that Anki uses, so that `aqt` can be imported:
+
+    python -m power_format_pack.benchmarks.bench_startup
+"""
+
+import __builtin__
+import argparse
+import json
+import subprocess
+import sys
+import timeit
+
+DEFAULT_MODULE = "power_format_pack.extra_buttons"
+
+
+class ImportTimer(object):
+    """
+    Replace the built-in `__import__` to measure the time spent in the
+    first import of each module, with and without the modules it imports.
+    """
+
+    def __init__(self):
+        self.times = dict()
+        self._children = [0.0]
+        self._original_import = __builtin__.__import__
+
+    def install(self):
+        __builtin__.__import__ = self._import
+
+    def uninstall(self):
+        __builtin__.__import__ = self._original_import
+
+    def _import(self, name, globals=None, locals=None, fromlist=None, level=-1):
+        candidates = [name]
+        package = (globals or dict()).get("__name__", "")
+        if package and level != 0:
+            candidates.append(package.rpartition(".")[0] + "." + name)
+        if any(candidate in sys.modules for candidate in candidates):
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        self._children.append(0.0)
+        start = timeit.default_timer()
+        try:
+            module = self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = timeit.default_timer() - start
+            children = self._children.pop()
+            self._children[-1] += elapsed
+        full_name = getattr(module, "__name__", name)
+        if not fromlist and "." in name:
+            full_name += "." + name.partition(".")[2]
+        cumulative, self_time = self.times.get(full_name, (0.0, 0.0))
+        self.times[full_name] = (cumulative + elapsed, self_time + elapsed - children)
+        return module
+
+
+def measure(module, eager):
+    """
+    Import `module` and, when `eager` is `True`, every lazy module, and
+    return a dictionary with the total time and the times per module.
+    """
+    timer = ImportTimer()
+    timer.install()
+    start = timeit.default_timer()
+    try:
+        __import__(module)
+        if eager:
+            from power_format_pack import lazyimport
+            lazyimport.load_all()
+    finally:
+        total = timeit.default_timer() - start
+        timer.uninstall()
+    return {"total": total, "modules": timer.times}
+
+
+def run_child(module, eager):
+    command = [sys.executable, "-m", __name__.replace("__main__", "power_format_pack.benchmarks.bench_startup"),
+               "--child", "--module", module]
+    if eager:
+        command.append("--eager")
+    output = subprocess.check_output(command)
+    return json.loads(output.splitlines()[-1])
+
+
+def print_report(name, result, top):
+    print "{}: {:.1f} ms in total".format(name, result["total"] * 1000)
+    print "  {:<60} {:>10} {:>10}".format("module", "self ms", "total ms")
+    modules = sorted(result["modules"].items(), key=lambda item: -item[1][1])
+    for module, (cumulative, self_time) in modules[:top]:
+        print "  {:<60} {:>10.1f} {:>10.1f}".format(module, self_time * 1000, cumulative * 1000)
+    print
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--module", default=DEFAULT_MODULE, help="the module that starts the add-on")
+    parser.add_argument("--top", type=int, default=20, help="number of modules to list")
+    parser.add_argument("--runs", type=int, default=5, help="number of runs; the fastest one is reported")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--eager", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print json.dumps(measure(args.module, args.eager))
+        return
+
+    results = dict()
+    for eager in (True, False):
+        runs = [run_child(args.module, eager) for _ in xrange(args.runs)]
+        results[eager] = min(runs, key=lambda result: result["total"])
+
+    print_report("Before (everything imported at start)", results[True], args.top)
+    print_report("After (heavy modules imported on first use)", results[False], args.top)
+    deferred = sorted(set(results[True]["modules"]) - set(results[False]["modules"]))
+    print "Deferred until first use: {} modules, {:.1f} ms saved at start".format(
+        len(deferred), (results[True]["total"] - results[False]["total"]) * 1000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014-2017 Stefan van den Akker <neftas@protonmail.com>
+#
+# This file is part of Power Format Pack.
+#
+# Power Format Pack is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Power Format Pack is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Power Format Pack. If not, see http://www.gnu.org/licenses/.
+
+"""
+Benchmark the hot paths of `utility` and `Markdowner` over the synthetic
+corpus. Run with:
+
+    python -m power_format_pack.benchmarks.bench_utility --save-baseline baseline.json
+    python -m power_format_pack.benchmarks.bench_utility --baseline baseline.json
+"""
+
+from power_format_pack import const, utility
+from power_format_pack.benchmarks import corpus, harness
+from power_format_pack.blockrenderer import BlockRenderer
+from power_format_pack.bulkconvert import HeadlessMarkdowner
+from power_format_pack.markdowner import Markdowner
+from power_format_pack.rendercache import RenderCache
+
+PREFS = {const.MARKDOWN_CLASSFUL_PYGMENTS: False, const.MARKDOWN_SYNTAX_STYLE: "tango"}
+
+
+def convert_markdown_to_html(md):
+    return HeadlessMarkdowner(1, u"", 0, PREFS).convert_markdown_to_html(md)
+
+
+# the rule that escapes whitespace in the location of images; the text cards
+# of the corpus have images with spaces in their file names
+WHITESPACE_REGEX, WHITESPACE_ESCAPE = const.LINK_IMG_ESCAPE_RULES[-1]
+
+
+def replace_link_img_matches(md):
+    return utility.replace_link_img_matches(WHITESPACE_REGEX, WHITESPACE_ESCAPE, md)
+
+
+def insert_md_data(md):
+    return utility.insert_md_data(u"1-000", u"True", md, md)
+
+
+def get_benchmarks():
+    """
+    Yield tuples of name, function and argument for every function and
+    card in the corpus.
+    """
+    # the render and block caches would turn every run after the first into
+    # a lookup
+    Markdowner.RENDER_CACHE = RenderCache(max_entries=0)
+    Markdowner.BLOCK_RENDERER = BlockRenderer(max_entries=0)
+
+    for card, md in corpus.get_cards().iteritems():
+        field_html = utility.convert_clean_md_to_html(md, put_breaks=True)
+        html_with_data = insert_md_data(md)
+        yield "strip_html_from_markdown/" + card, utility.strip_html_from_markdown, field_html
+        yield "convert_markdown_to_html/" + card, convert_markdown_to_html, md
+        yield "convert_clean_md_to_html/" + card, utility.convert_clean_md_to_html, md
+        yield "replace_link_img_matches/" + card, replace_link_img_matches, md
+        yield "insert_md_data/" + card, insert_md_data, md
+        yield "get_md_data_from_string/" + card, utility.get_md_data_from_string, html_with_data
+
+
+if __name__ == "__main__":
+    harness.main(get_benchmarks(), __doc__.strip().split("\n")[0])
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014-2017 Stefan van den Akker <neftas@protonmail.com>
+#
+# This file is part of Power Format Pack.
+#
+# Power Format Pack is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Power Format Pack is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Power Format Pack. If not, see http://www.gnu.org/licenses/.
+
+"""
+Synthetic cards for the benchmarks. Every card is built from a block of
+Markdown that is repeated until the card reaches its size, so that the
+corpus is the same on every run.
+"""
+
+import collections
+
+# number of times the block of a kind is repeated per size
+SIZES = collections.OrderedDict((
+    ("small", 1),
+    ("medium", 10),
+    ("huge", 200),
+))
+
+BLOCKS = collections.OrderedDict((
+    ("text", u"""\
+Some **bold** and *italic* text with `inline code` and a [link](http://example.com).
+A second line with an image: ![](image (1).jpg) and an ampersand & a bracket <.
+
+"""),
+    ("code", u"""\
+```python
+def fibonacci(n):
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b  # comment
+    return a
+```
+
+    :::javascript
+    var x = [1, 2, 3].map(function (n) { return n * 2; });
+
+"""),
+    ("table", u"""\
+| Name | Value | Description |
+|:-----|------:|:-----------:|
+| one | 1 | the **first** |
+| two | 2 | the *second* |
+| three | 3 | the `third` |
+
+"""),
+    ("deflist", u"""\
+Apple
+:   Pomaceous fruit of plants of the genus Malus.
+
+Orange
+:   The fruit of an evergreen tree of the genus Citrus.
+
+"""),
+    ("abbreviation", u"""\
+The HTML specification is maintained by the W3C.
+
+*[HTML]: Hyper Text Markup Language
+*[W3C]: World Wide Web Consortium
+
+"""),
+))
+
+
+def get_markdown(kind, size):
+    """
+    Return the Markdown of the card of `kind` and `size`.
+    """
+    return BLOCKS[kind] * SIZES[size]
+
+
+def get_cards():
+    """
+    Return an ordered dictionary with the Markdown of every card, keyed on
+    `"<kind>/<size>"`.
+    """
+    return collections.OrderedDict(
+        ("{}/{}".format(kind, size), get_markdown(kind, size))
+        for kind in BLOCKS for size in SIZES)
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014-2017 Stefan van den Akker <neftas@protonmail.com>
+#
+# This file is part of Power Format Pack.
+#
+# Power Format Pack is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Power Format Pack is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Power Format Pack. If not, see http://www.gnu.org/licenses/.
+
+"""
+Run benchmarks, report their operations per second and peak memory, and
+compare the results with a saved baseline.
+"""
+
+import argparse
+import codecs
+import collections
+import json
+import multiprocessing
+import sys
+import timeit
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+VERSION = 1
+
+
+def get_peak_memory():
+    """
+    Return the peak resident memory of this process in kilobytes, or `None`
+    when it cannot be determined.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def measure(fn, arg, min_time):
+    """
+    Call `fn(arg)` until at least `min_time` seconds have passed and return
+    the number of calls per second.
+    """
+    calls = 0
+    start = timeit.default_timer()
+    elapsed = 0.0
+    while calls == 0 or elapsed < min_time:
+        fn(arg)
+        calls += 1
+        elapsed = timeit.default_timer() - start
+    return calls / elapsed
+
+
+def _run_in_child(connection, fn, arg, min_time):
+    try:
+        fn(arg)  # warm up caches and lazy imports
+        result = {"ops_per_sec": measure(fn, arg, min_time),
+                  "peak_kb": get_peak_memory()}
+    except Exception as e:
+        result = {"error": repr(e)}
+    connection.send(result)
+    connection.close()
+
+
+def run_isolated(fn, arg, min_time):
+    """
+    Benchmark `fn(arg)` in a child process, so that the peak memory belongs
+    to this benchmark only. Fall back to this process when the platform
+    cannot fork.
+    """
+    if sys.platform.startswith("win"):
+        fn(arg)
+        return {"ops_per_sec": measure(fn, arg, min_time), "peak_kb": get_peak_memory()}
+    parent, child = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_run_in_child, args=(child, fn, arg, min_time))
+    process.start()
+    result = parent.recv()
+    process.join()
+    return result
+
+
+def run(benchmarks, min_time=0.2, pattern=None, out=sys.stdout):
+    """
+    Run `benchmarks`, an iterable of tuples of name, function and argument,
+    and return an ordered dictionary of the results keyed on name. Only the
+    benchmarks whose names contain `pattern` are run.
+    """
+    results = collections.OrderedDict()
+    out.write("{:<52} {:>14} {:>12}\n".format("benchmark", "ops/sec", "peak KB"))
+    for name, fn, arg in benchmarks:
+        if pattern and pattern not in name:
+            continue
+        result = run_isolated(fn, arg, min_time)
+        results[name] = result
+        if "error" in result:
+            out.write("{:<52} {}\n".format(name, result["error"]))
+        else:
+            out.write("{:<52} {:>14.1f} {:>12}\n".format(
+                name, result["ops_per_sec"], result["peak_kb"] or "-"))
+        out.flush()
+    return results
+
+
+def compare(results, baseline, tolerance=0.25, memory_tolerance=0.5):
+    """
+    Return a list of messages for the benchmarks in `results` that are more
+    than `tolerance` slower, or use more than `memory_tolerance` more peak
+    memory, than in `baseline`. Failed benchmarks always count.
+
+    >>> compare({"a": {"ops_per_sec": 50.0, "peak_kb": 100}}, {"a": {"ops_per_sec": 100.0, "peak_kb": 100}})
+    ['a: 50.0 ops/sec is 50% slower than the baseline of 100.0 ops/sec']
+    """
+    regressions = list()
+    for name, result in results.iteritems():
+        if "error" in result:
+            regressions.append("{}: failed with {}".format(name, result["error"]))
+            continue
+        old = baseline.get(name)
+        if not old or "error" in old:
+            continue
+        if result["ops_per_sec"] < old["ops_per_sec"] * (1 - tolerance):
+            regressions.append("{}: {:.1f} ops/sec is {:.0%} slower than the baseline of {:.1f} ops/sec".format(
+                name, result["ops_per_sec"], 1 - result["ops_per_sec"] / old["ops_per_sec"],
+                old["ops_per_sec"]))
+        if (result.get("peak_kb") and old.get("peak_kb") and
+                result["peak_kb"] > old["peak_kb"] * (1 + memory_tolerance)):
+            regressions.append("{}: peak memory of {} KB is more than the baseline of {} KB".format(
+                name, result["peak_kb"], old["peak_kb"]))
+    return regressions
+
+
+def load_baseline(path):
+    with codecs.open(path, encoding="utf8") as f:
+        data = json.load(f)
+    if data.get("version") != VERSION:
+        raise ValueError("Baseline {!r} has version {!r}, expected {!r}".format(
+            path, data.get("version"), VERSION))
+    return data["results"]
+
+
+def save_baseline(path, results):
+    with codecs.open(path, "w", encoding="utf8") as f:
+        json.dump({"version": VERSION, "results": results}, f, indent=2, sort_keys=True)
+
+
+def main(benchmarks, description):
+    """
+    Command-line entry point for a module with `benchmarks`. Exit with
+    status 1 when any benchmark regressed compared to `--baseline`.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("-k", "--pattern", help="only run benchmarks whose name contains PATTERN")
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="minimum number of seconds per benchmark")
+    parser.add_argument("--baseline", help="compare the results with this JSON file")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed fraction of slowdown compared to the baseline")
+    parser.add_argument("--memory-tolerance", type=float, default=0.5,
+                        help="allowed fraction of extra peak memory compared to the baseline")
+    args = parser.parse_args()
+
+    results = run(benchmarks, args.min_time, args.pattern)
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+    if args.baseline:
+        regressions = compare(results, load_baseline(args.baseline),
+                              args.tolerance, args.memory_tolerance)
+        if regressions:
+            sys.stderr.write("\n{} REGRESSION(S) compared to {}:\n".format(len(regressions), args.baseline))
+            for message in regressions:
+                sys.stderr.write("  " + message + "\n")
+            sys.exit(1)
+        print "\nNo regressions compared to {}.".format(args.baseline)
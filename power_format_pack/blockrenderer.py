@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014-2017 Stefan van den Akker <neftas@protonmail.com>
+#
+# This file is part of Power Format Pack.
+#
+# Power Format Pack is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Power Format Pack is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Power Format Pack. If not, see http://www.gnu.org/licenses/.
+
+import collections
+import hashlib
+import threading
+
+from power_format_pack.lazyimport import lazy_module
+
+codehilite  = lazy_module("power_format_pack.markdown.extensions.codehilite")
+util        = lazy_module("power_format_pack.markdown.util")
+
+
+class BlockRenderer(object):
+    """
+    Convert Markdown one top-level block at a time and remember the HTML of
+    every block, so that editing one paragraph of a long field only renders
+    that paragraph again. The whole text is still preprocessed and parsed:
+    that is where the references, abbreviations and footnotes of the text
+    are collected, and where lists, quotes and code that span blank lines
+    end up in one block. A block is rendered again when it changed, or when
+    a definition that it may use changed. Blocks with code that is shown
+    without highlighting for this session only are not remembered.
+    """
+
+    # tree processors that need the whole document; they run before it is
+    # split into blocks, so they have to come before all others
+    DOCUMENT_TREEPROCESSORS = ("footnote",)
+
+    def __init__(self, max_entries=2048):
+        self.max_entries    = max_entries
+        self.hits           = 0
+        self.misses         = 0
+        self._lock          = threading.Lock()
+        self._prefs_key     = None
+        self._blocks        = collections.OrderedDict()
+
+    def convert(self, md, prefs_key, source):
+        """
+        Return the HTML that the `markdown.Markdown` instance `md`, which was
+        built for the preferences in `prefs_key`, makes of `source`; the same
+        as `md.convert(source)`.
+        """
+        treeprocessors = self.get_treeprocessors(md)
+        if not source.strip() or treeprocessors is None or not self.max_entries:
+            return md.convert(source)
+        document_treeprocessors, block_treeprocessors = treeprocessors
+
+        lines = source.split("\n")
+        for preprocessor in md.preprocessors.values():
+            lines = preprocessor.run(lines)
+        root = md.parser.parseDocument(lines).getroot()
+        for treeprocessor in document_treeprocessors:
+            new_root = treeprocessor.run(root)
+            if new_root is not None:
+                root = new_root
+
+        state = self.get_state(md)
+        html = list()
+        for block in list(root):
+            key = self.get_key(md, prefs_key, block, state)
+            block_html = self._get(prefs_key, key)
+            if block_html is None:
+                degraded = codehilite.get_degraded(md)
+                block_html = self.render(md, block, block_treeprocessors)
+                if codehilite.get_degraded(md) == degraded:
+                    self._put(key, block_html)
+            html.append(block_html)
+        return u"".join(html).strip()
+
+    def get_treeprocessors(self, md):
+        """
+        Return the tree processors of `md` that run on the whole document and
+        those that run on every block, or `None` when `md` cannot convert
+        one block at a time.
+        """
+        if not md.stripTopLevelTags:
+            return None
+        keys = md.treeprocessors.keys()
+        count = 0
+        while count < len(keys) and keys[count] in self.DOCUMENT_TREEPROCESSORS:
+            count += 1
+        if any(key in self.DOCUMENT_TREEPROCESSORS for key in keys[count:]):
+            return None
+        treeprocessors = md.treeprocessors.values()
+        return treeprocessors[:count], treeprocessors[count:]
+
+    @staticmethod
+    def get_state(md):
+        """
+        Return the definitions of the current document that the inline
+        patterns of `md` use: the references, the abbreviations and the
+        footnotes.
+        """
+        footnotes = getattr(md.treeprocessors.get("footnote"), "footnotes", None)
+        return {
+            "references": sorted(md.references.items()),
+            "abbreviations": [(key[len("abbr-"):], getattr(pattern, "title", None))
+                              for key, pattern in md.inlinePatterns.items() if key.startswith("abbr-")],
+            "patterns": [key for key in md.inlinePatterns.keys() if not key.startswith("abbr-")],
+            "footnotes": list(footnotes.footnotes.keys()) if footnotes is not None else None
+        }
+
+    @staticmethod
+    def get_key(md, prefs_key, block, state):
+        """
+        Return a hexadecimal digest of the parsed `block`, the preferences in
+        `prefs_key` and the part of the document `state` that the block may
+        use.
+        """
+        parts = list()
+        text = list()
+        _add_element(md, block, parts, text)
+        text = u"".join(text)
+        parts.append(state["patterns"])
+        if u"[" in text:
+            # links, images and footnotes
+            parts.append(state["references"])
+            parts.append(state["footnotes"])
+        parts.append([abbreviation for abbreviation in state["abbreviations"] if abbreviation[0] in text])
+        digest = hashlib.sha1(repr(tuple(prefs_key)))
+        digest.update(repr(parts))
+        return digest.hexdigest()
+
+    @staticmethod
+    def render(md, block, treeprocessors):
+        """
+        Return the HTML of the top-level `block` of a document that `md`
+        parsed, after the `treeprocessors` and the postprocessors of `md`.
+        """
+        root = util.etree.Element(md.doc_tag)
+        root.append(block)
+        for treeprocessor in treeprocessors:
+            new_root = treeprocessor.run(root)
+            if new_root is not None:
+                root = new_root
+        # an inline pattern in the tail of the block adds elements after it
+        html = u"".join(md.serializer(element) for element in root)
+        for postprocessor in md.postprocessors.values():
+            html = postprocessor.run(html)
+        return html
+
+    def stats(self):
+        """
+        Return a dictionary with the hit and miss counters and the number of
+        cached blocks.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._blocks)}
+
+    def clear(self):
+        """
+        Remove all blocks and reset the counters.
+        """
+        with self._lock:
+            self._blocks.clear()
+            self.hits = self.misses = 0
+
+    def _get(self, prefs_key, key):
+        with self._lock:
+            # the HTML depends on the preferences, so blocks that were
+            # rendered with other preferences are of no use anymore
+            if self._prefs_key != prefs_key:
+                self._prefs_key = prefs_key
+                self._blocks.clear()
+            html = self._blocks.pop(key, None)
+            if html is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._blocks[key] = html
+            return html
+
+    def _put(self, key, html):
+        with self._lock:
+            self._blocks[key] = html
+            while len(self._blocks) > self.max_entries:
+                self._blocks.popitem(last=False)
+
+
+def _add_element(md, element, parts, text):
+    """
+    Add the tag, attributes and text of `element` and its children to the
+    list `parts`, and the text that inline patterns may change to `text`.
+    """
+    parts.append(element.tag)
+    parts.append(sorted(element.items()))
+    parts.append(_get_text(md, element.text, text))
+    for child in element:
+        _add_element(md, child, parts, text)
+    parts.append(None)
+    parts.append(_get_text(md, element.tail, text))
+
+
+def _get_text(md, value, text):
+    if not value:
+        return value
+    if isinstance(value, util.AtomicString):
+        return u"atomic", _get_stashed(md, value)
+    text.append(value)
+    return _get_stashed(md, value)
+
+
+def _get_stashed(md, value):
+    # the numbers of the raw HTML placeholders depend on the blocks before,
+    # so the stashed HTML itself goes into the key
+    if util.STX not in value:
+        return value
+    pieces = util.HTML_PLACEHOLDER_RE.split(value)
+    for i in xrange(1, len(pieces), 2):
+        pieces[i] = md.htmlStash.rawHtmlBlocks[int(pieces[i])]
+    return tuple(pieces)
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014-2017 Stefan van den Akker <neftas@protonmail.com>
+#
+# This file is part of Power Format Pack.
+#
+# Power Format Pack is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Power Format Pack is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Power Format Pack. If not, see http://www.gnu.org/licenses/.
+
+import collections
+import itertools
+import multiprocessing
+import sys
+import traceback
+
+from power_format_pack import const, utility
+from power_format_pack.markdowner import Markdowner
+from power_format_pack.renderworker import RenderWorker
+
+
+class HeadlessMarkdowner(Markdowner):
+    """
+    A `Markdowner` that works on the HTML of a field without an editor, so
+    that many fields can be converted in one go. The quirks that `Markdowner`
+    fixes through the editor are fixed on the HTML itself.
+    """
+
+    def __init__(self, note_id, html, current_field, prefs):
+        assert isinstance(html, unicode), "Input `html` is not Unicode"
+        self.c              = None
+        self.p              = prefs
+        self.editor         = None
+        self.html           = html
+        self.backup_html    = html
+        self.current_field  = current_field
+        self.note_id_field  = str(note_id) + "-{:03}".format(current_field)
+        self._id            = None
+        self.isconverted    = None
+        self.md             = None
+        self._lastmodified  = None
+        self.fingerprint    = None
+        self.unchanged      = False
+        self.has_def_list   = False
+        self.has_data       = self.get_data_from_field()
+
+    def is_converted(self):
+        return self.has_data and self.isconverted == "True"
+
+    def prepare(self):
+        self.unchanged = self.is_converted() and self.is_unchanged()
+        if self.unchanged:
+            return
+        self.has_def_list = "<dl>" in self.html
+        if self.has_def_list:
+            self.html = utility.put_colons_in_html_def_list(self.html)
+
+
+def render_note(job):
+    """
+    Render the fields of one note. `job` is a tuple of the note id, the
+    preferences, the mode (`const.MARKDOWN_CONVERT` or
+    `const.MARKDOWN_REVERT`) and a list of tuples of field index and HTML.
+    Return a tuple of the note id and a list of tuples of field index, action
+    and new HTML. The action is `None` for fields that were skipped, and
+    `const.BULK_FAILED` for fields that could not be rendered.
+
+    This is a module-level function, so that it can be sent to the processes
+    of a `multiprocessing.Pool`.
+    """
+    note_id, prefs, mode, fields = job
+    results = list()
+    for field_no, html in fields:
+        try:
+            markdowner = HeadlessMarkdowner(note_id, html, field_no, prefs)
+            if markdowner.is_converted() != (mode == const.MARKDOWN_REVERT):
+                # nothing to convert, or nothing to revert
+                results.append((field_no, None, None))
+                continue
+            markdowner.prepare()
+            result = markdowner.render()
+        except Exception:
+            traceback.print_exc()  # TODO: should be logged
+            results.append((field_no, const.BULK_FAILED, None))
+            continue
+        if result is None:
+            results.append((field_no, None, None))
+        else:
+            results.append((field_no,) + tuple(result))
+    return note_id, results
+
+
+class BulkConverter(object):
+    """
+    Convert the Markdown in the fields of many notes to HTML, or revert
+    converted fields back to Markdown. The fields are rendered in a pool of
+    processes, `chunk_size` notes at a time, and written back to the
+    collection `batch_size` notes at a time. Nothing is committed, so that
+    a checkpoint made before `run` can undo the whole conversion.
+    """
+
+    def __init__(self, prefs, processes=None, batch_size=const.BULK_BATCH_SIZE,
+                 chunk_size=const.BULK_CHUNK_SIZE):
+        self.prefs      = dict(prefs)
+        self.processes  = processes
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+
+    def get_processes(self):
+        """
+        Return the number of processes to render with. Windows cannot fork
+        the running Anki, and on macOS Qt and CoreFoundation do not survive
+        a fork without exec, so the rendering stays in this process there.
+        It also stays here while the editor renders on a worker thread,
+        which may hold the locks of the converter pool and the caches that
+        the forked processes would inherit.
+        """
+        if self.processes is not None:
+            return max(1, self.processes)
+        if sys.platform.startswith("win") or sys.platform == "darwin":
+            return 1
+        if RenderWorker.is_rendering():
+            return 1
+        try:
+            return multiprocessing.cpu_count()
+        except NotImplementedError:
+            return 1
+
+    def run(self, col, note_ids, field_names, mode, progress=None):
+        """
+        Render the fields called `field_names` (all fields when `None`) of the
+        notes with `note_ids` in collection `col`. `progress` is called with
+        the number of notes done and the total number of notes; when it
+        returns `False`, the conversion stops after writing the notes that
+        were already rendered. The changes are left uncommitted in `col`,
+        like those of Anki's own find and replace. Return a `collections.Counter` with the number
+        of fields per action, and `cancelled` set to 1 when cancelled.
+        """
+        counts = collections.Counter()
+        total = len(note_ids)
+        done = 0
+        processes = self.get_processes()
+        pool = multiprocessing.Pool(processes) if processes > 1 else None
+        try:
+            for start in xrange(0, total, self.batch_size):
+                notes = dict()
+                jobs = list()
+                for note_id in note_ids[start:start + self.batch_size]:
+                    note = col.getNote(note_id)
+                    notes[note_id] = note
+                    jobs.append((note_id, self.prefs, mode,
+                                 self.get_fields(note, field_names)))
+
+                if pool:
+                    results = pool.imap(render_note, jobs, self.chunk_size)
+                else:
+                    results = itertools.imap(render_note, jobs)
+
+                cancelled = False
+                for note_id, fields in results:
+                    self.write_note(notes[note_id], fields, counts)
+                    done += 1
+                    if progress and progress(done, total) is False:
+                        cancelled = True
+                        break
+
+                if cancelled:
+                    counts["cancelled"] = 1
+                    break
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+        return counts
+
+    @staticmethod
+    def get_fields(note, field_names):
+        """
+        Return a list of tuples of field index and HTML for the fields of
+        `note` that are called `field_names`, or for all fields when
+        `field_names` is `None`.
+        """
+        if field_names is None:
+            return list(enumerate(note.fields))
+        return [(i, html) for i, (name, html) in enumerate(zip(note.keys(), note.fields))
+                if name in field_names]
+
+    @staticmethod
+    def write_note(note, fields, counts):
+        changed = False
+        for field_no, action, new_html in fields:
+            counts[action or const.BULK_SKIPPED] += 1
+            if new_html is not None and action in (const.MARKDOWN_CONVERT, const.MARKDOWN_REVERT):
+                note.fields[field_no] = new_html
+                changed = True
+        if changed:
+            note.flush()
@@ -83,6 +83,7 @@ MARKDOWN_SYNTAX_STYLE         = "markdown_syntax_style"
 MARKDOWN_LINE_NUMS            = "markdown_line_nums"
 MARKDOWN_CODE_DIRECTION       = "markdown_code_direction"
 MARKDOWN_ALWAYS_REVERT        = "markdown_always_revert"
+MARKDOWN_PROFILING            = "markdown_profiling"
 MARKDOWN_OVERRIDE_EDITING     = "markdown_override_editing"
 MARKDOWN_CLASSFUL_PYGMENTS    = "markdown_classful_pygments"
 BUTTON_PLACEMENT              = "button_placement"
@@ -99,16 +100,60 @@ FUNCTION_KEYS                 = ("f1", "f2", "f3", "f4", "f5", "f6",
 
 # markers to be wrapped around Markdown data in fields
 START_HTML_MARKER             = "<!----SBAdata:"
+START_HTML_MARKER_V2          = "<!----SBAdata2:"
 END_HTML_MARKER               = "---->"
+# regex (in JavaScript syntax) that matches fields with Markdown data
+HTML_MARKER_JS_REGEX          = r"/<!----SBAdata2?:[a-zA-Z0-9+\/]*=*---->/"
 
 # change field to this background color
 MARKDOWN_BG_COLOR             = "#FFEDD3"
+# opacity of a field while it is rendered in the background
+MARKDOWN_RENDERING_OPACITY    = "0.5"
+
+# what happens to a field when Markdown is toggled
+MARKDOWN_CONVERT              = "convert"
+MARKDOWN_REVERT               = "revert"
+MARKDOWN_CONFLICT             = "conflict"
+
+# converting many notes at once from the browser
+BULK_FAILED                   = "failed"
+BULK_SKIPPED                  = "skipped"
+# number of notes read from and written to the collection at a time
+BULK_BATCH_SIZE               = 500
+# number of notes sent to a worker process at a time
+BULK_CHUNK_SIZE               = 20
+
+# number of Markdown timing records kept in the profile log
+PROFILE_MAX_RECORDS           = 1000
 
 # max number of bytes read from preference file
 MAX_BYTES_PREFS               = 32768
 
 # check if image present in Markdown
 IS_LINK_OR_IMG_REGEX = re.compile(r"!\[[^\]]*\](\(.*?(?<!\\)\))")
+# the escapes that are applied, in order, to the location of images, so that
+# whitespace and parentheses in file names do not end the Markdown syntax
+LINK_IMG_ESCAPE_RULES = (
+    (re.compile(ur"\\\("), u"&#40;"),
+    (re.compile(ur"\\\)"), u"&#41;"),
+    (re.compile(ur"\s+"), u"&#32;")
+)
+# fixes for the Markdown produced by html2text
+ESCAPED_DOT_REGEX = re.compile(ur"(\d+)\\(\.\s)")
+ABBREVIATION_DEFINITION_WHITESPACE_REGEX = re.compile(r"( |\&nbsp;)+(\*\[[^]]*\]:)")
+DD_ELEMENT_WHITESPACE_REGEX = re.compile(r"(\n) {4}(: .*?\n)")
+# to normalize the HTML of a field before taking its fingerprint
+FINGERPRINT_ALIGNMENT_REGEX = re.compile(
+    r"""\s+align=["']?[a-z]*["']?|text-align:\s*[a-z]+;?""", re.IGNORECASE)
+FINGERPRINT_EMPTY_STYLE_REGEX = re.compile(r"""\s+style=["']\s*["']""")
+FINGERPRINT_SELF_CLOSING_REGEX = re.compile(r"\s*/>")
+WHITESPACE_REGEX = re.compile(r"\s+", re.UNICODE)
+CONSECUTIVE_SPACES_REGEX = re.compile(r" +")
+# character and entity references as BeautifulSoup reads them, with an
+# optional semicolon, and bare ampersands and brackets it escapes on output
+SGML_REFERENCE_REGEX = re.compile(r"&(#[0-9]+|[a-zA-Z][-.a-zA-Z0-9]*);?")
+BARE_AMPERSAND_OR_BRACKET_REGEX = re.compile(
+    r"[<>]|&(?!#\d+;|#x[0-9a-fA-F]+;|\w+;)")
 # to unescape image data
 HTML_PARSER                   = HTMLParser.HTMLParser()
 
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014-2017 Stefan van den Akker <neftas@protonmail.com>
+#
+# This file is part of Power Format Pack.
+#
+# Power Format Pack is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Power Format Pack is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Power Format Pack. If not, see http://www.gnu.org/licenses/.
+
+import threading
+
+from power_format_pack import const
+from power_format_pack.lazyimport import lazy_module
+
+# the Markdown engine and Pygments are only imported for the first conversion
+markdown        = lazy_module("power_format_pack.markdown")
+abbr            = lazy_module("power_format_pack.markdown.extensions.abbr")
+attr_list       = lazy_module("power_format_pack.markdown.extensions.attr_list")
+codehilite      = lazy_module("power_format_pack.markdown.extensions.codehilite")
+def_list        = lazy_module("power_format_pack.markdown.extensions.def_list")
+fenced_code     = lazy_module("power_format_pack.markdown.extensions.fenced_code")
+footnotes       = lazy_module("power_format_pack.markdown.extensions.footnotes")
+nl2br           = lazy_module("power_format_pack.markdown.extensions.nl2br")
+sane_lists      = lazy_module("power_format_pack.markdown.extensions.sane_lists")
+smart_strong    = lazy_module("power_format_pack.markdown.extensions.smart_strong")
+tables          = lazy_module("power_format_pack.markdown.extensions.tables")
+
+
+class ConverterPool(object):
+    """
+    Hand out `markdown.Markdown` instances that are already set up with the
+    extensions we use, so that the cost of building them is only paid once.
+    The instances depend on the rendering preferences; when those change,
+    the pool is emptied and new instances are built on demand.
+    """
+
+    def __init__(self, token_cache_path=None, watchdog_path=None):
+        self._lock              = threading.Lock()
+        self._key               = None
+        self._idle              = list()
+        self.token_cache_path   = token_cache_path
+        self.watchdog_path      = watchdog_path
+
+    def set_token_cache_path(self, path):
+        """
+        Keep the compiled regular expressions of the Pygments lexers in the
+        folder `path`, so that later sessions do not have to compile them.
+        """
+        self.token_cache_path = path
+
+    def set_watchdog_path(self, path):
+        """
+        Record the code blocks that took too long to highlight in the file
+        `path`, so that later sessions show them without highlighting.
+        """
+        self.watchdog_path = path
+
+    @staticmethod
+    def save_watchdog():
+        """
+        Write the state of the highlighting watchdog to its file, if any
+        code was highlighted, so that the code blocks that are no longer
+        being highlighted are not suspected of a hang in the next session.
+        """
+        if codehilite.is_loaded():
+            codehilite.HIGHLIGHT_WATCHDOG.save()
+
+    @staticmethod
+    def get_key(prefs):
+        """
+        Return a tuple with the preferences that influence the output of
+        the Markdown converter.
+
+        >>> ConverterPool.get_key({"markdown_classful_pygments": True, "markdown_syntax_style": "tango", "markdown_line_nums": False})
+        (True, 'tango', False)
+        """
+        return (bool(prefs.get(const.MARKDOWN_CLASSFUL_PYGMENTS)),
+                prefs.get(const.MARKDOWN_SYNTAX_STYLE),
+                bool(prefs.get(const.MARKDOWN_LINE_NUMS)))
+
+    @staticmethod
+    def create_converter(key):
+        """
+        Return a new `markdown.Markdown` instance for the preferences in `key`.
+        """
+        classful, style, linenums = key
+        return markdown.Markdown(output_format="xhtml1",
+            extensions=[
+                smart_strong.SmartEmphasisExtension(),
+                fenced_code.FencedCodeExtension(),
+                footnotes.FootnoteExtension(),
+                attr_list.AttrListExtension(),
+                def_list.DefListExtension(),
+                tables.TableExtension(),
+                abbr.AbbrExtension(),
+                nl2br.Nl2BrExtension(),
+                codehilite.CodeHiliteExtension(
+                    noclasses=not classful,
+                    pygments_style=style,
+                    linenums=linenums,
+                    budgeted=True),
+                sane_lists.SaneListExtension()
+            ], lazy_ol=False)
+
+    def acquire(self, prefs):
+        """
+        Return a converter that matches the preferences in `prefs`. Throw away
+        all idle converters when the preferences have changed since the last
+        call.
+        """
+        key = self.get_key(prefs)
+        with self._lock:
+            if key != self._key:
+                self._key = key
+                self._idle = list()
+            elif self._idle:
+                return self._idle.pop()
+        if self.token_cache_path is not None and codehilite.pygments:
+            codehilite.TOKEN_CACHE.set_directory(self.token_cache_path)
+        if self.watchdog_path is not None:
+            codehilite.HIGHLIGHT_WATCHDOG.set_path(self.watchdog_path)
+        return self.create_converter(key)
+
+    def release(self, prefs, converter):
+        """
+        Reset `converter` and give it back to the pool. Converters that were
+        built for outdated preferences are discarded.
+        """
+        converter.reset()
+        with self._lock:
+            if self.get_key(prefs) == self._key:
+                self._idle.append(converter)
+
+    def convert(self, prefs, text, block_renderer=None):
+        """
+        Convert the Markdown in `text` to HTML with a pooled converter, one
+        block at a time when a `BlockRenderer` is given.
+        """
+        return self.render(prefs, text, block_renderer)[0]
+
+    def render(self, prefs, text, block_renderer=None):
+        """
+        Like `convert`, but return a tuple of the HTML and whether it should
+        not be cached, because a code block in it ran out of time and is
+        only shown without highlighting for this session.
+        """
+        converter = self.acquire(prefs)
+        try:
+            if block_renderer is not None:
+                html = block_renderer.convert(converter, self.get_key(prefs), text)
+            else:
+                html = converter.convert(text)
+            return html, codehilite.get_degraded(converter) > 0
+        finally:
+            self.release(prefs, converter)
+
+    def clear(self):
+        """
+        Throw away all idle converters.
+        """
+        with self._lock:
+            self._key = None
+            self._idle = list()
@@ -21,28 +21,35 @@
 # import warnings
 # warnings.simplefilter("ignore", UserWarning)
 
-from PyQt4 import QtGui
+from PyQt4 import QtGui, QtCore
 
 import const
 import preferences
 import utility
-from abbreviation import Abbreviation
 from anki.hooks import wrap, addHook
 from anki.utils import isMac
 from anki_modules.aqt import editor as myeditor
 from aqt import editor as anki_editor, mw
-from blockquote import Blockquote
-from deflist import DefList
-from heading import Heading
+from aqt.utils import tooltip
 from hilite_color import HiliteColor
-from hyperlink import Hyperlink
 from markdowner import Markdowner
 from menu import Options
-from orderedlist import OrderedList
 from power_format_pack.button import Button
-from power_format_pack.unorderedlist import UnorderedList
+from power_format_pack.lazyimport import lazy_module
+from prefhelper import PrefHelper
 from preferences import Preferences
-from table import Table
+from renderworker import RenderWorker
+
+# the dialogs and the bulk converter are imported when they are first used
+abbreviation    = lazy_module("power_format_pack.abbreviation")
+blockquote      = lazy_module("power_format_pack.blockquote")
+bulkconvert     = lazy_module("power_format_pack.bulkconvert")
+deflist         = lazy_module("power_format_pack.deflist")
+heading         = lazy_module("power_format_pack.heading")
+hyperlink       = lazy_module("power_format_pack.hyperlink")
+orderedlist     = lazy_module("power_format_pack.orderedlist")
+table           = lazy_module("power_format_pack.table")
+unorderedlist   = lazy_module("power_format_pack.unorderedlist")
 
 # Preferences
 ##################################################
@@ -251,12 +258,12 @@ def unlink(self):
 
 def toggle_unordered_list(editor):
     fixed_type = preferences.PREFS.get("fixed_ul_type")
-    UnorderedList(editor, fixed_type if fixed_type else "")
+    unorderedlist.UnorderedList(editor, fixed_type if fixed_type else "")
 
 
 def toggle_ordered_list(editor):
     fixed_type = preferences.PREFS.get("fixed_ol_type")
-    OrderedList(editor, preferences, fixed_type if fixed_type else "")
+    orderedlist.OrderedList(editor, preferences, fixed_type if fixed_type else "")
 
 
 def toggle_strikethrough(editor):
@@ -281,17 +288,17 @@ def toggle_outdent(editor):
 
 def toggle_definition_list(editor):
     selection = editor.web.selectedText()
-    DefList(editor, editor.parentWindow, selection if selection else None)
+    deflist.DefList(editor, editor.parentWindow, selection if selection else None)
 
 
 def toggle_table(editor):
     selection = editor.web.selectedText()
-    Table(editor, editor.parentWindow, selection if selection else None, preferences)
+    table.Table(editor, editor.parentWindow, selection if selection else None, preferences)
 
 
 def toggle_blockquote(editor):
     selected = editor.web.selectedHtml()
-    Blockquote(editor, selected)
+    blockquote.Blockquote(editor, selected)
 
 
 def justify_center(editor):
@@ -312,17 +319,21 @@ def justify_full(editor):
 
 def toggle_heading(editor):
     selected = editor.web.selectedText()
-    Heading(editor, editor.parentWindow, selected)
+    heading.Heading(editor, editor.parentWindow, selected)
 
 
 def toggle_abbreviation(editor):
     selected = editor.web.selectedText()
-    Abbreviation(editor, editor.parentWindow, selected)
+    abbreviation.Abbreviation(editor, editor.parentWindow, selected)
 
 
 def toggle_hyperlink(editor):
     selected = editor.web.selectedText()
-    Hyperlink(editor, editor.parentWindow, selected)
+    hyperlink.Hyperlink(editor, editor.parentWindow, selected)
+
+
+# renders Markdown on a worker thread; see `get_render_worker`
+render_worker = None
 
 
 def toggle_markdown(editor):
@@ -332,9 +343,23 @@ def toggle_markdown(editor):
     if not html_field:
         html_field = u""
     markdowner = Markdowner(editor, editor.parentWindow, editor.note, html_field, current_field, preferences)
-    markdowner.start()
-    editor.web.setFocus()
-    editor.web.eval("focusField(%d);" % editor.currentField)
+    get_render_worker().submit(markdowner, focus_markdown_field)
+
+
+def focus_markdown_field(markdowner):
+    markdowner.editor.web.setFocus()
+    markdowner.editor.web.eval("focusField(%d);" % markdowner.current_field)
+
+
+def get_render_worker():
+    """
+    Return the worker that renders Markdown in the background, creating it
+    the first time it is needed.
+    """
+    global render_worker
+    if render_worker is None:
+        render_worker = RenderWorker(mw)
+    return render_worker
 
 
 def init_hook(editor, mw, widget, parentWindow, addMode=False):
@@ -347,33 +372,109 @@ def on_focus_gained(editor, note, current_field_no):
     the field if it does, or do nothing if not.
     """
 
-    if not note.fields[current_field_no]:
+    html_field = note.fields[current_field_no]
+    if not html_field:
         return
 
     markdown_warning_text = preferences.CONFIG.get(const.CONFIG_TOOLTIPS, "md_warning_editing_tooltip")
 
     Markdowner.manage_style(editor, current_field_no)
+
+    # the data may be compressed, which is something JavaScript cannot
+    # handle, so we check the data here
+    md_dict = utility.decompress_and_json_load(utility.get_md_data_from_string(html_field))
+    if not md_dict or md_dict == "corrupted" or not md_dict.get("isconverted"):
+        return
+
     editor.web.eval("""
         var field = $('#f%s');
-        if (field.html().indexOf('SBAdata:') > -1) {
-            var mdData = /<!----SBAdata:([a-zA-Z0-9+/]+=*)---->/.exec(field.html());
-            var json = JSON.parse(atob(mdData[1]));
-            if (json.isconverted) {
-                if (!field.hasClass('mdstyle')) {
-                    field.addClass('mdstyle');
-                }
-                if (!$('#f%s + [class^=mdwarning]').length) {
-                    field.after($('<div/>', {class: 'mdwarning', text: '%s'}));
-                }
-                field.attr('title', '%s');
+        if (%s.test(field.html())) {
+            if (!field.hasClass('mdstyle')) {
+                field.addClass('mdstyle');
+            }
+            if (!$('#f%s + [class^=mdwarning]').length) {
+                field.after($('<div/>', {class: 'mdwarning', text: '%s'}));
             }
+            field.attr('title', '%s');
         }
-    """ % (current_field_no, current_field_no, markdown_warning_text, markdown_warning_text))
+    """ % (current_field_no, const.HTML_MARKER_JS_REGEX, current_field_no,
+           markdown_warning_text, markdown_warning_text))
+
+
+
+# Browser
+##################################################
+
+def setup_browser_menu(browser):
+    c = preferences.CONFIG
+    menu = browser.form.menuEdit
+    menu.addSeparator()
+    for name, mode in (("bulk_convert_action", const.MARKDOWN_CONVERT),
+                       ("bulk_revert_action", const.MARKDOWN_REVERT)):
+        action = menu.addAction(c.get(const.CONFIG_MENU_NAMES, name))
+        action.triggered.connect(lambda _=None, mode=mode: bulk_convert(browser, mode))
+
+
+def bulk_convert(browser, mode):
+    """
+    Convert or revert the Markdown in a field of the notes selected in
+    `browser`, showing the progress in a dialog that can be cancelled.
+    """
+    c = preferences.CONFIG
+    note_ids = browser.selectedNotes()
+    if not note_ids:
+        return
+
+    all_fields = c.get(const.CONFIG_LABELS, "bulk_all_fields_label")
+    field_names = [all_fields] + sorted(set(
+        name for model in browser.col.models.all() for name in browser.col.models.fieldNames(model)))
+    field_name, ok = QtGui.QInputDialog.getItem(
+        browser, c.get(const.CONFIG_WINDOW_TITLES, "bulk_" + mode),
+        c.get(const.CONFIG_LABELS, "bulk_field_label"), field_names, 0, False)
+    if not ok:
+        return
+    field_name = unicode(field_name)
+
+    progress = QtGui.QProgressDialog(
+        c.get(const.CONFIG_WINDOW_TITLES, "bulk_" + mode), "&Cancel", 0, len(note_ids), browser)
+    progress.setWindowModality(QtCore.Qt.WindowModal)
+    progress.setMinimumDuration(0)
+
+    def update_progress(done, total):
+        progress.setValue(done)
+        QtGui.QApplication.processEvents()
+        return not progress.wasCanceled()
+
+    # the converter does not commit, so undoing the checkpoint rolls back
+    # every note it wrote
+    browser.mw.checkpoint(c.get(const.CONFIG_WINDOW_TITLES, "bulk_" + mode))
+    browser.model.beginReset()
+    try:
+        converter = bulkconvert.BulkConverter(preferences.PREFS)
+        counts = converter.run(browser.col, note_ids,
+                               None if field_name == all_fields else [field_name],
+                               mode, update_progress)
+    finally:
+        progress.close()
+        browser.model.endReset()
+        browser.mw.requireReset()
+
+    tooltip(c.get(const.CONFIG_TOOLTIPS, "bulk_done_tooltip") % dict(
+        converted=counts[const.MARKDOWN_CONVERT], reverted=counts[const.MARKDOWN_REVERT],
+        conflicts=counts[const.MARKDOWN_CONFLICT], failed=counts[const.BULK_FAILED],
+        skipped=counts[const.BULK_SKIPPED]), parent=browser)
 
 
 if preferences.PREFS.get(const.MARKDOWN):
     anki_editor.Editor.on_focus_gained = on_focus_gained
     anki_editor.Editor.__init__ = wrap(anki_editor.Editor.__init__, init_hook)
+    Markdowner.RENDER_CACHE.set_path(PrefHelper.get_render_cache_path())
+    addHook("unloadProfile", Markdowner.RENDER_CACHE.save)
+    Markdowner.PROFILER.set_path(PrefHelper.get_profile_log_path())
+    Markdowner.CONVERTER_POOL.set_token_cache_path(PrefHelper.get_token_cache_path())
+    Markdowner.CONVERTER_POOL.set_watchdog_path(PrefHelper.get_highlight_watchdog_path())
+    addHook("unloadProfile", Markdowner.CONVERTER_POOL.save_watchdog)
+    addHook("browser.setupMenus", setup_browser_menu)
 
 
 anki_editor.Editor.toggle_markdown = toggle_markdown
@@ -18,11 +18,13 @@
 # with Power Format Pack. If not, see http://www.gnu.org/licenses/.
 
 import json
-import BeautifulSoup
 
 from PyQt4 import QtGui, QtCore
 import utility
 import const
+from power_format_pack.lazyimport import lazy_module
+
+BeautifulSoup = lazy_module("BeautifulSoup")
 
 
 class Heading(object):
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014-2017 Stefan van den Akker <neftas@protonmail.com>
+#
+# This file is part of Power Format Pack.
+#
+# Power Format Pack is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Power Format Pack is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Power Format Pack. If not, see http://www.gnu.org/licenses/.
+
+"""
+Postpone importing the heavy parts of the add-on (the Markdown engine,
+Pygments, BeautifulSoup, html2text and the dialogs) until they are first
+used, so that they do not slow down the start of Anki.
+"""
+
+import collections
+import threading
+import timeit
+
+from power_format_pack.python_modules import importlib
+
+# the number of seconds it took to import each lazy module, in the order
+# in which they were imported
+LOAD_TIMES = collections.OrderedDict()
+
+# all lazy modules that were created, keyed on module name
+MODULES = dict()
+
+_lock = threading.RLock()
+
+
+class LazyModule(object):
+    """
+    Stand in for the module `name` and import it the first time one of its
+    attributes is used.
+
+    >>> json = LazyModule("json")
+    >>> json.dumps([1])
+    '[1]'
+    """
+
+    def __init__(self, name):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_module", None)
+
+    def load(self):
+        """
+        Import the module, when this did not happen yet, and return it.
+        """
+        module = object.__getattribute__(self, "_module")
+        if module is not None:
+            return module
+        with _lock:
+            module = object.__getattribute__(self, "_module")
+            if module is None:
+                name = object.__getattribute__(self, "_name")
+                start = timeit.default_timer()
+                module = importlib.import_module(name)
+                LOAD_TIMES[name] = timeit.default_timer() - start
+                object.__setattr__(self, "_module", module)
+        return module
+
+    def is_loaded(self):
+        return object.__getattribute__(self, "_module") is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.load(), attr, value)
+
+    def __repr__(self):
+        return "<lazy module {!r}>".format(object.__getattribute__(self, "_name"))
+
+
+def lazy_module(name):
+    """
+    Return the `LazyModule` for `name`, sharing it between all callers.
+    """
+    with _lock:
+        module = MODULES.get(name)
+        if module is None:
+            module = MODULES[name] = LazyModule(name)
+        return module
+
+
+def load_all():
+    """
+    Import every lazy module that was not imported yet.
+    """
+    for name in sorted(MODULES):
+        MODULES[name].load()
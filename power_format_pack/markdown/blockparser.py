@@ -46,7 +46,7 @@ class BlockParser:
     """
 
     def __init__(self, markdown):
-        self.blockprocessors = odict.OrderedDict()
+        self.blockprocessors = odict.Registry()
         self.state = State()
         self.markdown = markdown
 
@@ -20,7 +20,7 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 from . import Extension
 from ..preprocessors import Preprocessor
-from ..inlinepatterns import Pattern
+from ..inlinepatterns import InlineProcessor
 from ..util import etree, AtomicString
 import re
 
@@ -33,8 +33,16 @@ class AbbrExtension(Extension):
 
     def extendMarkdown(self, md, md_globals):
         """ Insert AbbrPreprocessor before ReferencePreprocessor. """
+        self.md = md
+        md.registerExtension(self)
         md.preprocessors.add('abbr', AbbrPreprocessor(md), '<reference')
 
+    def reset(self):
+        """ Remove the abbreviations found in the previous document. """
+        for key in list(self.md.inlinePatterns.keys()):
+            if key.startswith('abbr-'):
+                del self.md.inlinePatterns[key]
+
 
 class AbbrPreprocessor(Preprocessor):
     """ Abbreviation Preprocessor - parse text for abbr references. """
@@ -42,7 +50,8 @@ class AbbrPreprocessor(Preprocessor):
     def run(self, lines):
         '''
         Find and remove all Abbreviation references from the text.
-        Each reference is set as a new AbbrPattern in the markdown instance.
+        Each reference is set as a new AbbrInlineProcessor in the markdown
+        instance.
 
         '''
         new_text = []
@@ -52,7 +61,7 @@ class AbbrPreprocessor(Preprocessor):
                 abbr = m.group('abbr').strip()
                 title = m.group('title').strip()
                 self.markdown.inlinePatterns['abbr-%s' % abbr] = \
-                    AbbrPattern(self._generate_pattern(abbr), title)
+                    AbbrInlineProcessor(self._generate_pattern(abbr), title)
             else:
                 new_text.append(line)
         return new_text
@@ -73,18 +82,19 @@ class AbbrPreprocessor(Preprocessor):
         return r'(?P<abbr>\b%s\b)' % (r''.join(chars))
 
 
-class AbbrPattern(Pattern):
+class AbbrInlineProcessor(InlineProcessor):
     """ Abbreviation inline pattern. """
 
     def __init__(self, pattern, title):
-        super(AbbrPattern, self).__init__(pattern)
+        super(AbbrInlineProcessor, self).__init__(pattern)
         self.title = title
 
-    def handleMatch(self, m):
+    def handleMatch(self, m, data):
         abbr = etree.Element('abbr')
         abbr.text = AtomicString(m.group('abbr'))
         abbr.set('title', self.title)
-        return abbr
+        return abbr, m.start(0), m.end(0)
+
 
 
 def makeExtension(*args, **kwargs):
@@ -18,7 +18,14 @@ License: [BSD](http://www.opensource.org/licenses/bsd-license.php)
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import codecs
+import hashlib
+import json
+import os
 import platform
+import threading
+import time
+from collections import OrderedDict
 
 from . import Extension
 from ..treeprocessors import Treeprocessor
@@ -51,9 +58,12 @@ try:
             print e  # TODO: log error
             raise ImportError
 
-    from pygments import highlight
+    from pygments import highlight, format as format_tokens
+    from pygments import incremental
     from pygments.lexers import get_lexer_by_name, guess_lexer
     from pygments.formatters import get_formatter_by_name
+    from pygments.util import ClassNotFound
+    from pygments.tokencache import TOKEN_CACHE
 
     pygments = True
 except ImportError as e:
@@ -61,6 +71,381 @@ except ImportError as e:
     pygments = False
 
 
+class HighlighterCache(object):
+    """
+    Keep the lexers and formatters that were created for code blocks, so that
+    a note with many code blocks in the same language only creates them once.
+    Lexers are keyed on the language, formatters on their options; formatters
+    that emphasize lines (`hl_lines`) are never cached. The formatters are
+    dropped when a different style is requested, because the style tables
+    they derived are no longer of use.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._lexers = OrderedDict()
+        self._formatters = OrderedDict()
+        self._style = None
+        self.hits = {"lexer": 0, "formatter": 0}
+        self.misses = {"lexer": 0, "formatter": 0}
+
+    def get_lexer(self, lang):
+        """
+        Return a lexer for `lang`, as `get_lexer_by_name` would. Raise
+        `ClassNotFound` when there is no lexer for `lang`.
+        """
+        with self._lock:
+            lexer = self._lookup(self._lexers, lang, "lexer")
+        if lexer is None:
+            try:
+                lexer = get_lexer_by_name(lang)
+            except ValueError:
+                # remember that there is no lexer, e.g. for the many code
+                # blocks without a language
+                lexer = _NO_LEXER
+            with self._lock:
+                self._store(self._lexers, lang, lexer)
+        if lexer is _NO_LEXER:
+            raise ClassNotFound('no lexer for alias %r found' % lang)
+        return lexer
+
+    def get_formatter(self, linenos, cssclass, style, noclasses, hl_lines):
+        """
+        Return an HTML formatter with the given options, as
+        `get_formatter_by_name` would.
+        """
+        if hl_lines:
+            return get_formatter_by_name('html', linenos=linenos, cssclass=cssclass,
+                                         style=style, noclasses=noclasses,
+                                         hl_lines=hl_lines)
+        key = (linenos, cssclass, style, noclasses)
+        with self._lock:
+            if style != self._style:
+                self._style = style
+                self._formatters.clear()
+            formatter = self._lookup(self._formatters, key, "formatter")
+        if formatter is None:
+            formatter = get_formatter_by_name('html', linenos=linenos, cssclass=cssclass,
+                                              style=style, noclasses=noclasses)
+            with self._lock:
+                self._store(self._formatters, key, formatter)
+        return formatter
+
+    def stats(self):
+        """
+        Return the hits, misses and hit rate of the lexers and formatters.
+        """
+        with self._lock:
+            result = {}
+            for kind in ("lexer", "formatter"):
+                total = self.hits[kind] + self.misses[kind]
+                result[kind] = {
+                    "hits": self.hits[kind],
+                    "misses": self.misses[kind],
+                    "hit_rate": float(self.hits[kind]) / total if total else 0.0
+                }
+            return result
+
+    def clear(self):
+        with self._lock:
+            self._lexers.clear()
+            self._formatters.clear()
+            self._style = None
+            self.hits = {"lexer": 0, "formatter": 0}
+            self.misses = {"lexer": 0, "formatter": 0}
+
+    def _lookup(self, entries, key, kind):
+        value = entries.pop(key, None)
+        if value is None:
+            self.misses[kind] += 1
+            return None
+        self.hits[kind] += 1
+        entries[key] = value
+        return value
+
+    def _store(self, entries, key, value):
+        entries[key] = value
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+
+_NO_LEXER = object()
+
+
+class IncrementalLexer(object):
+    """
+    Remember the tokens of the last long code blocks that were highlighted
+    with each lexer. When a code block is highlighted again after an edit,
+    only the edited lines (and the lines that the edit changes the state of)
+    are lexed again.
+    """
+
+    def __init__(self, min_lines=50, max_texts=8):
+        self.min_lines = min_lines
+        self.max_texts = max_texts
+        self.relexed_tokens = 0
+        self.reused_tokens = 0
+        self._lock = threading.Lock()
+        self._texts = OrderedDict()
+
+    def get_tokens(self, lexer, src, watch=None):
+        """
+        Return the tokens of `src` as `lexer.get_tokens` would, or None when
+        `src` is too short or `lexer` cannot be lexed incrementally. `watch`
+        is passed on to `incremental.lex`.
+        """
+        if src.count('\n') < self.min_lines or not incremental.can_lex(lexer):
+            return None
+        text = lexer._preprocess_text(src)
+        key = (type(lexer), tuple(sorted(lexer.options.items())))
+        with self._lock:
+            previous_texts = self._texts.pop(key, [])
+            self._texts[key] = previous_texts
+            while len(self._texts) > self.max_texts:
+                self._texts.popitem(last=False)
+            previous = self._find_closest(previous_texts, text)
+        if previous is None:
+            lexed = incremental.lex(lexer, text, watch=watch)
+        else:
+            lexed = incremental.relex(lexer, previous, text, watch=watch)
+        with self._lock:
+            if previous is not None:
+                previous_texts.remove(previous)
+            previous_texts.append(lexed)
+            del previous_texts[:-self.max_texts]
+            self.relexed_tokens += lexed.relexed_tokens
+            self.reused_tokens += len(lexed.tokens) - lexed.relexed_tokens
+        return incremental.get_tokens(lexed)
+
+    @staticmethod
+    def _find_closest(lexed_texts, text):
+        """
+        Return the lexed text that shares the longest start and end with
+        `text`, if they share anything.
+        """
+        best, best_length = None, 0
+        for lexed in lexed_texts:
+            length = incremental.get_common_length(lexed.text, text)
+            if length > best_length:
+                best, best_length = lexed, length
+        return best
+
+    def clear(self):
+        with self._lock:
+            self._texts.clear()
+            self.relexed_tokens = 0
+            self.reused_tokens = 0
+
+
+class HighlightBudgetExceeded(Exception):
+    """ Lexing a code block took more time or steps than its budget. """
+
+
+class HighlightWatchdog(object):
+    """
+    Lex code blocks within a budget of time and of steps (tokens). A code
+    block that exceeds its budget is recorded by the name of its lexer and
+    the SHA-1 of its text, and shown without highlighting from then on.
+    Time depends on the load of the machine, so a block that ran out of
+    time is only skipped for the rest of the session; a block that ran out
+    of steps is skipped for good.
+
+    `re` cannot be interrupted while one regular expression backtracks, so
+    a budget does not help against that. With a path, a code block that has
+    not been lexed without trouble in this session is written to the file
+    before it is lexed. A block that is still in the file the next time it
+    is read was being lexed when the previous session ended: when that is
+    the second session in a row, it is recorded as a hang. Only the process
+    that created the watchdog writes the file; the processes it forks for
+    bulk conversion only read it.
+    """
+
+    VERSION = 2
+    # the failures that are kept in the file; time depends on the machine
+    PERSISTENT_REASONS = ('steps', 'hang')
+
+    def __init__(self, time_budget=1.0, step_budget=500000, check_every=64,
+                 max_failures=256, max_good=1024, path=None):
+        self.time_budget = time_budget
+        self.step_budget = step_budget
+        self.check_every = check_every
+        self.max_failures = max_failures
+        self.max_good = max_good
+        self.path = path
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._failures = None
+        self._suspects = set()
+        self._pending = dict()
+        self._saved_pending = frozenset()
+        self._good = OrderedDict()
+
+    @staticmethod
+    def get_hash(src):
+        """ Return the SHA-1 of the code block `src`. """
+        if not isinstance(src, bytes):
+            src = src.encode('utf-8')
+        return hashlib.sha1(src).hexdigest()
+
+    @classmethod
+    def get_key(cls, lexer, src):
+        """ Return the name of `lexer` and the SHA-1 of `src`. """
+        return lexer.name, cls.get_hash(src)
+
+    def set_path(self, path):
+        """ Record the failures in the JSON file `path`. """
+        with self._lock:
+            if path != self.path:
+                self.path = path
+                self._failures = None
+                self._saved_pending = frozenset()
+
+    def get_failures(self):
+        """ Return a dictionary of the failed keys to the reason. """
+        with self._lock:
+            return dict(self._get_failures())
+
+    def get_failure(self, lexer, src):
+        """ Return why `src` exceeded the budget of `lexer`, or None. """
+        key = self.get_key(lexer, src)
+        with self._lock:
+            return self._get_failures().get(key)
+
+    def highlight(self, lexer, src, fn):
+        """
+        Return `fn(watch)`, where `watch` is a function that stops a stream
+        of tokens with `HighlightBudgetExceeded` once it exceeds the budget.
+        Return None when `src` exceeds the budget of `lexer`, now or before.
+        """
+        key = self.get_key(lexer, src)
+        with self._lock:
+            if key in self._get_failures():
+                self.skipped += 1
+                return None
+            self._pending[key] = self._pending.get(key, 0) + 1
+            if key not in self._good and key not in self._saved_pending:
+                self._save()
+        try:
+            result = fn(self._get_watch())
+        except HighlightBudgetExceeded as e:
+            with self._lock:
+                self._add_failure(key, e.args[0])
+                if e.args[0] in self.PERSISTENT_REASONS:
+                    self._save()
+            return None
+        finally:
+            with self._lock:
+                self._pending[key] -= 1
+                if not self._pending[key]:
+                    del self._pending[key]
+        with self._lock:
+            self._suspects.discard(key)
+            self._good.pop(key, None)
+            self._good[key] = True
+            while len(self._good) > self.max_good:
+                self._good.popitem(last=False)
+        return result
+
+    def save(self):
+        """ Write the failures and the code blocks being lexed now. """
+        with self._lock:
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self._failures = OrderedDict()
+            self._suspects.clear()
+            self._pending.clear()
+            self._good.clear()
+            self.skipped = 0
+            self._save()
+
+    def _get_watch(self):
+        # processor time, which does not count while the machine sleeps or
+        # runs other processes (on Windows, a monotonic clock)
+        deadline = time.clock() + self.time_budget
+        step_budget, check_every = self.step_budget, self.check_every
+
+        def watch(stream):
+            for steps, item in enumerate(stream, 1):
+                if steps > step_budget:
+                    raise HighlightBudgetExceeded('steps')
+                if not steps % check_every and time.clock() > deadline:
+                    raise HighlightBudgetExceeded('time')
+                yield item
+        return watch
+
+    def _get_failures(self):
+        if self._failures is None:
+            self._failures = self._load()
+        return self._failures
+
+    def _add_failure(self, key, reason):
+        failures = self._get_failures()
+        failures[key] = reason
+        while len(failures) > self.max_failures:
+            failures.popitem(last=False)
+
+    def _load(self):
+        failures = OrderedDict()
+        self._suspects = set()
+        if not self.path:
+            return failures
+        try:
+            with codecs.open(self.path, encoding='utf8') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return failures
+        if not isinstance(data, dict) or data.get('version') != self.VERSION:
+            return failures
+        for name, sha1, reason in data.get('failures', list()):
+            if reason in self.PERSISTENT_REASONS:
+                failures[name, sha1] = reason
+        suspects = set(tuple(key) for key in data.get('suspects', list()))
+        # a previous session did not get to the end of these; Anki may just
+        # have been closed, so only the second time counts as a hang
+        for key in data.get('pending', list()):
+            key = tuple(key)
+            if key in suspects:
+                failures[key] = 'hang'
+            else:
+                self._suspects.add(key)
+        return failures
+
+    def _save(self):
+        if not self.path or os.getpid() != self._pid:
+            return
+        data = {
+            'version': self.VERSION,
+            'failures': [[name, sha1, reason] for (name, sha1), reason
+                         in self._get_failures().items()
+                         if reason in self.PERSISTENT_REASONS],
+            'suspects': [list(key) for key in self._suspects],
+            'pending': [list(key) for key in self._pending]
+        }
+        temp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        try:
+            with codecs.open(temp_path, 'w', encoding='utf8') as f:
+                json.dump(data, f)
+            if os.name == 'nt' and os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(temp_path, self.path)
+            self._saved_pending = frozenset(self._pending)
+        except (IOError, OSError) as e:
+            print e  # TODO: should be logged
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+HIGHLIGHTER_CACHE = HighlighterCache()
+INCREMENTAL_LEXER = IncrementalLexer()
+HIGHLIGHT_WATCHDOG = HighlightWatchdog()
+
+
 def parse_hl_lines(expr):
     """Support our syntax for emphasizing certain lines of code.
 
@@ -97,6 +482,11 @@ class CodeHilite(object):
 
     * hl_lines: (List of integers) Lines to emphasize, 1-indexed.
 
+    * budgeted: (Boolean) Show code blocks that take too long to highlight
+      without highlighting (see `HighlightWatchdog`). After `hilite`,
+      `degraded` is True when that is only so for this session, and the
+      HTML should not be cached.
+
     Low Level Usage:
         >>> code = CodeHilite()
         >>> code.src = 'some text' # String or anything with a .readline attr.
@@ -107,7 +497,8 @@ class CodeHilite(object):
 
     def __init__(self, src=None, linenums=None, guess_lang=True,
                  css_class="codehilite", lang=None, style='default',
-                 noclasses=False, tab_length=4, hl_lines=None, use_pygments=True):
+                 noclasses=False, tab_length=4, hl_lines=None, use_pygments=True,
+                 budgeted=False):
         self.src = src
         self.lang = lang
         self.linenums = linenums
@@ -118,6 +509,8 @@ class CodeHilite(object):
         self.tab_length = tab_length
         self.hl_lines = hl_lines or []
         self.use_pygments = use_pygments
+        self.budgeted = budgeted
+        self.degraded = False
 
     def hilite(self):
         """
@@ -137,38 +530,56 @@ class CodeHilite(object):
 
         if pygments and self.use_pygments:
             try:
-                lexer = get_lexer_by_name(self.lang)
+                lexer = HIGHLIGHTER_CACHE.get_lexer(self.lang)
             except ValueError:
                 try:
                     if self.guess_lang:
                         lexer = guess_lexer(self.src)
                     else:
-                        lexer = get_lexer_by_name('text')
+                        lexer = HIGHLIGHTER_CACHE.get_lexer('text')
                 except ValueError:
-                    lexer = get_lexer_by_name('text')
-            formatter = get_formatter_by_name('html',
-                                              linenos=self.linenums,
-                                              cssclass=self.css_class,
-                                              style=self.style,
-                                              noclasses=self.noclasses,
-                                              hl_lines=self.hl_lines)
-            return highlight(self.src, lexer, formatter)
-        else:
-            # just escape and build markup usable by JS highlighting libs
-            txt = self.src.replace('&', '&amp;')
-            txt = txt.replace('<', '&lt;')
-            txt = txt.replace('>', '&gt;')
-            txt = txt.replace('"', '&quot;')
-            classes = []
-            if self.lang:
-                classes.append('language-%s' % self.lang)
-            if self.linenums:
-                classes.append('linenums')
-            class_str = ''
-            if classes:
-                class_str = ' class="%s"' % ' '.join(classes)
-            return '<pre align="left" class="%s"><code%s>%s</code></pre>\n' % \
-                   (self.css_class, class_str, txt)
+                    lexer = HIGHLIGHTER_CACHE.get_lexer('text')
+            formatter = HIGHLIGHTER_CACHE.get_formatter(linenos=self.linenums,
+                                                        cssclass=self.css_class,
+                                                        style=self.style,
+                                                        noclasses=self.noclasses,
+                                                        hl_lines=self.hl_lines)
+            if not self.budgeted:
+                return self._highlight(lexer, formatter)
+            html = HIGHLIGHT_WATCHDOG.highlight(
+                lexer, self.src,
+                lambda watch: self._highlight(lexer, formatter, watch))
+            if html is not None:
+                return html
+            # a block that ran out of time may be highlighted next session
+            reason = HIGHLIGHT_WATCHDOG.get_failure(lexer, self.src)
+            self.degraded = reason not in HighlightWatchdog.PERSISTENT_REASONS
+        return self._escape()
+
+    def _highlight(self, lexer, formatter, watch=None):
+        tokens = INCREMENTAL_LEXER.get_tokens(lexer, self.src, watch)
+        if tokens is None:
+            if watch is None:
+                return highlight(self.src, lexer, formatter)
+            tokens = watch(lexer.get_tokens(self.src))
+        return format_tokens(tokens, formatter)
+
+    def _escape(self):
+        """ Just escape and build markup usable by JS highlighting libs. """
+        txt = self.src.replace('&', '&amp;')
+        txt = txt.replace('<', '&lt;')
+        txt = txt.replace('>', '&gt;')
+        txt = txt.replace('"', '&quot;')
+        classes = []
+        if self.lang:
+            classes.append('language-%s' % self.lang)
+        if self.linenums:
+            classes.append('linenums')
+        class_str = ''
+        if classes:
+            class_str = ' class="%s"' % ' '.join(classes)
+        return '<pre align="left" class="%s"><code%s>%s</code></pre>\n' % \
+               (self.css_class, class_str, txt)
 
     def _parseHeader(self):
         """
@@ -245,10 +656,13 @@ class HiliteTreeprocessor(Treeprocessor):
                     style=self.config['pygments_style'],
                     noclasses=self.config['noclasses'],
                     tab_length=self.markdown.tab_length,
-                    use_pygments=self.config['use_pygments']
+                    use_pygments=self.config['use_pygments'],
+                    budgeted=self.config['budgeted']
                 )
                 placeholder = self.markdown.htmlStash.store(code.hilite(),
                                                             safe=True)
+                if code.degraded:
+                    self.extension.degraded += 1
                 # Clear codeblock in etree instance
                 block.clear()
                 # Change to p element which will later
@@ -279,8 +693,14 @@ class CodeHiliteExtension(Extension):
             'use_pygments': [True,
                              'Use Pygments to Highlight code blocks. '
                              'Disable if using a JavaScript library. '
-                             'Default: True']
+                             'Default: True'],
+            'budgeted': [False,
+                         'Show code blocks that take too long to highlight '
+                         'without highlighting - Default: False']
             }
+        # the number of code blocks of the current document that are shown
+        # without highlighting for this session only (see `CodeHilite`)
+        self.degraded = 0
 
         super(CodeHiliteExtension, self).__init__(*args, **kwargs)
 
@@ -288,10 +708,24 @@ class CodeHiliteExtension(Extension):
         """ Add HilitePostprocessor to Markdown instance. """
         hiliter = HiliteTreeprocessor(md)
         hiliter.config = self.getConfigs()
+        hiliter.extension = self
         md.treeprocessors.add("hilite", hiliter, "<inline")
 
         md.registerExtension(self)
 
+    def reset(self):
+        """ Forget the code blocks of the previous document. """
+        self.degraded = 0
+
+
+def get_degraded(md):
+    """
+    Return the number of code blocks of the current document of `md` that
+    are shown without highlighting for this session only.
+    """
+    return sum(extension.degraded for extension in md.registeredExtensions
+               if isinstance(extension, CodeHiliteExtension))
+
 
 def makeExtension(*args, **kwargs):
     return CodeHiliteExtension(*args, **kwargs)
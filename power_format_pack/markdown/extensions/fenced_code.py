@@ -50,6 +50,7 @@ class FencedBlockPreprocessor(Preprocessor):
         super(FencedBlockPreprocessor, self).__init__(md)
 
         self.checked_for_codehilite = False
+        self.codehilite = None
         self.codehilite_conf = {}
 
     def run(self, lines):
@@ -59,6 +60,7 @@ class FencedBlockPreprocessor(Preprocessor):
         if not self.checked_for_codehilite:
             for ext in self.markdown.registeredExtensions:
                 if isinstance(ext, CodeHiliteExtension):
+                    self.codehilite = ext
                     self.codehilite_conf = ext.config
                     break
 
@@ -83,10 +85,13 @@ class FencedBlockPreprocessor(Preprocessor):
                         style=self.codehilite_conf['pygments_style'][0],
                         lang=(m.group('lang') or None),
                         noclasses=self.codehilite_conf['noclasses'][0],
-                        hl_lines=parse_hl_lines(m.group('hl_lines'))
+                        hl_lines=parse_hl_lines(m.group('hl_lines')),
+                        budgeted=self.codehilite_conf['budgeted'][0]
                     )
 
                     code = highliter.hilite()
+                    if highliter.degraded:
+                        self.codehilite.degraded += 1
                 else:
                     code = self.CODE_WRAP % (lang,
                                              self._escape(m.group('code')))
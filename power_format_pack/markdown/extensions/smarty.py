@@ -84,7 +84,7 @@ smartypants.py license:
 from __future__ import unicode_literals
 from . import Extension
 from ..inlinepatterns import HtmlPattern, HTML_RE
-from ..odict import OrderedDict
+from ..odict import Registry
 from ..treeprocessors import InlineProcessor
 
 
@@ -246,7 +246,7 @@ class SmartyExtension(Extension):
 
     def extendMarkdown(self, md, md_globals):
         configs = self.getConfigs()
-        self.inlinePatterns = OrderedDict()
+        self.inlinePatterns = Registry()
         if configs['smart_ellipses']:
             self.educateEllipses(md)
         if configs['smart_quotes']:
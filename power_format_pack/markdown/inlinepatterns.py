@@ -4,21 +4,29 @@ INLINE PATTERNS
 
 Inline patterns such as *emphasis* are handled by means of auxiliary
 objects, one per pattern.  Pattern objects must be instances of classes
-that extend markdown.Pattern.  Each pattern object uses a single regular
-expression and needs support the following methods:
+that extend markdown.InlineProcessor or markdown.Pattern.  Each pattern
+object uses a single regular expression and needs support the following
+methods:
 
     pattern.getCompiledRegExp() # returns a regular expression
 
-    pattern.handleMatch(m) # takes a match object and returns
-                           # an ElementTree element or just plain text
+    pattern.handleMatch(m, data) # takes a match object and the text it
+                                 # was found in, and returns an
+                                 # ElementTree element or just plain
+                                 # text, and the start and end of the
+                                 # text that it replaces
 
-All of python markdown's built-in patterns subclass from Pattern,
+All of python markdown's built-in patterns subclass from InlineProcessor,
 but you can add additional patterns that don't.
 
-Also note that all the regular expressions used by inline must
-capture the whole block.  For this reason, they all start with
-'^(.*)' and end with '(.*)!'.  In case with built-in expression
-Pattern takes care of adding the "^(.*)" and "(.*)!".
+The regular expression of an InlineProcessor is searched for in the text
+from a position on, so its groups are numbered from 1 and it can look
+behind the start of the match.  Patterns that subclass Pattern, the older
+interface, still work: their regular expressions must capture the whole
+block, so Pattern wraps them in "^(.*?)" and "(.*?)$", and
+`handleMatch(m)` gets the text before the match as `m.group(1)` and the
+text after it as the last group.  This copies the text around every
+match, so it is slower on long paragraphs.
 
 Finally, the order in which regular expressions are applied is very
 important - e.g. if we first replace http://.../ links with <a> tags
@@ -46,6 +54,8 @@ from __future__ import unicode_literals
 from . import util
 from . import odict
 import re
+import sre_constants
+import sre_parse
 try:  # pragma: no cover
     from ..urllib import parse
     from parse import urlparse, urlunparse
@@ -59,38 +69,59 @@ except ImportError:  # pragma: no cover
 
 def build_inlinepatterns(md_instance, **kwargs):
     """ Build the default set of inline patterns for Markdown. """
-    inlinePatterns = odict.OrderedDict()
-    inlinePatterns["backtick"] = BacktickPattern(BACKTICK_RE)
-    inlinePatterns["escape"] = EscapePattern(ESCAPE_RE, md_instance)
-    inlinePatterns["reference"] = ReferencePattern(REFERENCE_RE, md_instance)
-    inlinePatterns["link"] = LinkPattern(LINK_RE, md_instance)
-    inlinePatterns["image_link"] = ImagePattern(IMAGE_LINK_RE, md_instance)
-    inlinePatterns["image_reference"] = ImageReferencePattern(
+    inlinePatterns = odict.Registry()
+    inlinePatterns["backtick"] = BacktickInlineProcessor(BACKTICK_RE)
+    inlinePatterns["escape"] = EscapeInlineProcessor(ESCAPE_RE, md_instance)
+    inlinePatterns["reference"] = ReferenceInlineProcessor(
+        REFERENCE_RE, md_instance
+    )
+    inlinePatterns["link"] = LinkInlineProcessor(LINK_RE, md_instance)
+    inlinePatterns["image_link"] = ImageInlineProcessor(
+        IMAGE_LINK_RE, md_instance
+    )
+    inlinePatterns["image_reference"] = ImageReferenceInlineProcessor(
         IMAGE_REFERENCE_RE, md_instance
     )
-    inlinePatterns["short_reference"] = ReferencePattern(
+    inlinePatterns["short_reference"] = ReferenceInlineProcessor(
         SHORT_REF_RE, md_instance
     )
-    inlinePatterns["autolink"] = AutolinkPattern(AUTOLINK_RE, md_instance)
-    inlinePatterns["automail"] = AutomailPattern(AUTOMAIL_RE, md_instance)
-    inlinePatterns["linebreak"] = SubstituteTagPattern(LINE_BREAK_RE, 'br')
+    inlinePatterns["autolink"] = AutolinkInlineProcessor(
+        AUTOLINK_RE, md_instance
+    )
+    inlinePatterns["automail"] = AutomailInlineProcessor(
+        AUTOMAIL_RE, md_instance
+    )
+    inlinePatterns["linebreak"] = SubstituteTagInlineProcessor(
+        LINE_BREAK_RE, 'br'
+    )
     if md_instance.safeMode != 'escape':
-        inlinePatterns["html"] = HtmlPattern(HTML_RE, md_instance)
-    inlinePatterns["entity"] = HtmlPattern(ENTITY_RE, md_instance)
-    inlinePatterns["not_strong"] = SimpleTextPattern(NOT_STRONG_RE)
-    inlinePatterns["em_strong"] = DoubleTagPattern(EM_STRONG_RE, 'strong,em')
-    inlinePatterns["strong_em"] = DoubleTagPattern(STRONG_EM_RE, 'em,strong')
-    inlinePatterns["strong"] = SimpleTagPattern(STRONG_RE, 'strong')
-    inlinePatterns["emphasis"] = SimpleTagPattern(EMPHASIS_RE, 'em')
+        inlinePatterns["html"] = HtmlInlineProcessor(HTML_RE, md_instance)
+    inlinePatterns["entity"] = HtmlInlineProcessor(ENTITY_RE, md_instance)
+    inlinePatterns["not_strong"] = SimpleTextInlineProcessor(NOT_STRONG_RE)
+    inlinePatterns["em_strong"] = DoubleTagInlineProcessor(
+        EM_STRONG_RE, 'strong,em'
+    )
+    inlinePatterns["strong_em"] = DoubleTagInlineProcessor(
+        STRONG_EM_RE, 'em,strong'
+    )
+    inlinePatterns["strong"] = SimpleTagInlineProcessor(STRONG_RE, 'strong')
+    inlinePatterns["emphasis"] = SimpleTagInlineProcessor(EMPHASIS_RE, 'em')
     if md_instance.smart_emphasis:
-        inlinePatterns["emphasis2"] = SimpleTagPattern(SMART_EMPHASIS_RE, 'em')
+        inlinePatterns["emphasis2"] = SimpleTagInlineProcessor(
+            SMART_EMPHASIS_RE, 'em'
+        )
     else:
-        inlinePatterns["emphasis2"] = SimpleTagPattern(EMPHASIS_2_RE, 'em')
+        inlinePatterns["emphasis2"] = SimpleTagInlineProcessor(
+            EMPHASIS_2_RE, 'em'
+        )
     return inlinePatterns
 
 """
 The actual regular expressions for patterns
 -----------------------------------------------------------------------------
+
+InlineProcessor does not add groups around them, so their back references
+count from the first group of the expression itself.
 """
 
 NOBRACKET = r'[^\]\[]*'
@@ -103,32 +134,32 @@ BRK = (
 NOIMG = r'(?<!\!)'
 
 # `e=f()` or ``e=f("`")``
-BACKTICK_RE = r'(?<!\\)(`+)(.+?)(?<!`)\2(?!`)'
+BACKTICK_RE = r'(?<!\\)(`+)(.+?)(?<!`)\1(?!`)'
 
 # \<
 ESCAPE_RE = r'\\(.)'
 
 # *emphasis*
-EMPHASIS_RE = r'(\*)([^\*]+)\2'
+EMPHASIS_RE = r'(\*)([^\*]+)\1'
 
 # **strong**
-STRONG_RE = r'(\*{2}|_{2})(.+?)\2'
+STRONG_RE = r'(\*{2}|_{2})(.+?)\1'
 
 # ***strongem*** or ***em*strong**
-EM_STRONG_RE = r'(\*|_)\2{2}(.+?)\2(.*?)\2{2}'
+EM_STRONG_RE = r'(\*|_)\1{2}(.+?)\1(.*?)\1{2}'
 
 # ***strong**em*
-STRONG_EM_RE = r'(\*|_)\2{2}(.+?)\2{2}(.*?)\2'
+STRONG_EM_RE = r'(\*|_)\1{2}(.+?)\1{2}(.*?)\1'
 
 # _smart_emphasis_
-SMART_EMPHASIS_RE = r'(?<!\w)(_)(?!_)(.+?)(?<!_)\2(?!\w)'
+SMART_EMPHASIS_RE = r'(?<!\w)(_)(?!_)(.+?)(?<!_)\1(?!\w)'
 
 # _emphasis_
-EMPHASIS_2_RE = r'(_)(.+?)\2'
+EMPHASIS_2_RE = r'(_)(.+?)\1'
 
 # [text](url) or [text](<url>) or [text](url "title")
 LINK_RE = NOIMG + BRK + \
-    r'''\(\s*(<.*?>|((?:(?:\(.*?\))|[^\(\)]))*?)\s*((['"])(.*?)\12\s*)?\)'''
+    r'''\(\s*(<.*?>|((?:(?:\(.*?\))|[^\(\)]))*?)\s*((['"])(.*?)\11\s*)?\)'''
 
 # ![alttxt](http://x.com/) or ![alttxt](<http://x.com/>)
 IMAGE_LINK_RE = r'\!' + BRK + r'\s*\((<.*?>|([^")]+"[^"]*"|[^\)]*))\)'
@@ -180,6 +211,77 @@ def handleAttributes(text, parent):
     return ATTR_RE.sub(attributeCallback, text)
 
 
+# the required characters of the regular expressions of the patterns,
+# keyed on the regular expression and its flags
+_required_chars = {}
+
+
+def getRequiredChars(compiled_re):
+    """
+    Return a frozenset with characters of which every match of the compiled
+    regular expression contains at least one, or None when there is no
+    such set. A pattern can be skipped for text without any of them.
+    """
+    key = (compiled_re.pattern, compiled_re.flags)
+    try:
+        return _required_chars[key]
+    except KeyError:
+        pass
+    parsed = sre_parse.parse(compiled_re.pattern, compiled_re.flags)
+    flags = getattr(parsed, 'state', parsed.pattern).flags | compiled_re.flags
+    if flags & (re.IGNORECASE | re.LOCALE):
+        chars = None
+    else:
+        chars = _get_required_chars(parsed)
+    _required_chars[key] = chars
+    return chars
+
+
+def _get_required_chars(sequence):
+    """
+    Return the smallest set of required characters of any item, preferring
+    sets without a space.
+    """
+    best = None
+    for op, av in sequence:
+        chars = _get_item_required_chars(op, av)
+        if chars is not None and (best is None or
+                                  (len(chars), ' ' in chars) < (len(best), ' ' in best)):
+            best = chars
+    return best
+
+
+def _get_item_required_chars(op, av):
+    if op == sre_constants.LITERAL:
+        return frozenset([util.int2str(av)])
+    if op == sre_constants.IN:
+        chars = set()
+        for set_op, set_av in av:
+            if set_op == sre_constants.LITERAL:
+                chars.add(util.int2str(set_av))
+            elif set_op == sre_constants.RANGE and set_av[1] - set_av[0] < 64:
+                chars.update(util.int2str(c) for c in range(set_av[0], set_av[1] + 1))
+            else:
+                # a category or a negated set
+                return None
+        return frozenset(chars)
+    if op == sre_constants.SUBPATTERN:
+        return _get_required_chars(av[-1])
+    if op == sre_constants.BRANCH:
+        chars = set()
+        for alternative in av[1]:
+            alternative_chars = _get_required_chars(alternative)
+            if alternative_chars is None:
+                return None
+            chars |= alternative_chars
+        return frozenset(chars)
+    if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+        if av[0] > 0:
+            return _get_required_chars(av[2])
+    # anything else matches any character, or none at all
+    return None
+
+
 """
 The pattern classes
 -----------------------------------------------------------------------------
@@ -187,7 +289,11 @@ The pattern classes
 
 
 class Pattern(object):
-    """Base class that inline patterns subclass. """
+    """
+    Base class of inline patterns with the older interface, which match
+    their regular expression wrapped in "^(.*?)" and "(.*?)$".
+    New patterns should subclass InlineProcessor.
+    """
 
     def __init__(self, pattern, markdown_instance=None):
         """
@@ -528,3 +634,240 @@ class AutomailPattern(Pattern):
                           ord(letter) for letter in mailto])
         el.set('href', mailto)
         return el
+
+
+"""
+The inline processor classes
+-----------------------------------------------------------------------------
+"""
+
+
+class InlineProcessor(Pattern):
+    """
+    Base class that inline patterns subclass.
+
+    The regular expression is searched for as it is, from a position in
+    the text on, and `handleMatch` returns where the text that it replaces
+    starts and ends, so that the text around a match is not copied.
+    """
+
+    def __init__(self, pattern, markdown_instance=None):
+        """
+        Create an instant of an inline processor.
+
+        Keyword arguments:
+
+        * pattern: A regular expression that matches a pattern
+
+        """
+        self.pattern = pattern
+        self.compiled_re = re.compile(pattern, re.DOTALL | re.UNICODE)
+
+        # Api for Markdown to pass safe_mode into instance
+        self.safe_mode = False
+        if markdown_instance:
+            self.markdown = markdown_instance
+
+    def handleMatch(self, m, data):
+        """Return a ElementTree element from the given match, and the
+        start and end index of the text that it replaces.
+
+        If the element is None, the text is left as it is and the search
+        goes on at the end index. If the start and end index are None too,
+        the match is ignored and the search goes on after it.
+
+        Subclasses should override this method.
+
+        Keyword arguments:
+
+        * m: A re match object containing a match of the pattern.
+        * data: The text that the pattern was searched in.
+
+        """
+        pass  # pragma: no cover
+
+
+class SimpleTextInlineProcessor(InlineProcessor):
+    """ Return a simple text of group(1) of a Pattern. """
+    def handleMatch(self, m, data):
+        return m.group(1), m.start(0), m.end(0)
+
+
+class EscapeInlineProcessor(InlineProcessor):
+    """ Return an escaped character. """
+
+    def handleMatch(self, m, data):
+        char = m.group(1)
+        if char in self.markdown.ESCAPED_CHARS:
+            return ('%s%s%s' % (util.STX, ord(char), util.ETX),
+                    m.start(0), m.end(0))
+        else:
+            return None, m.start(0), m.end(0)
+
+
+class SimpleTagInlineProcessor(InlineProcessor):
+    """
+    Return element of type `tag` with a text attribute of group(2)
+    of a Pattern.
+
+    """
+    def __init__(self, pattern, tag):
+        InlineProcessor.__init__(self, pattern)
+        self.tag = tag
+
+    def handleMatch(self, m, data):
+        el = util.etree.Element(self.tag)
+        el.text = m.group(2)
+        return el, m.start(0), m.end(0)
+
+
+class SubstituteTagInlineProcessor(SimpleTagInlineProcessor):
+    """ Return an element of type `tag` with no children. """
+    def handleMatch(self, m, data):
+        return util.etree.Element(self.tag), m.start(0), m.end(0)
+
+
+class BacktickInlineProcessor(InlineProcessor):
+    """ Return a `<code>` element containing the matching text. """
+    def __init__(self, pattern):
+        InlineProcessor.__init__(self, pattern)
+        self.tag = "code"
+
+    def handleMatch(self, m, data):
+        el = util.etree.Element(self.tag)
+        el.text = util.AtomicString(m.group(2).strip())
+        return el, m.start(0), m.end(0)
+
+
+class DoubleTagInlineProcessor(SimpleTagInlineProcessor):
+    """Return a ElementTree element nested in tag2 nested in tag1.
+
+    Useful for strong emphasis etc.
+
+    """
+    def handleMatch(self, m, data):
+        tag1, tag2 = self.tag.split(",")
+        el1 = util.etree.Element(tag1)
+        el2 = util.etree.SubElement(el1, tag2)
+        el2.text = m.group(2)
+        if len(m.groups()) == 3:
+            el2.tail = m.group(3)
+        return el1, m.start(0), m.end(0)
+
+
+class HtmlInlineProcessor(InlineProcessor, HtmlPattern):
+    """ Store raw inline html and return a placeholder. """
+    def handleMatch(self, m, data):
+        rawhtml = self.unescape(m.group(1))
+        place_holder = self.markdown.htmlStash.store(rawhtml)
+        return place_holder, m.start(0), m.end(0)
+
+
+class LinkInlineProcessor(InlineProcessor, LinkPattern):
+    """ Return a link element from the given match. """
+    def handleMatch(self, m, data):
+        el = util.etree.Element("a")
+        el.text = m.group(1)
+        title = m.group(12)
+        href = m.group(8)
+
+        if href:
+            if href[0] == "<":
+                href = href[1:-1]
+            el.set("href", self.sanitize_url(self.unescape(href.strip())))
+        else:
+            el.set("href", "")
+
+        if title:
+            title = dequote(self.unescape(title))
+            el.set("title", title)
+        return el, m.start(0), m.end(0)
+
+
+class ImageInlineProcessor(LinkInlineProcessor):
+    """ Return a img element from the given match. """
+    def handleMatch(self, m, data):
+        el = util.etree.Element("img")
+        src_parts = m.group(8).split()
+        if src_parts:
+            src = src_parts[0]
+            if src[0] == "<" and src[-1] == ">":
+                src = src[1:-1]
+            el.set('src', self.sanitize_url(self.unescape(src)))
+        else:
+            el.set('src', "")
+        if len(src_parts) > 1:
+            el.set('title', dequote(self.unescape(" ".join(src_parts[1:]))))
+
+        if self.markdown.enable_attributes:
+            truealt = handleAttributes(m.group(1), el)
+        else:
+            truealt = m.group(1)
+
+        el.set('alt', self.unescape(truealt))
+        return el, m.start(0), m.end(0)
+
+
+class ReferenceInlineProcessor(LinkInlineProcessor, ReferencePattern):
+    """ Match to a stored reference and return link element. """
+
+    def handleMatch(self, m, data):
+        try:
+            id = m.group(8).lower()
+        except IndexError:
+            id = None
+        if not id:
+            # if we got something like "[Google][]" or "[Goggle]"
+            # we'll use "google" as the id
+            id = m.group(1).lower()
+
+        # Clean up linebreaks in id
+        id = self.NEWLINE_CLEANUP_RE.sub(' ', id)
+        if id not in self.markdown.references:  # ignore undefined refs
+            return None, m.start(0), m.end(0)
+        href, title = self.markdown.references[id]
+
+        text = m.group(1)
+        return self.makeTag(href, title, text), m.start(0), m.end(0)
+
+
+class ImageReferenceInlineProcessor(ReferenceInlineProcessor,
+                                    ImageReferencePattern):
+    """ Match to a stored reference and return img element. """
+
+
+class AutolinkInlineProcessor(InlineProcessor):
+    """ Return a link Element given an autolink (`<http://example/com>`). """
+    def handleMatch(self, m, data):
+        el = util.etree.Element("a")
+        el.set('href', self.unescape(m.group(1)))
+        el.text = util.AtomicString(m.group(1))
+        return el, m.start(0), m.end(0)
+
+
+class AutomailInlineProcessor(InlineProcessor):
+    """
+    Return a mailto link Element given an automail link (`<foo@example.com>`).
+    """
+    def handleMatch(self, m, data):
+        el = util.etree.Element('a')
+        email = self.unescape(m.group(1))
+        if email.startswith("mailto:"):
+            email = email[len("mailto:"):]
+
+        def codepoint2name(code):
+            """Return entity definition by code, or the code if not defined."""
+            entity = entities.codepoint2name.get(code)
+            if entity:
+                return "%s%s;" % (util.AMP_SUBSTITUTE, entity)
+            else:
+                return "%s#%d;" % (util.AMP_SUBSTITUTE, code)
+
+        letters = [codepoint2name(ord(letter)) for letter in email]
+        el.text = util.AtomicString(''.join(letters))
+
+        mailto = "mailto:" + email
+        mailto = "".join([util.AMP_SUBSTITUTE + '#%d;' %
+                          ord(letter) for letter in mailto])
+        el.set('href', mailto)
+        return el, m.start(0), m.end(0)
@@ -189,3 +189,102 @@ class OrderedDict(dict):
             # restore to prevent data loss and reraise
             self.keyOrder.insert(n, key)
             raise e
+
+
+class Registry(OrderedDict):
+    """
+    An OrderedDict for the processors and inline patterns of Markdown.
+
+    These are added and moved while the extensions are loaded, and then
+    run in order, or looked up by index, many times for every document.
+    The values in order and the index of every key are therefore kept
+    until the next change, so that `value_for_index` and `index` take
+    constant time. Change the order with `add`, `insert` and `link`, not
+    by changing `keyOrder` itself.
+
+    """
+    def __new__(cls, *args, **kwargs):
+        instance = super(Registry, cls).__new__(cls, *args, **kwargs)
+        instance._values = None
+        instance._indexes = None
+        return instance
+
+    def _changed(self):
+        self._values = None
+        self._indexes = None
+
+    def value_tuple(self):
+        """ Return a tuple of the values in order. """
+        if self._values is None:
+            self._values = tuple([self[k] for k in self.keyOrder])
+        return self._values
+
+    def __setitem__(self, key, value):
+        super(Registry, self).__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super(Registry, self).__delitem__(key)
+        self._changed()
+
+    def pop(self, k, *args):
+        try:
+            return super(Registry, self).pop(k, *args)
+        finally:
+            self._changed()
+
+    def popitem(self):
+        try:
+            return super(Registry, self).popitem()
+        finally:
+            self._changed()
+
+    def _itervalues(self):
+        return iter(self.value_tuple())
+
+    if util.PY3:  # pragma: no cover
+        values = _itervalues
+    else:  # pragma: no cover
+        itervalues = _itervalues
+
+        def values(self):
+            return list(self.value_tuple())
+
+    def setdefault(self, key, default):
+        try:
+            return super(Registry, self).setdefault(key, default)
+        finally:
+            self._changed()
+
+    def value_for_index(self, index):
+        """Returns the value of the item at the given zero-based index."""
+        return self.value_tuple()[index]
+
+    def insert(self, index, key, value):
+        """Inserts the key, value pair before the item with the given index."""
+        try:
+            super(Registry, self).insert(index, key, value)
+        finally:
+            self._changed()
+
+    def clear(self):
+        super(Registry, self).clear()
+        self._changed()
+
+    def index(self, key):
+        """ Return the index of a given key. """
+        if self._indexes is None:
+            self._indexes = dict((k, i) for i, k in enumerate(self.keyOrder))
+        try:
+            return self._indexes[key]
+        except KeyError:
+            raise ValueError("Element '%s' was not found in OrderedDict" % key)
+
+    def link(self, key, location):
+        """ Change location of an existing item. """
+        # the location is looked up after the key is taken out
+        self._changed()
+        try:
+            super(Registry, self).link(key, location)
+        finally:
+            self._changed()
@@ -138,58 +138,88 @@ def _escape_attrib_html(text):
 
 
 def _serialize_html(write, elem, qnames, namespaces, format):
-    tag = elem.tag
-    text = elem.text
-    if tag is Comment:
-        write("<!--%s-->" % _escape_cdata(text))
-    elif tag is ProcessingInstruction:
-        write("<?%s?>" % _escape_cdata(text))
-    else:
-        tag = qnames[tag]
-        if tag is None:
-            if text:
-                write(_escape_cdata(text))
-            for e in elem:
-                _serialize_html(write, e, qnames, None, format)
-        else:
-            write("<" + tag)
-            items = elem.items()
-            if items or namespaces:
-                items = sorted(items)  # lexical order
-                for k, v in items:
-                    if isinstance(k, QName):
-                        k = k.text
-                    if isinstance(v, QName):
-                        v = qnames[v.text]
-                    else:
-                        v = _escape_attrib_html(v)
-                    if qnames[k] == v and format == 'html':
-                        # handle boolean attributes
-                        write(" %s" % v)
-                    else:
-                        write(" %s=\"%s\"" % (qnames[k], v))
-                if namespaces:
-                    items = namespaces.items()
-                    items.sort(key=lambda x: x[1])  # sort on prefix
-                    for v, k in items:
-                        if k:
-                            k = ":" + k
-                        write(" xmlns%s=\"%s\"" % (k, _escape_attrib(v)))
-            if format == "xhtml" and tag.lower() in HTML_EMPTY:
-                write(" />")
+    # walk the tree without recursion: the stack holds, for every element
+    # whose children are being written, the iterator over the children of
+    # its parent and the markup that follows its children, its end tag
+    # and its tail
+    escape_cdata = _escape_cdata
+    xhtml = format == "xhtml"
+    stack = []
+    children = iter((elem,))
+    # attribute values such as class names and titles repeat a lot
+    escaped = {}
+    while True:
+        for elem in children:
+            tag = elem.tag
+            text = elem.text
+            tail = elem.tail
+            end = ""
+            if tag is Comment:
+                write("<!--%s-->" % escape_cdata(text))
+            elif tag is ProcessingInstruction:
+                write("<?%s?>" % escape_cdata(text))
             else:
-                write(">")
-                if text:
-                    if tag.lower() in ["script", "style"]:
-                        write(text)
+                tag = qnames[tag]
+                if tag is None:
+                    if text:
+                        write(escape_cdata(text))
+                else:
+                    write("<" + tag)
+                    items = elem.items()
+                    if items or namespaces:
+                        items = sorted(items)  # lexical order
+                        for k, v in items:
+                            if isinstance(k, QName):
+                                k = k.text
+                            if isinstance(v, QName):
+                                v = qnames[v.text]
+                            else:
+                                value = escaped.get(v)
+                                if value is None:
+                                    value = escaped[v] = _escape_attrib_html(v)
+                                v = value
+                            if qnames[k] == v and format == 'html':
+                                # handle boolean attributes
+                                write(" %s" % v)
+                            else:
+                                write(" %s=\"%s\"" % (qnames[k], v))
+                        if namespaces:
+                            items = namespaces.items()
+                            items.sort(key=lambda x: x[1])  # sort on prefix
+                            for v, k in items:
+                                if k:
+                                    k = ":" + k
+                                write(" xmlns%s=\"%s\"" % (k, _escape_attrib(v)))
+                        # only the root declares the namespaces
+                        namespaces = None
+                    lower = tag.lower()
+                    if xhtml and lower in HTML_EMPTY:
+                        write(" />")
                     else:
-                        write(_escape_cdata(text))
-                for e in elem:
-                    _serialize_html(write, e, qnames, None, format)
-                if tag.lower() not in HTML_EMPTY:
-                    write("</" + tag + ">")
-    if elem.tail:
-        write(_escape_cdata(elem.tail))
+                        write(">")
+                        if text:
+                            if lower in ["script", "style"]:
+                                write(text)
+                            else:
+                                write(escape_cdata(text))
+                        if lower not in HTML_EMPTY:
+                            end = "</" + tag + ">"
+                if len(elem):
+                    if tail:
+                        end += escape_cdata(tail)
+                    stack.append((children, end))
+                    children = iter(elem)
+                    break
+            if end:
+                write(end)
+            if tail:
+                write(escape_cdata(tail))
+        else:
+            if not stack:
+                return
+            children, end = stack.pop()
+            if end:
+                write(end)
 
 
 def _write_html(root,
@@ -248,11 +278,7 @@ def _namespaces(elem, default_namespace=None):
             _raise_serialization_error(qname)
 
     # populate qname and namespaces table
-    try:
-        iterate = elem.iter
-    except AttributeError:
-        iterate = elem.getiterator  # cET compatibility
-    for elem in iterate():
+    for elem in _iter_elements(elem):
         tag = elem.tag
         if isinstance(tag, QName) and tag.text not in qnames:
             add_qname(tag.text)
@@ -274,6 +300,21 @@ def _namespaces(elem, default_namespace=None):
     return qnames, namespaces
 
 
+def _iter_elements(elem):
+    # the elements of the tree in document order, as elem.iter() gives
+    # them, but without recursion
+    yield elem
+    stack = [iter(elem)]
+    while stack:
+        for elem in stack[-1]:
+            yield elem
+            if len(elem):
+                stack.append(iter(elem))
+                break
+        else:
+            stack.pop()
+
+
 def to_html_string(element):
     return _write_html(ElementTree(element).getroot(), format="html")
 
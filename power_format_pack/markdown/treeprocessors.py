@@ -7,7 +7,7 @@ from . import inlinepatterns
 
 def build_treeprocessors(md_instance, **kwargs):
     """ Build the default treeprocessors for Markdown. """
-    treeprocessors = odict.OrderedDict()
+    treeprocessors = odict.Registry()
     treeprocessors["inline"] = InlineProcessor(md_instance)
     treeprocessors["prettify"] = PrettifyTreeprocessor(md_instance)
     return treeprocessors
@@ -44,8 +44,15 @@ class Treeprocessor(util.Processor):
 class InlineProcessor(Treeprocessor):
     """
     A Treeprocessor that traverses a tree, applying inline patterns.
+
+    With `filterPatterns`, a pattern is only applied to text that contains
+    one of its required characters (see `inlinepatterns.getRequiredChars`),
+    so that most patterns are skipped without running their regular
+    expression over the text.
     """
 
+    filterPatterns = True
+
     def __init__(self, md):
         self.__placeholder_prefix = util.INLINE_PLACEHOLDER_PREFIX
         self.__placeholder_suffix = util.ETX
@@ -100,12 +107,29 @@ class InlineProcessor(Treeprocessor):
         """
         if not isinstance(data, util.AtomicString):
             startIndex = 0
-            while patternIndex < len(self.inlinePatterns):
+            chars = None
+            if isinstance(self.inlinePatterns, odict.Registry):
+                patterns = self.inlinePatterns.value_tuple()
+            else:
+                patterns = list(self.inlinePatterns.values())
+            while patternIndex < len(patterns):
+                pattern = patterns[patternIndex]
+                if self.filterPatterns:
+                    required = inlinepatterns.getRequiredChars(
+                        pattern.getCompiledRegExp())
+                    if required is not None:
+                        if chars is None:
+                            chars = set(data)
+                        if required.isdisjoint(chars):
+                            patternIndex += 1
+                            startIndex = 0
+                            continue
                 data, matched, startIndex = self.__applyPattern(
-                    self.inlinePatterns.value_for_index(patternIndex),
-                    data, patternIndex, startIndex)
+                    pattern, data, patternIndex, startIndex)
                 if not matched:
                     patternIndex += 1
+                else:
+                    chars = None
         return data
 
     def __processElementText(self, node, subnode, isText=True):
@@ -230,16 +254,33 @@ class InlineProcessor(Treeprocessor):
         Returns: String with placeholders instead of ElementTree elements.
 
         """
-        match = pattern.getCompiledRegExp().match(data[startIndex:])
-        leftData = data[:startIndex]
+        newStyle = isinstance(pattern, inlinepatterns.InlineProcessor)
+
+        if newStyle:
+            while True:
+                match = pattern.getCompiledRegExp().search(data, startIndex)
+                if not match:
+                    break
+                node, start, end = pattern.handleMatch(match, data)
+                if start is not None and end is not None:
+                    break
+                # not a match after all, search on after it
+                startIndex = max(match.end(0), match.start(0) + 1)
+        else:
+            # a Pattern matches the whole text after startIndex, with the
+            # text before and after the match in its first and last group
+            match = pattern.getCompiledRegExp().match(data[startIndex:])
+            leftData = data[:startIndex]
 
         if not match:
             return data, False, 0
 
-        node = pattern.handleMatch(match)
+        if not newStyle:
+            node = pattern.handleMatch(match)
+            end = len(leftData) + match.start(len(match.groups()))
 
         if node is None:
-            return data, True, len(leftData)+match.span(len(match.groups()))[0]
+            return data, True, end
 
         if not isString(node):
             if not isinstance(node.text, util.AtomicString):
@@ -257,6 +298,8 @@ class InlineProcessor(Treeprocessor):
 
         placeholder = self.__stashNode(node, pattern.type())
 
+        if newStyle:
+            return "%s%s%s" % (data[:start], placeholder, data[end:]), True, 0
         return "%s%s%s%s" % (leftData,
                              match.group(1),
                              placeholder, match.groups()[-1]), True, 0
@@ -23,17 +23,10 @@ from PyQt4 import QtGui
 
 import utility
 from anki.utils import json
-from power_format_pack import markdown, const
-from power_format_pack.markdown.extensions.abbr import AbbrExtension
-from power_format_pack.markdown.extensions.attr_list import AttrListExtension
-from power_format_pack.markdown.extensions.codehilite import CodeHiliteExtension
-from power_format_pack.markdown.extensions.def_list import DefListExtension
-from power_format_pack.markdown.extensions.fenced_code import FencedCodeExtension
-from power_format_pack.markdown.extensions.footnotes import FootnoteExtension
-from power_format_pack.markdown.extensions.nl2br import Nl2BrExtension
-from power_format_pack.markdown.extensions.sane_lists import SaneListExtension
-from power_format_pack.markdown.extensions.smart_strong import SmartEmphasisExtension
-from power_format_pack.markdown.extensions.tables import TableExtension
+from power_format_pack import const, profiler
+from power_format_pack.blockrenderer import BlockRenderer
+from power_format_pack.converterpool import ConverterPool
+from power_format_pack.rendercache import RenderCache
 
 
 class Markdowner(object):
@@ -43,6 +36,18 @@ class Markdowner(object):
     arise.
     """
 
+    CONVERTER_POOL = ConverterPool()
+    RENDER_CACHE = RenderCache()
+    BLOCK_RENDERER = BlockRenderer()
+    HTML_TO_MARKDOWN = utility.HtmlToMarkdown(fix_abbreviations=True)
+    HTML_TO_MARKDOWN_WITH_EMPTY_LINES = utility.HtmlToMarkdown(
+        keep_empty_lines=True, fix_abbreviations=True, add_newline_to_dd=True)
+    PROFILER = profiler.StageProfiler()
+
+    # the stages of the current operation; only recorded when profiling
+    # is enabled in the preferences
+    profile = profiler.NULL_RECORD
+
     def __init__(self, editor, parent_window, note, html, current_field, preferences):
         assert isinstance(html, unicode), "Input `html` is not Unicode"
         self.c              = preferences.CONFIG
@@ -58,61 +63,137 @@ class Markdowner(object):
         self.isconverted    = None
         self.md             = None
         self._lastmodified  = None
+        self.fingerprint    = None
+        self.unchanged      = False
+        self.has_def_list   = False
         self.has_data       = self.get_data_from_field()
 
     # compare the Markdown that we can reverse engineer from the card's HTML
     # with the Markdown stored in the data structure
     def start(self):
+        self.prepare()
+        self.apply(self.render())
+        self.save_profile()
+
+    def prepare(self):
+        """
+        Do the work that has to happen on the GUI thread before the field can
+        be rendered with `render`.
+        """
         self.backup_html = self.html
+        if self.p.get(const.MARKDOWN_PROFILING):
+            self.profile = Markdowner.PROFILER.new_record("start")
+
+        # the field did not change since it was converted, so there is no
+        # need to reverse engineer and compare the Markdown
+        with self.profile.stage("fingerprint"):
+            self.unchanged = (self.has_data and self.isconverted == "True" and
+                              self.is_unchanged())
+        if self.unchanged:
+            return
 
         # definition lists have some quirks
-        has_def_list = False
+        self.has_def_list = False
         if "<dl>" in self.html:
-            has_def_list = True
-            self.create_correct_md_for_def_list()
+            self.has_def_list = True
+            with self.profile.stage("def_list_fixup"):
+                self.create_correct_md_for_def_list()
             self.html = self.note.fields[self.current_field]
 
-        # first, we reverse engineer the Markdown from the rendered card
-        clean_md = utility.strip_html_from_markdown(self.html)
+    def render(self):
+        """
+        Work out what should happen to the field and create the HTML for it.
+        This does not touch the editor, so it can run on a worker thread.
+        Return a tuple with one of `const.MARKDOWN_CONVERT`,
+        `const.MARKDOWN_REVERT` or `const.MARKDOWN_CONFLICT` and the new HTML,
+        or `None` when there is nothing to do.
+        """
+        if self.unchanged:
+            return const.MARKDOWN_REVERT, self.get_stored_markdown_html()
 
-        if has_def_list:
-            clean_md = utility.remove_leading_whitespace_from_dd_element(clean_md)
-        clean_md = utility.remove_whitespace_before_abbreviation_definition(clean_md)
-        clean_md_escaped = utility.escape_html_chars(clean_md)
+        # first, we reverse engineer the Markdown from the rendered card
+        with self.profile.stage("html_to_markdown"):
+            clean_md = Markdowner.HTML_TO_MARKDOWN.convert(self.html, self.has_def_list)
+            clean_md_escaped = utility.escape_html_chars(clean_md)
 
         if not clean_md:
-            return
+            return None
 
         # HTML --> Markdown
         if self.has_data and self.isconverted == "True":
             # check if the stored data and the current text differ from each other
-            compare_md = self.convert_markdown_to_html(self.md)
-            # handle quirks
-            compare_md = utility.put_colons_in_html_def_list(compare_md)
-            compare_md = utility.strip_html_from_markdown(compare_md)
-            if has_def_list:
-                compare_md = utility.remove_leading_whitespace_from_dd_element(compare_md)
-            compare_md = utility.remove_whitespace_before_abbreviation_definition(compare_md)
-
-            # escape HTML if we haven't done so already
-            if not any(x in compare_md for x in("&amp;", "&quot;", "&apos;", "&gt;", "&lt;")):
-                compare_md = utility.escape_html_chars(compare_md)
-            if utility.is_same_markdown(clean_md_escaped, compare_md) or self.p.get(const.MARKDOWN_ALWAYS_REVERT):
-                self.revert_to_stored_markdown()
-            else:
-                self.handle_conflict()
+            with self.profile.stage("compare"):
+                compare_md = self.convert_markdown_to_html(self.md)
+                # handle quirks
+                compare_md = utility.put_colons_in_html_def_list(compare_md)
+                with self.profile.stage("html_to_markdown"):
+                    compare_md = Markdowner.HTML_TO_MARKDOWN.convert(compare_md, self.has_def_list)
+
+                # escape HTML if we haven't done so already
+                if not any(x in compare_md for x in("&amp;", "&quot;", "&apos;", "&gt;", "&lt;")):
+                    compare_md = utility.escape_html_chars(compare_md)
+                is_same = utility.is_same_markdown(clean_md_escaped, compare_md)
+            if is_same or self.p.get(const.MARKDOWN_ALWAYS_REVERT):
+                return const.MARKDOWN_REVERT, self.get_stored_markdown_html()
+            return const.MARKDOWN_CONFLICT, None
 
         # Markdown --> HTML
-        else:
-            new_html = self.convert_markdown_to_html(clean_md)
-            # needed for proper display of images
-            if "<img" in new_html:
-                new_html = utility.unescape_html(new_html)
+        new_html = self.convert_markdown_to_html(clean_md)
+        # needed for proper display of images
+        if "<img" in new_html:
+            new_html = utility.unescape_html(new_html)
+        with self.profile.stage("insert_md_data"):
             html_with_data = utility.insert_md_data(self.note_id_field, "True", clean_md_escaped, new_html)
-            self.insert_into_field(html_with_data, self.current_field)
+        return const.MARKDOWN_CONVERT, html_with_data
 
+    def apply(self, result):
+        """
+        Put the outcome of `render` in the field. Must be called on the GUI
+        thread.
+        """
+        if result is None:
+            return
+        action, new_html = result
+        if action == const.MARKDOWN_REVERT:
+            self.revert_to_stored_markdown(new_html)
+        elif action == const.MARKDOWN_CONFLICT:
+            self.handle_conflict()
+        else:
+            with self.profile.stage("insert_into_field"):
+                self.insert_into_field(new_html, self.current_field)
             # resolve quirks
-            self.align_elements()
+            with self.profile.stage("align_elements"):
+                self.align_elements()
+
+    def save_profile(self):
+        """
+        Write the stages of the current operation to the profile log.
+        """
+        Markdowner.PROFILER.save(self.profile)
+        self.profile = profiler.NULL_RECORD
+
+    def is_current(self):
+        """
+        Return True when the editor still shows the note this instance was
+        created for, so that the result of `render` can be applied.
+        """
+        return self.editor.note is not None and self.editor.note.id == self.note.id
+
+    def show_rendering_state(self):
+        """
+        Mark the field as busy and keep the user from editing it while it is
+        rendered in the background.
+        """
+        self.editor.web.eval("""
+            $('#f%s').attr('contenteditable', 'false').addClass('mdrendering')
+                .css({'opacity': '%s', 'cursor': 'progress'});
+        """ % (self.current_field, const.MARKDOWN_RENDERING_OPACITY))
+
+    def hide_rendering_state(self):
+        self.editor.web.eval("""
+            $('#f%s.mdrendering').attr('contenteditable', 'true').removeClass('mdrendering')
+                .css({'opacity': '', 'cursor': ''});
+        """ % self.current_field)
 
     def get_data_from_field(self):
         """
@@ -132,9 +213,20 @@ class Markdowner(object):
             self.md             = md_dict.get("md")
             self.isconverted    = md_dict.get("isconverted")
             self._lastmodified  = md_dict.get("lastmodified")
+            self.fingerprint    = md_dict.get("fp")
             return True
         return False
 
+    def is_unchanged(self):
+        """
+        Return True when the fingerprint of the HTML in the field is the same
+        as the fingerprint that was stored when the field was converted.
+        Data stored without a fingerprint is never considered unchanged.
+        """
+        if not self.fingerprint:
+            return False
+        return self.fingerprint == utility.get_html_fingerprint(self.html)
+
     def insert_into_field(self, markup, field):
         """
         Put markup in the specified field.
@@ -147,7 +239,7 @@ class Markdowner(object):
     def manage_style(editor, field_no):
         editor.web.eval("""
             var field = $('#f%s');
-            if (field.html().indexOf('SBAdata:') > -1) {
+            if (%s.test(field.html())) {
                 var mdstyleExists = false;
                 var mdwarningExists = false;
                 for (var i = 0, j = document.styleSheets.length; i < j; i++) {
@@ -168,7 +260,7 @@ class Markdowner(object):
                     document.styleSheets.item(0).insertRule('.mdwarning { margin: 10px 0px; }', 0);
                 }
             }
-        """ % (field_no, const.MARKDOWN_BG_COLOR))
+        """ % (field_no, const.HTML_MARKER_JS_REGEX, const.MARKDOWN_BG_COLOR))
 
     def add_warning_msg(self, editor_instance, field_no):
         # make sure the .mdwarn CSS class exists
@@ -211,23 +303,36 @@ class Markdowner(object):
         """
         Create new Markdown from the current HTML.
         """
-        clean_md = utility.strip_html_from_markdown(self.html, keep_empty_lines=True)
-        clean_md = utility.remove_whitespace_before_abbreviation_definition(clean_md)
-        if "<dl" in self.html:
-            clean_md = utility.remove_leading_whitespace_from_dd_element(clean_md, add_newline=True)
-        if re.search(const.IS_LINK_OR_IMG_REGEX, clean_md):
-            clean_md = utility.escape_html_chars(clean_md)
-        new_html = utility.convert_clean_md_to_html(clean_md, put_breaks=True)
-        self.insert_into_field(new_html, self.current_field)
-        self.remove_warn_msg(self.editor, self.current_field)
-
-    def revert_to_stored_markdown(self):
+        with self.profile.stage("overwrite_stored_data"):
+            with self.profile.stage("html_to_markdown"):
+                clean_md = Markdowner.HTML_TO_MARKDOWN_WITH_EMPTY_LINES.convert(self.html, "<dl" in self.html)
+            if re.search(const.IS_LINK_OR_IMG_REGEX, clean_md):
+                clean_md = utility.escape_html_chars(clean_md)
+            with self.profile.stage("clean_md_to_html"):
+                new_html = utility.convert_clean_md_to_html(clean_md, put_breaks=True)
+            with self.profile.stage("insert_into_field"):
+                self.insert_into_field(new_html, self.current_field)
+                self.remove_warn_msg(self.editor, self.current_field)
+
+    def revert_to_stored_markdown(self, new_html=None):
         """
         Revert to the previous version of Markdown that was stored in the field.
+        `new_html` is the result of `get_stored_markdown_html`, when it was
+        already computed.
+        """
+        with self.profile.stage("revert_to_stored_markdown"):
+            if new_html is None:
+                new_html = self.get_stored_markdown_html()
+            with self.profile.stage("insert_into_field"):
+                self.insert_into_field(new_html, self.current_field)
+                self.remove_warn_msg(self.editor, self.current_field)
+
+    def get_stored_markdown_html(self):
+        """
+        Return the HTML that shows the stored Markdown as plain text.
         """
-        new_html = utility.convert_clean_md_to_html(self.md, put_breaks=True)
-        self.insert_into_field(new_html, self.current_field)
-        self.remove_warn_msg(self.editor, self.current_field)
+        with self.profile.stage("clean_md_to_html"):
+            return utility.convert_clean_md_to_html(self.md, put_breaks=True)
 
     def show_overwrite_warning(self):
         """
@@ -313,22 +418,13 @@ class Markdowner(object):
 
         assert isinstance(clean_md, unicode), "Input `clean_md` is not Unicode"
 
-        new_html = markdown.markdown(clean_md, output_format="xhtml1",
-            extensions=[
-                SmartEmphasisExtension(),
-                FencedCodeExtension(),
-                FootnoteExtension(),
-                AttrListExtension(),
-                DefListExtension(),
-                TableExtension(),
-                AbbrExtension(),
-                Nl2BrExtension(),
-                CodeHiliteExtension(
-                    noclasses=not self.p.get(const.MARKDOWN_CLASSFUL_PYGMENTS),
-                    pygments_style=self.p.get(const.MARKDOWN_SYNTAX_STYLE),
-                    linenums=self.p.get(const.MARKDOWN_LINE_NUMS)),
-                SaneListExtension()
-            ], lazy_ol=False)
+        prefs_key = ConverterPool.get_key(self.p)
+        with self.profile.stage("markdown_to_html"):
+            new_html = Markdowner.RENDER_CACHE.get(clean_md, prefs_key)
+            if new_html is None:
+                new_html, degraded = Markdowner.CONVERTER_POOL.render(self.p, clean_md, Markdowner.BLOCK_RENDERER)
+                if not degraded:
+                    Markdowner.RENDER_CACHE.put(clean_md, prefs_key, new_html)
 
         assert isinstance(new_html, unicode)
 
@@ -24,6 +24,7 @@ from PyQt4 import QtGui, QtCore, QtWebKit
 import const
 import preferences
 import utility
+from markdowner import Markdowner
 from power_format_pack.qt.controllers.keybindings import FormKeyBindings
 from prefhelper import PrefHelper
 
@@ -106,8 +107,15 @@ class Options(QtGui.QMenu):
             triggered=self.show_about_dialog
         )
 
+        profile_summary_action = QtGui.QAction(
+            self.c.get(const.CONFIG_MENU_NAMES, "profile_summary_action"),
+            self.main_window,
+            triggered=self.show_profile_summary_dialog
+        )
+
         sub_menu.addAction(options_action)
         sub_menu.addAction(keybindings_action)
+        sub_menu.addAction(profile_summary_action)
         sub_menu.addAction(doc_action)
         sub_menu.addAction(about_action)
 
@@ -148,6 +156,24 @@ class Options(QtGui.QMenu):
                                 self.c.get(const.CONFIG_WINDOW_TITLES, "about"),
                                 self.c.get(const.CONFIG_ABOUT, "about"))
 
+    def show_profile_summary_dialog(self):
+        summary = Markdowner.PROFILER.summary()
+        if not summary:
+            text = self.c.get(const.CONFIG_WARNINGS, "profile_summary_empty")
+        else:
+            rows = u"".join(
+                u"<tr><td>{}</td><td align=right>{}</td><td align=right>{:.1f}</td>"
+                u"<td align=right>{:.1f}</td><td align=right>{}</td><td align=right>{}</td></tr>".format(
+                    stage, values["count"], values["p50_ms"], values["p95_ms"],
+                    values["p50_kb"], values["p95_kb"])
+                for stage, values in summary.iteritems())
+            text = (u"<table cellspacing=6><tr><th align=left>Stage</th><th>Count</th>"
+                    u"<th>p50 ms</th><th>p95 ms</th><th>p50 KB</th><th>p95 KB</th></tr>"
+                    u"{}</table>".format(rows))
+        QtGui.QMessageBox.information(self.main_window,
+                                      self.c.get(const.CONFIG_WINDOW_TITLES, "profile_summary"),
+                                      text)
+
     def enable_radio_buttons(self, checkbox, radiobuttons, prefname):
         if checkbox.isChecked():
             # enable radio buttons
@@ -253,6 +279,14 @@ class Options(QtGui.QMenu):
 
         return self.put_elems_in_box((cb,), const.HBOX, const.WIDGET)
 
+    def markdown_profiling_option(self):
+        cb = self.create_checkbox(const.MARKDOWN_PROFILING,
+                                  None,
+                                  self.c.get(const.CONFIG_LABELS, "markdown_profiling_label"))
+        utility.set_tool_tip(cb, self.c.get(const.CONFIG_TOOLTIPS, "markdown_profiling_tooltip"))
+
+        return self.put_elems_in_box((cb,), const.HBOX, const.WIDGET)
+
     def markdown_linenums_option(self):
         linenums_cb = self.create_checkbox(const.MARKDOWN_LINE_NUMS,
                                            None,
@@ -361,6 +395,9 @@ class Options(QtGui.QMenu):
         # and skip the warning dialog
         md_vbox.addLayout(self.markdown_skip_warning_option())
 
+        # option to record the timings of toggling Markdown
+        md_vbox.addLayout(self.markdown_profiling_option())
+
         md_vbox.setSpacing(self.c.getint(const.CONFIG_QT, "spacing_buttons"))
 
         md_groupbox = QtGui.QGroupBox(self.c.get(const.CONFIG_LABELS, "md_groupbox"), self)
@@ -389,6 +426,7 @@ class Options(QtGui.QMenu):
                                                    const.MARKDOWN_SYNTAX_STYLE,
                                                    const.MARKDOWN_LINE_NUMS,
                                                    const.MARKDOWN_ALWAYS_REVERT,
+                                                   const.MARKDOWN_PROFILING,
                                                    const.MARKDOWN_CODE_DIRECTION,
                                                    const.BUTTON_PLACEMENT,
                                                    const.MARKDOWN_OVERRIDE_EDITING,
@@ -45,6 +45,34 @@ class PrefHelper(object):
                             c.get(const.CONFIG_DEFAULT, "FOLDER_NAME"),
                             c.get(const.CONFIG_FILENAMES, "PREFERENCES_FILENAME"))
 
+    @staticmethod
+    def get_render_cache_path():
+        c = PrefHelper.get_config()
+        return os.path.join(PrefHelper.get_addons_folder(),
+                            c.get(const.CONFIG_DEFAULT, "FOLDER_NAME"),
+                            c.get(const.CONFIG_FILENAMES, "RENDER_CACHE_FILENAME"))
+
+    @staticmethod
+    def get_profile_log_path():
+        c = PrefHelper.get_config()
+        return os.path.join(PrefHelper.get_addons_folder(),
+                            c.get(const.CONFIG_DEFAULT, "FOLDER_NAME"),
+                            c.get(const.CONFIG_FILENAMES, "PROFILE_LOG_FILENAME"))
+
+    @staticmethod
+    def get_token_cache_path():
+        c = PrefHelper.get_config()
+        return os.path.join(PrefHelper.get_addons_folder(),
+                            c.get(const.CONFIG_DEFAULT, "FOLDER_NAME"),
+                            c.get(const.CONFIG_FILENAMES, "TOKEN_CACHE_DIRNAME"))
+
+    @staticmethod
+    def get_highlight_watchdog_path():
+        c = PrefHelper.get_config()
+        return os.path.join(PrefHelper.get_addons_folder(),
+                            c.get(const.CONFIG_DEFAULT, "FOLDER_NAME"),
+                            c.get(const.CONFIG_FILENAMES, "HIGHLIGHT_WATCHDOG_FILENAME"))
+
     @staticmethod
     def get_keybindings_path():
         c = PrefHelper.get_config()
@@ -105,6 +133,7 @@ class PrefHelper(object):
                 const.MARKDOWN_CODE_DIRECTION:      "left",
                 const.MARKDOWN_LINE_NUMS:           False,
                 const.MARKDOWN_ALWAYS_REVERT:       False,
+                const.MARKDOWN_PROFILING:           False,
                 const.MARKDOWN_OVERRIDE_EDITING:    True,
                 const.MARKDOWN_CLASSFUL_PYGMENTS:   False,
                 const.BUTTON_PLACEMENT:             "adjacent",
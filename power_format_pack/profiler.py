@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014-2017 Stefan van den Akker <neftas@protonmail.com>
+#
+# This file is part of Power Format Pack.
+#
+# Power Format Pack is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Power Format Pack is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Power Format Pack. If not, see http://www.gnu.org/licenses/.
+
+import codecs
+import collections
+import contextlib
+import json
+import math
+import os
+import threading
+import time
+import timeit
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+from power_format_pack import const
+
+
+def get_memory_usage():
+    """
+    Return the resident memory of this process in kilobytes. Where the
+    current value is not available, the peak value is returned, and when
+    neither is available, 0.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * (os.sysconf("SC_PAGE_SIZE") // 1024)
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def get_percentile(values, percentile):
+    """
+    Return the `percentile` (0-100) of the sorted list `values`, using the
+    nearest rank.
+
+    >>> get_percentile([1, 2, 3, 4], 50)
+    2
+    """
+    if not values:
+        return None
+    rank = int(math.ceil(percentile / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+class ProfileRecord(object):
+    """
+    The wall time (in milliseconds) and the change in resident memory (in
+    kilobytes) of the stages of one operation. Stages can be nested; the
+    name of a nested stage is prefixed with the names of the stages around
+    it, separated by slashes.
+    """
+
+    def __init__(self, operation):
+        self.operation  = operation
+        self.time       = time.time()
+        self.stages     = collections.OrderedDict()
+        self._names     = list()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self._names.append(name)
+        key = "/".join(self._names)
+        memory = get_memory_usage()
+        start = timeit.default_timer()
+        try:
+            yield
+        finally:
+            elapsed = (timeit.default_timer() - start) * 1000
+            self._names.pop()
+            ms, kb = self.stages.get(key, (0.0, 0))
+            self.stages[key] = (ms + elapsed, kb + get_memory_usage() - memory)
+
+    def to_dict(self):
+        return {
+            "operation": self.operation,
+            "time": self.time,
+            "stages": collections.OrderedDict(
+                (key, {"ms": round(ms, 3), "kb": kb}) for key, (ms, kb) in self.stages.iteritems())
+        }
+
+
+class NullProfileRecord(object):
+    """
+    A `ProfileRecord` that records nothing, used when profiling is off.
+    """
+
+    operation = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        yield
+
+
+NULL_RECORD = NullProfileRecord()
+
+
+class StageProfiler(object):
+    """
+    Keep a rolling log of `ProfileRecord`s in a JSON lines file. When the
+    file holds more than twice `max_records` records, only the last
+    `max_records` are kept.
+    """
+
+    def __init__(self, path=None, max_records=const.PROFILE_MAX_RECORDS):
+        self.path           = path
+        self.max_records    = max_records
+        self._lock          = threading.Lock()
+        self._count         = None
+
+    def set_path(self, path):
+        with self._lock:
+            self.path = path
+            self._count = None
+
+    @staticmethod
+    def new_record(operation):
+        return ProfileRecord(operation)
+
+    def save(self, record):
+        """
+        Append `record` to the log. Records without stages are ignored.
+        """
+        if not self.path or not getattr(record, "stages", None):
+            return
+        with self._lock:
+            if self._count is None:
+                self._count = len(self._read_lines())
+            try:
+                with codecs.open(self.path, "a", encoding="utf8") as f:
+                    f.write(json.dumps(record.to_dict()) + u"\n")
+                self._count += 1
+                if self._count > 2 * self.max_records:
+                    lines = self._read_lines()[-self.max_records:]
+                    with codecs.open(self.path, "w", encoding="utf8") as f:
+                        f.writelines(lines)
+                    self._count = len(lines)
+            except (IOError, OSError) as e:
+                print e  # TODO: should be logged
+
+    def load(self):
+        """
+        Return the records in the log as dictionaries, skipping lines that
+        cannot be read.
+        """
+        with self._lock:
+            lines = self._read_lines()
+        records = list()
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records
+
+    def summary(self):
+        """
+        Return an ordered dictionary with, for every stage in the log, the
+        number of records and the 50th and 95th percentile of the wall time
+        in milliseconds and of the change in memory in kilobytes.
+        """
+        times = collections.OrderedDict()
+        memory = collections.defaultdict(list)
+        for record in self.load():
+            for key, values in record.get("stages", dict()).iteritems():
+                times.setdefault(key, list()).append(values.get("ms", 0.0))
+                memory[key].append(values.get("kb", 0))
+        result = collections.OrderedDict()
+        for key, values in times.iteritems():
+            values.sort()
+            kbs = sorted(memory[key])
+            result[key] = {
+                "count": len(values),
+                "p50_ms": get_percentile(values, 50),
+                "p95_ms": get_percentile(values, 95),
+                "p50_kb": get_percentile(kbs, 50),
+                "p95_kb": get_percentile(kbs, 95)
+            }
+        return result
+
+    def _read_lines(self):
+        if not self.path or not os.path.exists(self.path):
+            return list()
+        try:
+            with codecs.open(self.path, encoding="utf8") as f:
+                return [line for line in f if line.strip()]
+        except (IOError, OSError):
+            return list()
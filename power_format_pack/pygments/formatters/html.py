@@ -42,6 +42,11 @@ def escape_html(text, table=_escape_html_table):
     return text.translate(table)
 
 
+#: the compiled style sheets, keyed on the formatter class, the style class
+#: and the class prefix
+_stylesheets = {}
+
+
 def _get_ttype_class(ttype):
     fname = STANDARD_TYPES.get(ttype)
     if fname:
@@ -54,6 +59,62 @@ def _get_ttype_class(ttype):
     return fname + aname
 
 
+class _StyleSheet(object):
+    """
+    The CSS classes and styles of a style, compiled once and shared by all
+    formatters with the same style and class prefix. The start tags of the
+    spans of token types are added as they are needed.
+    """
+
+    def __init__(self, formatter):
+        t2c = self.ttype2class = {Token: ''}
+        c2s = self.class2style = {}
+        for ttype, ndef in formatter.style:
+            name = formatter._get_css_class(ttype)
+            style = ''
+            if ndef['color']:
+                style += 'color: #%s; ' % ndef['color']
+            if ndef['bold']:
+                style += 'font-weight: bold; '
+            if ndef['italic']:
+                style += 'font-style: italic; '
+            if ndef['underline']:
+                style += 'text-decoration: underline; '
+            if ndef['bgcolor']:
+                style += 'background-color: #%s; ' % ndef['bgcolor']
+            if ndef['border']:
+                style += 'border: 1px solid #%s; ' % ndef['border']
+            if style:
+                t2c[ttype] = name
+                # save len(ttype) to enable ordering the styles by
+                # hierarchy (necessary for CSS cascading rules!)
+                c2s[name] = (style[:-2], ttype, len(ttype))
+        self.style_spans = {}
+        self.class_spans = {}
+        self.style_defs = {}
+
+    def get_style_span(self, ttype):
+        """Return the start tag of a span with the inline style of ttype."""
+        span = self.style_spans.get(ttype)
+        if span is None:
+            cclass = self.ttype2class.get(ttype)
+            parent = ttype
+            while cclass is None:
+                parent = parent.parent
+                cclass = self.ttype2class.get(parent)
+            span = self.style_spans[ttype] = (
+                cclass and '<span style="%s">' % self.class2style[cclass][0] or '')
+        return span
+
+    def get_class_span(self, formatter, ttype):
+        """Return the start tag of a span with the css classes of ttype."""
+        span = self.class_spans.get(ttype)
+        if span is None:
+            cls = formatter._get_css_classes(ttype)
+            span = self.class_spans[ttype] = cls and '<span class="%s">' % cls or ''
+        return span
+
+
 CSSFILE_TEMPLATE = '''\
 td.linenos { background-color: #f0f0f0; padding-right: 10px; }
 span.lineno { background-color: #f0f0f0; padding: 0 5px 0 5px; }
@@ -438,28 +499,13 @@ class HtmlFormatter(Formatter):
         return cls
 
     def _create_stylesheet(self):
-        t2c = self.ttype2class = {Token: ''}
-        c2s = self.class2style = {}
-        for ttype, ndef in self.style:
-            name = self._get_css_class(ttype)
-            style = ''
-            if ndef['color']:
-                style += 'color: #%s; ' % ndef['color']
-            if ndef['bold']:
-                style += 'font-weight: bold; '
-            if ndef['italic']:
-                style += 'font-style: italic; '
-            if ndef['underline']:
-                style += 'text-decoration: underline; '
-            if ndef['bgcolor']:
-                style += 'background-color: #%s; ' % ndef['bgcolor']
-            if ndef['border']:
-                style += 'border: 1px solid #%s; ' % ndef['border']
-            if style:
-                t2c[ttype] = name
-                # save len(ttype) to enable ordering the styles by
-                # hierarchy (necessary for CSS cascading rules!)
-                c2s[name] = (style[:-2], ttype, len(ttype))
+        key = (type(self), self.style, self.classprefix)
+        stylesheet = _stylesheets.get(key)
+        if stylesheet is None:
+            stylesheet = _stylesheets[key] = _StyleSheet(self)
+        self._stylesheet = stylesheet
+        self.ttype2class = stylesheet.ttype2class
+        self.class2style = stylesheet.class2style
 
     def get_style_defs(self, arg=None):
         """
@@ -473,6 +519,15 @@ class HtmlFormatter(Formatter):
             args = [arg]
         else:
             args = list(arg)
+        key = (tuple(args), bool(arg) and not self.nobackground)
+        style_defs = self._stylesheet.style_defs.get(key)
+        if style_defs is None:
+            style_defs = self._stylesheet.style_defs[key] = \
+                self._get_style_defs(args, key[1])
+        return style_defs
+
+    def _get_style_defs(self, args, background):
+        """Return the CSS style definitions for the selectors ``args``."""
 
         def prefix(cls):
             if cls:
@@ -488,8 +543,7 @@ class HtmlFormatter(Formatter):
         styles.sort()
         lines = ['%s { %s } /* %s */' % (prefix(cls), style, repr(ttype)[6:])
                  for (level, ttype, cls, style) in styles]
-        if arg and not self.nobackground and \
-           self.style.background_color is not None:
+        if background and self.style.background_color is not None:
             text_style = ''
             if Text in self.ttype2class:
                 text_style = ' ' + self.class2style[self.ttype2class[Text]][0]
@@ -704,9 +758,9 @@ class HtmlFormatter(Formatter):
         """
         nocls = self.noclasses
         lsep = self.lineseparator
-        # for <span style=""> lookup only
-        getcls = self.ttype2class.get
-        c2s = self.class2style
+        stylesheet = self._stylesheet
+        style_spans = stylesheet.style_spans
+        class_spans = stylesheet.class_spans
         escape_table = _escape_html_table
         tagsfile = self.tagsfile
 
@@ -714,14 +768,13 @@ class HtmlFormatter(Formatter):
         line = ''
         for ttype, value in tokensource:
             if nocls:
-                cclass = getcls(ttype)
-                while cclass is None:
-                    ttype = ttype.parent
-                    cclass = getcls(ttype)
-                cspan = cclass and '<span style="%s">' % c2s[cclass][0] or ''
+                cspan = style_spans.get(ttype)
+                if cspan is None:
+                    cspan = stylesheet.get_style_span(ttype)
             else:
-                cls = self._get_css_classes(ttype)
-                cspan = cls and '<span class="%s">' % cls or ''
+                cspan = class_spans.get(ttype)
+                if cspan is None:
+                    cspan = stylesheet.get_class_span(self, ttype)
 
             parts = value.translate(escape_table).split('\n')
 
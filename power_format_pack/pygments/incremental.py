@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+    pygments.incremental
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Lex a text again after an edit, without lexing all of it again.
+
+    ``lex`` keeps the state stack of the lexer at the start of every line it
+    reaches (a checkpoint). ``relex`` finds the part of the text that was
+    edited, resumes lexing from the last checkpoint before it and stops as
+    soon as it arrives at a checkpoint after it where the state stack is the
+    same as in the previous run; from there on, the tokens of the previous
+    run are reused.
+
+    The result is the same as lexing the whole text, unless a rule that
+    failed to match before the edit looked at the text after it. To make
+    that unlikely, lexing resumes at least two lines before the edited line,
+    and from the start when the previous run had an error token before it,
+    since that is how a string or comment without an end usually shows.
+
+    Only lexers that use ``RegexLexer.get_tokens_unprocessed`` as it is,
+    without filters, can be lexed incrementally.
+
+    :copyright: Copyright 2006-2015 by the Pygments team, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+"""
+
+from bisect import bisect_right
+
+from pygments.lexer import RegexLexer
+from pygments.token import Error
+
+__all__ = ['LexedText', 'can_lex', 'lex', 'relex', 'get_tokens',
+           'get_common_length']
+
+
+class LexedText(object):
+    """
+    The tokens of ``text`` as ``(index, tokentype, value)`` tuples, with the
+    checkpoints as ``(index, stack, number of tokens before index)`` and the
+    index of the first error token (the length of the text when there is
+    none).
+    """
+
+    def __init__(self, text, tokens, checkpoints, first_error):
+        self.text = text
+        self.tokens = tokens
+        self.checkpoints = checkpoints
+        self.first_error = first_error
+        self.relexed_tokens = len(tokens)
+        self._positions = None
+        self._index = None
+
+    def get_positions(self):
+        if self._positions is None:
+            self._positions = [checkpoint[0] for checkpoint in self.checkpoints]
+        return self._positions
+
+    def find_checkpoint(self, pos, stack):
+        """Return the number of the first checkpoint at ``pos`` with state
+        stack ``stack``, or None when there is none."""
+        if self._index is None:
+            self._index = {}
+            # a state change that matches nothing can add a checkpoint at
+            # the same position; lexing goes on from the first one
+            for number, (index, stack_, _) in enumerate(self.checkpoints):
+                self._index.setdefault((index, stack_), number)
+        return self._index.get((pos, stack))
+
+
+def can_lex(lexer):
+    """Return whether ``lexer`` can be lexed incrementally."""
+    method = getattr(type(lexer).get_tokens_unprocessed, '__func__',
+                     type(lexer).get_tokens_unprocessed)
+    return (isinstance(lexer, RegexLexer) and not lexer.filters and
+            method is getattr(RegexLexer.get_tokens_unprocessed, '__func__',
+                              RegexLexer.get_tokens_unprocessed))
+
+
+def lex(lexer, text, watch=None):
+    """
+    Lex ``text``, which ``Lexer._preprocess_text`` was applied to.
+    ``watch`` is None, or a function that is given the stream of tokens of
+    the lexer and returns a stream of the same tokens; it can stop lexing
+    by raising an exception.
+    """
+    return _lex_from(lexer, text, [], [(0, ('root',), 0)], len(text), None,
+                     watch)
+
+
+def relex(lexer, previous, text, context=2, watch=None):
+    """
+    Lex ``text``, an edited version of the text of the ``LexedText``
+    ``previous``, reusing the tokens of ``previous`` where possible.
+    ``watch`` is as for ``lex``.
+    """
+    old = previous.text
+    if old == text:
+        lexed = LexedText(text, previous.tokens, previous.checkpoints,
+                          previous.first_error)
+        lexed.relexed_tokens = 0
+        return lexed
+    prefix, suffix = _get_common_lengths(old, text)
+    # resume from the start of the line ``context`` lines before the edited
+    # line, or earlier
+    resume_limit = prefix
+    for _ in range(context + 1):
+        resume_limit = old.rfind('\n', 0, max(resume_limit - 1, 0)) + 1
+    if previous.first_error < resume_limit:
+        # an error often means that a rule found no end, e.g. of a string,
+        # and the edit may have added it
+        resume_limit = 0
+    index = bisect_right(previous.get_positions(), resume_limit) - 1
+    pos, stack, count = previous.checkpoints[index]
+    first_error = previous.first_error if previous.first_error < pos else len(text)
+    converge = (len(text) - suffix, len(text) - len(old), previous)
+    return _lex_from(lexer, text, previous.tokens[:count],
+                     previous.checkpoints[:index + 1], first_error, converge,
+                     watch, pos, stack)
+
+
+def get_common_length(old, text):
+    """Return the length of the start and end that two texts share."""
+    return sum(_get_common_lengths(old, text))
+
+
+def get_tokens(lexed):
+    """Return the ``(tokentype, value)`` pairs of ``lexed``, as
+    ``Lexer.get_tokens`` does."""
+    return ((tokentype, value) for _, tokentype, value in lexed.tokens)
+
+
+def _lex_from(lexer, text, tokens, checkpoints, first_error, converge, watch,
+              pos=0, stack=('root',)):
+    """
+    Lex ``text`` from ``pos`` on, adding to ``tokens`` and ``checkpoints``.
+    ``first_error`` is the index of the first error token in ``tokens``.
+    ``converge`` is None, or the end of the edit, the change in length and
+    the previous ``LexedText``, to stop once lexing arrives at a checkpoint
+    of the previous run.
+    """
+    start = len(tokens)
+    stream = lexer._lex(text, pos, stack, True)
+    if watch is not None:
+        stream = watch(stream)
+    for index, tokentype, value in stream:
+        if tokentype is not None:
+            tokens.append((index, tokentype, value))
+            if index < first_error and tokentype in Error:
+                first_error = index
+            continue
+        checkpoints.append((index, value, len(tokens)))
+        if converge is None or index <= converge[0]:
+            continue
+        edit_end, delta, previous = converge
+        number = previous.find_checkpoint(index - delta, value)
+        if number is None:
+            continue
+        count = previous.checkpoints[number][2]
+        if (first_error == len(text) and
+                index - delta <= previous.first_error < len(previous.text)):
+            first_error = previous.first_error + delta
+        lexed = LexedText(text, tokens, checkpoints, first_error)
+        lexed.relexed_tokens = len(tokens) - start
+        tokens.extend((i + delta, t, v) for i, t, v in previous.tokens[count:])
+        checkpoints.extend((i + delta, s, c - count + lexed.relexed_tokens + start)
+                           for i, s, c in previous.checkpoints[number + 1:])
+        return lexed
+    lexed = LexedText(text, tokens, checkpoints, first_error)
+    lexed.relexed_tokens = len(tokens) - start
+    return lexed
+
+
+def _get_common_lengths(a, b):
+    prefix = _common_prefix_length(a, b)
+    suffix = _common_suffix_length(a, b, len(a) - prefix, len(b) - prefix)
+    return prefix, suffix
+
+
+def _common_prefix_length(a, b):
+    n = min(len(a), len(b))
+    low, high = 0, n
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix_length(a, b, max_a, max_b):
+    n = min(max_a, max_b)
+    low, high = 0, n
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:] == b[len(b) - middle:]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
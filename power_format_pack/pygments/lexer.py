@@ -22,6 +22,7 @@ from pygments.token import Error, Text, Other, _TokenType
 from pygments.util import get_bool_opt, get_int_opt, get_list_opt, \
     make_analysator, text_type, add_metaclass, iteritems, Future, guess_decode
 from pygments.regexopt import regex_opt
+from pygments.tokencache import TOKEN_CACHE
 
 __all__ = ['Lexer', 'RegexLexer', 'ExtendedRegexLexer', 'DelegatingLexer',
            'LexerContext', 'include', 'inherit', 'bygroups', 'using', 'this',
@@ -36,6 +37,12 @@ _encoding_map = [(b'\xef\xbb\xbf', 'utf-8'),
 
 _default_analyse = staticmethod(lambda x: 0.0)
 
+# the number of groups that a regular expression may have in Python 2
+_MAX_GROUPS = 99
+# references to groups, which would point elsewhere once the groups of a
+# regular expression are renumbered
+_GROUP_REFERENCE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
 
 class LexerMeta(type):
     """
@@ -146,6 +153,21 @@ class Lexer(object):
         Also preprocess the text, i.e. expand tabs and strip it if
         wanted and applies registered filters.
         """
+        text = self._preprocess_text(text)
+
+        def streamer():
+            for i, t, v in self.get_tokens_unprocessed(text):
+                yield t, v
+        stream = streamer()
+        if not unfiltered:
+            stream = apply_filters(stream, self.filters, self)
+        return stream
+
+    def _preprocess_text(self, text):
+        """
+        Decode ``text`` and normalize its newlines, strip it and expand its
+        tabs as the options of the lexer say.
+        """
         if not isinstance(text, text_type):
             if self.encoding == 'guess':
                 text, _ = guess_decode(text)
@@ -187,14 +209,7 @@ class Lexer(object):
             text = text.expandtabs(self.tabsize)
         if self.ensurenl and not text.endswith('\n'):
             text += '\n'
-
-        def streamer():
-            for i, t, v in self.get_tokens_unprocessed(text):
-                yield t, v
-        stream = streamer()
-        if not unfiltered:
-            stream = apply_filters(stream, self.filters, self)
-        return stream
+        return text
 
     def get_tokens_unprocessed(self, text):
         """
@@ -424,8 +439,8 @@ class RegexLexerMeta(LexerMeta):
     def _process_regex(cls, regex, rflags, state):
         """Preprocess the regular expression component of a token definition."""
         if isinstance(regex, Future):
-            regex = regex.get()
-        return re.compile(regex, rflags).match
+            regex = TOKEN_CACHE.expand(cls.__module__, regex)
+        return TOKEN_CACHE.compile(cls.__module__, regex, rflags).match
 
     def _process_token(cls, token):
         """Preprocess the token component of a token definition."""
@@ -518,6 +533,7 @@ class RegexLexerMeta(LexerMeta):
         tokendefs = tokendefs or cls.tokens[name]
         for state in list(tokendefs):
             cls._process_state(tokendefs, processed, state)
+        TOKEN_CACHE.save()
         return processed
 
     def get_tokendefs(cls):
@@ -569,10 +585,84 @@ class RegexLexerMeta(LexerMeta):
 
         return tokens
 
+    def get_dispatch_tokendefs(cls, tokendefs, merge):
+        """
+        Return the states of the preprocessed token definitions `tokendefs`
+        as lists of ``(rexmatch, rules, action, new_state)``, in which the
+        rules are merged when `merge` is true. The states are merged when
+        they are first used.
+        """
+        key = (id(tokendefs), merge)
+        states = cls._dispatch_tokens.get(key)
+        if states is None or states.tokendefs is not tokendefs:
+            states = cls._dispatch_tokens[key] = _DispatchStates(cls, tokendefs, merge)
+        return states
+
+    def _get_mergeable_pattern(cls, rexmatch):
+        """
+        Return the compiled regex of `rexmatch` when it can be merged with the
+        other rules of its state, else None. It cannot be merged when it has
+        flags of its own, named groups or references to its groups.
+        """
+        pattern = getattr(rexmatch, '__self__', None)
+        if not hasattr(pattern, 'groupindex') or cls.flags & re.VERBOSE:
+            return None
+        if pattern.flags != re.compile('', cls.flags).flags or pattern.groupindex:
+            return None
+        if _GROUP_REFERENCE.search(pattern.pattern):
+            return None
+        return pattern
+
+    def _merge_state(cls, statetokens):
+        """
+        Merge runs of consecutive rules of a state into one regex each, in
+        which the rules are alternatives in their original order. The
+        alternative that matches first is the rule that would have matched
+        first when trying the rules one by one.
+        """
+        merged = []
+        run = []
+        groups = 0
+        for rule in statetokens:
+            pattern = cls._get_mergeable_pattern(rule[0])
+            if pattern is not None and groups + pattern.groups + 1 <= _MAX_GROUPS:
+                run.append((pattern, rule))
+                groups += pattern.groups + 1
+                continue
+            merged.extend(cls._merge_run(run))
+            run = []
+            groups = 0
+            if pattern is not None:
+                run.append((pattern, rule))
+                groups = pattern.groups + 1
+            else:
+                merged.append((rule[0], None, rule[1], rule[2]))
+        merged.extend(cls._merge_run(run))
+        return merged
+
+    def _merge_run(cls, run):
+        """
+        Merge a run of rules. ``rules`` maps the group around each rule in
+        the merged regex to the rule.
+        """
+        if len(run) < 2:
+            return [(rule[0], None, rule[1], rule[2]) for _, rule in run]
+        rules = [None]
+        for pattern, rule in run:
+            rules.append(rule)
+            rules.extend([None] * pattern.groups)
+        try:
+            regex = '|'.join('(%s)' % pattern.pattern for pattern, _ in run)
+            rexmatch = TOKEN_CACHE.compile(cls.__module__, regex, cls.flags).match
+        except (re.error, AssertionError, OverflowError, RuntimeError, UnicodeError):
+            return [(rule[0], None, rule[1], rule[2]) for _, rule in run]
+        return [(rexmatch, rules, None, None)]
+
     def __call__(cls, *args, **kwds):
         """Instantiate cls after preprocessing its token definitions."""
         if '_tokens' not in cls.__dict__:
             cls._all_tokens = {}
+            cls._dispatch_tokens = {}
             cls._tmpname = 0
             if hasattr(cls, 'token_variants') and cls.token_variants:
                 # don't process yet
@@ -583,6 +673,30 @@ class RegexLexerMeta(LexerMeta):
         return type.__call__(cls, *args, **kwds)
 
 
+class _DispatchStates(dict):
+    """
+    The states of preprocessed token definitions in the form that
+    ``RegexLexer.get_tokens_unprocessed`` uses, built on first use.
+    """
+
+    def __init__(self, lexer_class, tokendefs, merge):
+        dict.__init__(self)
+        self.lexer_class = lexer_class
+        self.tokendefs = tokendefs
+        self.merge = merge
+
+    def __missing__(self, state):
+        statetokens = self.tokendefs[state]
+        if self.merge:
+            merged = self.lexer_class._merge_state(statetokens)
+            TOKEN_CACHE.save()
+        else:
+            merged = [(rex, None, action, new_state)
+                      for rex, action, new_state in statetokens]
+        self[state] = merged
+        return merged
+
+
 @add_metaclass(RegexLexerMeta)
 class RegexLexer(Lexer):
     """
@@ -614,20 +728,41 @@ class RegexLexer(Lexer):
     #: current one.
     tokens = {}
 
+    #: Whether to merge the rules of each state into one regular expression,
+    #: instead of trying the rules one by one. Rules that have flags of their
+    #: own, named groups or references to groups are still tried on their
+    #: own.
+    merge_rules = True
+
     def get_tokens_unprocessed(self, text, stack=('root',)):
         """
         Split ``text`` into (tokentype, text) pairs.
 
         ``stack`` is the inital stack (default: ``['root']``)
         """
-        pos = 0
-        tokendefs = self._tokens
+        return self._lex(text, 0, stack, False)
+
+    def _lex(self, text, pos, stack, checkpoints):
+        """
+        Split ``text`` into (index, tokentype, value) tuples, starting at
+        ``pos`` with the state stack ``stack``. When ``checkpoints`` is true,
+        also yield ``(index, None, stack)`` every time lexing arrives at the
+        start of a line, with the state stack as a tuple; lexing can be
+        resumed from there.
+        """
+        tokendefs = type(self).get_dispatch_tokendefs(self._tokens, self.merge_rules)
         statestack = list(stack)
         statetokens = tokendefs[statestack[-1]]
         while 1:
-            for rexmatch, action, new_state in statetokens:
+            for rexmatch, rules, action, new_state in statetokens:
                 m = rexmatch(text, pos)
                 if m:
+                    if rules is not None:
+                        # merged rules: look up the rule that matched
+                        rexmatch, action, new_state = rules[m.lastindex]
+                        if action is not None and type(action) is not _TokenType:
+                            # callbacks expect the groups of their own rule
+                            m = rexmatch(text, pos)
                     if action is not None:
                         if type(action) is _TokenType:
                             yield pos, action, m.group()
@@ -653,6 +788,8 @@ class RegexLexer(Lexer):
                         else:
                             assert False, "wrong state def: %r" % new_state
                         statetokens = tokendefs[statestack[-1]]
+                    if checkpoints and pos and text[pos - 1] == '\n':
+                        yield pos, None, tuple(statestack)
                     break
             else:
                 try:
@@ -662,6 +799,8 @@ class RegexLexer(Lexer):
                         statetokens = tokendefs['root']
                         yield pos, Text, u'\n'
                         pos += 1
+                        if checkpoints:
+                            yield pos, None, ('root',)
                         continue
                     yield pos, Error, text[pos]
                     pos += 1
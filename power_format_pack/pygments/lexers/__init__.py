@@ -13,12 +13,15 @@ import re
 import sys
 import types
 import fnmatch
+import hashlib
+import threading
+from collections import OrderedDict
 from os.path import basename
 
-from pygments.lexers._mapping import LEXERS
+from pygments.lexers._mapping import LEXERS, ANALYSERS
 from pygments.modeline import get_filetype_from_buffer
 from pygments.plugin import find_plugin_lexers
-from pygments.util import ClassNotFound, itervalues, guess_decode
+from pygments.util import ClassNotFound, itervalues, guess_decode, text_type
 
 
 __all__ = ['get_lexer_by_name', 'get_lexer_for_filename', 'find_lexer_class',
@@ -27,6 +30,22 @@ __all__ = ['get_lexer_by_name', 'get_lexer_for_filename', 'find_lexer_class',
 _lexer_cache = {}
 _pattern_cache = {}
 
+# indexes of the builtin lexers in LEXERS, built on first use by
+# _get_indexes(); see there for their contents
+_indexes = None
+# characters with a special meaning in fnmatch patterns
+_WILDCARDS = re.compile(r'[*?[]')
+
+# the lexer class (or None) that guess_lexer found, keyed on a hash of the
+# text, the most recently used last; lexers are guessed on more than one
+# thread, and the pure-Python OrderedDict breaks when changed by two at once
+_guess_cache = OrderedDict()
+_guess_cache_lock = threading.Lock()
+_GUESS_CACHE_SIZE = 256
+# the interpreter in a shebang line, without its path, version and flags,
+# e.g. "python" for "#!/usr/bin/env python2.7 -u"
+_SHEBANG = re.compile(r'#!\s*(?:\S*[/\\])?(?:env\s+)?([a-z]+)[\w.-]*', re.I)
+
 
 def _fn_matches(fn, glob):
     """Return whether the supplied file name fn matches pattern filename."""
@@ -36,6 +55,66 @@ def _fn_matches(fn, glob):
     return _pattern_cache[glob].match(fn)
 
 
+def _get_indexes():
+    """Return the indexes of the builtin lexers, building them first if needed.
+
+    The result is a tuple of
+
+    * a dict of alias to ``(module_name, name)``,
+    * a dict of name to module name,
+    * a dict of literal filename to a list of matches,
+    * a dict of extension (for ``*.ext`` patterns) to a list of matches,
+    * a list of ``(compiled pattern, match)`` for all other patterns,
+
+    where a match is a tuple of ``(order, module_name, name, pattern)``.
+    ``order`` is the position of the match in a linear scan over LEXERS, so
+    that matches can be put back in the order the scan would find them.
+    When two lexers share an alias or a name, the one that the linear scan
+    finds first wins.
+    """
+    global _indexes
+    if _indexes is not None:
+        return _indexes
+    aliases = {}
+    names = {}
+    literals = {}
+    extensions = {}
+    patterns = []
+    order = 0
+    for module_name, name, lexer_aliases, filenames, _ in itervalues(LEXERS):
+        names.setdefault(name, module_name)
+        for alias in lexer_aliases:
+            aliases.setdefault(alias, (module_name, name))
+        for filename in filenames:
+            match = (order, module_name, name, filename)
+            order += 1
+            if not _WILDCARDS.search(filename):
+                literals.setdefault(filename, []).append(match)
+            elif filename.startswith('*.') and not _WILDCARDS.search(filename[2:]):
+                extensions.setdefault(filename[2:], []).append(match)
+            else:
+                patterns.append((re.compile(fnmatch.translate(filename)), match))
+    _indexes = (aliases, names, literals, extensions, patterns)
+    return _indexes
+
+
+def _find_filename_matches(fn):
+    """Return the ``(order, module_name, name, pattern)`` tuples of the
+    builtin lexers with a filename pattern that matches fn, in the order of a
+    linear scan over LEXERS."""
+    _, _, literals, extensions, patterns = _get_indexes()
+    matches = list(literals.get(fn, ()))
+    dot = fn.find('.')
+    while dot != -1:
+        matches.extend(extensions.get(fn[dot + 1:], ()))
+        dot = fn.find('.', dot + 1)
+    for pattern, match in patterns:
+        if pattern.match(fn):
+            matches.append(match)
+    matches.sort()
+    return matches
+
+
 def _load_lexers(module_name):
     """Load a lexer (and all others in the module too)."""
     mod = __import__(module_name, None, None, ['__all__'])
@@ -62,35 +141,45 @@ def find_lexer_class(name):
     if name in _lexer_cache:
         return _lexer_cache[name]
     # lookup builtin lexers
-    for module_name, lname, aliases, _, _ in itervalues(LEXERS):
-        if name == lname:
-            _load_lexers(module_name)
-            return _lexer_cache[name]
+    module_name = _get_indexes()[1].get(name)
+    if module_name is not None:
+        _load_lexers(module_name)
+        return _lexer_cache[name]
     # continue with lexers from setuptools entrypoints
     for cls in find_plugin_lexers():
         if cls.name == name:
             return cls
 
 
+def _find_lexer_class_by_alias(alias):
+    """Lookup a lexer class by an alias.
+
+    Return None if not found.
+    """
+    if not alias:
+        return None
+    # lookup builtin lexers
+    found = _get_indexes()[0].get(alias.lower())
+    if found is not None:
+        module_name, name = found
+        if name not in _lexer_cache:
+            _load_lexers(module_name)
+        return _lexer_cache[name]
+    # continue with lexers from setuptools entrypoints
+    for cls in find_plugin_lexers():
+        if alias.lower() in cls.aliases:
+            return cls
+
+
 def get_lexer_by_name(_alias, **options):
     """Get a lexer by an alias.
 
     Raises ClassNotFound if not found.
     """
-    if not _alias:
+    cls = _find_lexer_class_by_alias(_alias)
+    if cls is None:
         raise ClassNotFound('no lexer for alias %r found' % _alias)
-
-    # lookup builtin lexers
-    for module_name, name, aliases, _, _ in itervalues(LEXERS):
-        if _alias.lower() in aliases:
-            if name not in _lexer_cache:
-                _load_lexers(module_name)
-            return _lexer_cache[name](**options)
-    # continue with lexers from setuptools entrypoints
-    for cls in find_plugin_lexers():
-        if _alias.lower() in cls.aliases:
-            return cls(**options)
-    raise ClassNotFound('no lexer for alias %r found' % _alias)
+    return cls(**options)
 
 
 def find_lexer_class_for_filename(_fn, code=None):
@@ -103,12 +192,10 @@ def find_lexer_class_for_filename(_fn, code=None):
     """
     matches = []
     fn = basename(_fn)
-    for modname, name, _, filenames, _ in itervalues(LEXERS):
-        for filename in filenames:
-            if _fn_matches(fn, filename):
-                if name not in _lexer_cache:
-                    _load_lexers(modname)
-                matches.append((_lexer_cache[name], filename))
+    for _, modname, name, filename in _find_filename_matches(fn):
+        if name not in _lexer_cache:
+            _load_lexers(modname)
+        matches.append((_lexer_cache[name], filename))
     for cls in find_plugin_lexers():
         for filename in cls.filenames:
             if _fn_matches(fn, filename):
@@ -229,28 +316,85 @@ def guess_lexer_for_filename(_fn, _text, **options):
     return result[-1][1](**options)
 
 
-def guess_lexer(_text, **options):
-    """Guess a lexer by strong distinctions in the text (eg, shebang)."""
+def _iter_analyser_classes():
+    """Return an iterator over the lexer classes that implement
+    ``analyse_text``, in the order of _iter_lexerclasses().
+
+    Only the modules of these lexers are imported.
+    """
+    for key in sorted(ANALYSERS):
+        module_name, name = LEXERS[key][:2]
+        if name not in _lexer_cache:
+            _load_lexers(module_name)
+        yield _lexer_cache[name]
+    for lexer in find_plugin_lexers():
+        yield lexer
 
+
+def _get_shebang_lexer(text):
+    """Return the lexer class that is named after the interpreter in the
+    shebang line of text, if it recognizes the text with certainty.
+    """
+    match = _SHEBANG.match(text)
+    if match is None:
+        return None
+    lexer = _find_lexer_class_by_alias(match.group(1))
+    if lexer is not None and lexer.analyse_text(text) == 1.0:
+        return lexer
+
+
+def _guess_lexer_class(text):
+    """Return the lexer class for text, or None when no lexer matches."""
     # try to get a vim modeline first
-    ft = get_filetype_from_buffer(_text)
+    ft = get_filetype_from_buffer(text)
 
     if ft is not None:
-        try:
-            return get_lexer_by_name(ft, **options)
-        except ClassNotFound:
-            pass
+        lexer = _find_lexer_class_by_alias(ft)
+        if lexer is not None:
+            return lexer
+
+    # the lexer of the interpreter is certain of the text, so the scan can
+    # stop there; a lexer before it that is certain too still wins (such as
+    # NumPy for a Python script that imports numpy)
+    shebang_lexer = _get_shebang_lexer(text)
 
     best_lexer = [0.0, None]
-    for lexer in _iter_lexerclasses():
-        rv = lexer.analyse_text(_text)
+    for lexer in _iter_analyser_classes():
+        if lexer is shebang_lexer:
+            return lexer
+        rv = lexer.analyse_text(text)
         if rv == 1.0:
-            return lexer(**options)
+            return lexer
         if rv > best_lexer[0]:
             best_lexer[:] = (rv, lexer)
-    if not best_lexer[0] or best_lexer[1] is None:
+    if not best_lexer[0]:
+        return None
+    return best_lexer[1]
+
+
+def guess_lexer(_text, **options):
+    """Guess a lexer by strong distinctions in the text (eg, shebang).
+
+    The guess for a text is remembered, so guessing the same text again
+    does not analyse it again.
+    """
+    data = _text.encode('utf-8') if isinstance(_text, text_type) else _text
+    key = hashlib.sha1(data).digest()
+    with _guess_cache_lock:
+        found = key in _guess_cache
+        if found:
+            lexer = _guess_cache.pop(key)
+            _guess_cache[key] = lexer
+    if not found:
+        # analysing takes long, so other threads can use the cache meanwhile
+        lexer = _guess_lexer_class(_text)
+        with _guess_cache_lock:
+            _guess_cache[key] = lexer
+            if len(_guess_cache) > _GUESS_CACHE_SIZE:
+                _guess_cache.popitem(last=False)
+    if lexer is None:
         raise ClassNotFound('no lexer matching the text found')
-    return best_lexer[1](**options)
+    return lexer(**options)
 
 
 class _automodule(types.ModuleType):
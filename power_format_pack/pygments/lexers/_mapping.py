@@ -7,7 +7,7 @@
     you change something on a builtin lexer definition, run this script from
     the lexers folder to update it.
 
-    Do not alter the LEXERS dictionary by hand.
+    Do not alter the LEXERS dictionary or the ANALYSERS set by hand.
 
     :copyright: Copyright 2006-2015 by the Pygments team, see AUTHORS.
     :license: BSD, see LICENSE for details.
@@ -378,13 +378,134 @@ LEXERS = {
     'ZephirLexer': ('pygments.lexers.php', 'Zephir', ('zephir',), ('*.zep',), ()),
 }
 
+# the lexers in LEXERS that implement ``analyse_text``; all other lexers
+# score 0.0 for any text, so guessing does not need to import them
+ANALYSERS = frozenset((
+    'ActionScript3Lexer',
+    'AntlrActionScriptLexer',
+    'AntlrCSharpLexer',
+    'AntlrCppLexer',
+    'AntlrJavaLexer',
+    'AntlrLexer',
+    'AntlrObjectiveCLexer',
+    'AntlrPerlLexer',
+    'AntlrPythonLexer',
+    'AntlrRubyLexer',
+    'ArduinoLexer',
+    'BashLexer',
+    'BugsLexer',
+    'CLexer',
+    'CMakeLexer',
+    'CSharpAspxLexer',
+    'Ca65Lexer',
+    'CbmBasicV2Lexer',
+    'CoqLexer',
+    'CppLexer',
+    'CssDjangoLexer',
+    'CssErbLexer',
+    'CssGenshiLexer',
+    'CssPhpLexer',
+    'CssSmartyLexer',
+    'CudaLexer',
+    'DiffLexer',
+    'DjangoLexer',
+    'DtdLexer',
+    'ECLexer',
+    'ErbLexer',
+    'GasLexer',
+    'GenshiLexer',
+    'GroffLexer',
+    'GroovyLexer',
+    'HaxeLexer',
+    'HtmlDjangoLexer',
+    'HtmlGenshiLexer',
+    'HtmlLexer',
+    'HtmlPhpLexer',
+    'HtmlSmartyLexer',
+    'HttpLexer',
+    'HyLexer',
+    'IniLexer',
+    'JagsLexer',
+    'JasminLexer',
+    'JavascriptDjangoLexer',
+    'JavascriptErbLexer',
+    'JavascriptGenshiLexer',
+    'JavascriptPhpLexer',
+    'JavascriptSmartyLexer',
+    'JspLexer',
+    'JuliaLexer',
+    'LassoCssLexer',
+    'LassoHtmlLexer',
+    'LassoJavascriptLexer',
+    'LassoLexer',
+    'LassoXmlLexer',
+    'LimboLexer',
+    'LogosLexer',
+    'LogtalkLexer',
+    'MakefileLexer',
+    'MasonLexer',
+    'MatlabLexer',
+    'MqlLexer',
+    'NesCLexer',
+    'NixLexer',
+    'NumPyLexer',
+    'ObjectiveCLexer',
+    'ObjectiveCppLexer',
+    'ObjectiveJLexer',
+    'Perl6Lexer',
+    'PerlLexer',
+    'PhpLexer',
+    'PikeLexer',
+    'PrologLexer',
+    'Python3Lexer',
+    'PythonLexer',
+    'QBasicLexer',
+    'RagelCLexer',
+    'RagelCppLexer',
+    'RagelDLexer',
+    'RagelEmbeddedLexer',
+    'RagelJavaLexer',
+    'RagelObjectiveCLexer',
+    'RagelRubyLexer',
+    'RebolLexer',
+    'RegeditLexer',
+    'ResourceLexer',
+    'RexxLexer',
+    'RhtmlLexer',
+    'RslLexer',
+    'RstLexer',
+    'RubyLexer',
+    'SLexer',
+    'SmaliLexer',
+    'SmartyLexer',
+    'SourcesListLexer',
+    'SspLexer',
+    'StanLexer',
+    'SwigLexer',
+    'TclLexer',
+    'TeaTemplateLexer',
+    'TexLexer',
+    'VbNetAspxLexer',
+    'VbNetLexer',
+    'VelocityLexer',
+    'VelocityXmlLexer',
+    'XmlDjangoLexer',
+    'XmlErbLexer',
+    'XmlLexer',
+    'XmlPhpLexer',
+    'XmlSmartyLexer',
+    'XsltLexer',
+))
+
 if __name__ == '__main__':  # pragma: no cover
     import sys
     import os
 
     # lookup lexers
     found_lexers = []
+    found_analysers = []
     sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+    from pygments.lexer import Lexer
     for root, dirs, files in os.walk('.'):
         for filename in files:
             if filename.endswith('.py') and not filename.startswith('_'):
@@ -401,19 +522,28 @@ if __name__ == '__main__':  # pragma: no cover
                                      tuple(lexer.aliases),
                                      tuple(lexer.filenames),
                                      tuple(lexer.mimetypes))))
+                    analyser = next(cls for cls in lexer.__mro__
+                                    if 'analyse_text' in cls.__dict__)
+                    if analyser is not Lexer:
+                        found_analysers.append(repr(lexer_name))
     # sort them to make the diff minimal
     found_lexers.sort()
+    found_analysers.sort()
 
     # extract useful sourcecode from this file
     with open(__file__) as fp:
         content = fp.read()
     header = content[:content.find('LEXERS = {')]
+    analysers_comment = content[content.find('}\n\n# the lexers') + 3:
+                                content.find('ANALYSERS = frozenset')]
     footer = content[content.find("if __name__ == '__main__':"):]
 
     # write new file
     with open(__file__, 'w') as fp:
         fp.write(header)
         fp.write('LEXERS = {\n    %s,\n}\n\n' % ',\n    '.join(found_lexers))
+        fp.write(analysers_comment)
+        fp.write('ANALYSERS = frozenset((\n    %s,\n))\n\n' % ',\n    '.join(found_analysers))
         fp.write(footer)
 
     print ('=== %d lexers processed.' % len(found_lexers))
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+    pygments.tokencache
+    ~~~~~~~~~~~~~~~~~~~
+
+    An on-disk cache of the work that RegexLexerMeta does the first time a
+    lexer class is used: the regexes that ``words()`` expand to, and the
+    compiled code of every regex. A later process that uses the same lexer
+    builds its patterns from the cached code, without parsing and compiling
+    the regexes again.
+
+    There is one file per lexer module, which is thrown away when the source
+    of the module or the version of Python changes. Inside a file, entries
+    are looked up by the regex and its flags, so a stale entry is never
+    used.
+
+    :copyright: Copyright 2006-2015 by the Pygments team, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+"""
+
+import hashlib
+import marshal
+import os
+import re
+import sre_compile
+import sre_parse
+import sys
+import threading
+
+import _sre
+
+from pygments.util import text_type
+
+__all__ = ['TokenCache', 'TOKEN_CACHE']
+
+VERSION = 1
+
+
+def _compile(regex, flags):
+    """Compile regex like ``re.compile`` does, and return the pattern and
+    the arguments of ``_sre.compile`` that build it again."""
+    parsed = sre_parse.parse(regex, flags)
+    code = sre_compile._code(parsed, flags)
+    state = getattr(parsed, 'state', None) or parsed.pattern
+    if state.groups > 100:
+        raise AssertionError(
+            "sorry, but this version only supports 100 named groups")
+    groupindex = dict(state.groupdict)
+    indexgroup = [None] * state.groups
+    for name, index in groupindex.items():
+        indexgroup[index] = name
+    compiled = (flags | state.flags, code, state.groups - 1, groupindex,
+                tuple(indexgroup))
+    return _build(regex, compiled), compiled
+
+
+def _build(regex, compiled):
+    flags, code, groups, groupindex, indexgroup = compiled
+    return _sre.compile(regex, flags, code, groups, groupindex, indexgroup)
+
+
+def _get_module_hash(module_name):
+    """Return a hash of the source of a module, or None when there is none."""
+    filename = getattr(sys.modules.get(module_name), '__file__', None)
+    if not filename:
+        return None
+    if filename.endswith(('.pyc', '.pyo')):
+        filename = filename[:-1]
+    try:
+        with open(filename, 'rb') as fp:
+            return hashlib.sha1(fp.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+class TokenCache(object):
+    """
+    Remember expanded ``words()`` and compiled regexes per lexer module in
+    ``directory``. Without a directory nothing is remembered, and regexes
+    are compiled with ``re.compile``.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        self._modules = {}
+        self._dirty = set()
+
+    def set_directory(self, directory):
+        """Keep the cache files in directory, forgetting the loaded ones."""
+        with self._lock:
+            if directory != self.directory:
+                self.directory = directory
+                self._modules = {}
+                self._dirty = set()
+
+    def expand(self, module_name, future):
+        """Return the regex of a ``words()`` future of a lexer in module_name."""
+        if self.directory is None or not hasattr(future, 'words'):
+            return future.get()
+        key = ('words', tuple(future.words), future.prefix, future.suffix)
+        with self._lock:
+            entries = self._get_entries(module_name)
+            regex = entries.get(key)
+            if regex is None:
+                regex = entries[key] = future.get()
+                self._dirty.add(module_name)
+            return regex
+
+    def compile(self, module_name, regex, flags):
+        """Return the compiled regex of a lexer in module_name."""
+        if self.directory is None:
+            return re.compile(regex, flags)
+        key = (regex, flags, isinstance(regex, text_type))
+        with self._lock:
+            entries = self._get_entries(module_name)
+            compiled = entries.get(key)
+            if compiled is not None:
+                self.hits += 1
+                return _build(regex, compiled)
+            self.misses += 1
+            pattern, entries[key] = _compile(regex, flags)
+            self._dirty.add(module_name)
+            return pattern
+
+    def save(self):
+        """Write the files of the modules that have new entries."""
+        with self._lock:
+            for module_name in sorted(self._dirty):
+                self._save_module(module_name)
+            self._dirty = set()
+
+    def _get_path(self, module_name):
+        return os.path.join(self.directory, module_name + '.cache')
+
+    def _get_entries(self, module_name):
+        module = self._modules.get(module_name)
+        if module is None:
+            module = self._modules[module_name] = self._load_module(module_name)
+        return module[1]
+
+    def _get_header(self, module_name):
+        return (VERSION, sys.version, _sre.MAGIC, sys.maxunicode,
+                _get_module_hash(module_name))
+
+    def _load_module(self, module_name):
+        header = self._get_header(module_name)
+        try:
+            with open(self._get_path(module_name), 'rb') as fp:
+                saved_header, entries = marshal.load(fp)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return header, {}
+        if saved_header != header or header[-1] is None:
+            return header, {}
+        return header, entries
+
+    def _save_module(self, module_name):
+        header, entries = self._modules[module_name]
+        if header[-1] is None:
+            return
+        path = self._get_path(module_name)
+        temp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            with open(temp_path, 'wb') as fp:
+                marshal.dump((header, entries), fp)
+            if os.name == 'nt' and os.path.exists(path):
+                os.remove(path)
+            os.rename(temp_path, path)
+        except (IOError, OSError, ValueError):
+            # the cache is only an optimization; lexing works without it
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+TOKEN_CACHE = TokenCache()
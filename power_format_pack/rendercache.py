@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014-2017 Stefan van den Akker <neftas@protonmail.com>
+#
+# This file is part of Power Format Pack.
+#
+# Power Format Pack is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Power Format Pack is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Power Format Pack. If not, see http://www.gnu.org/licenses/.
+
+import codecs
+import collections
+import hashlib
+import json
+import threading
+
+
+class RenderCache(object):
+    """
+    Remember the HTML that was rendered from a piece of Markdown. Entries are
+    looked up by a hash of the Markdown and the rendering preferences. The
+    most recently used entries are kept in memory; when a `path` is set,
+    the entries are also saved to and loaded from disk.
+    """
+
+    VERSION = 1
+
+    def __init__(self, max_entries=512, max_disk_entries=4096, path=None):
+        self.max_entries        = max_entries
+        self.max_disk_entries   = max_disk_entries
+        self.path               = path
+        self.hits               = 0
+        self.misses             = 0
+        self._lock              = threading.Lock()
+        self._prefs_key         = None
+        self._memory            = collections.OrderedDict()
+        self._disk              = None
+
+    @staticmethod
+    def get_hash(md, prefs_key):
+        """
+        Return a hexadecimal digest for the Markdown `md` rendered with the
+        preferences in `prefs_key`.
+        """
+        digest = hashlib.sha1(repr(tuple(prefs_key)))
+        digest.update(md.encode("utf-8"))
+        return digest.hexdigest()
+
+    def set_path(self, path):
+        """
+        Use `path` as the location of the persistent cache. Entries that were
+        loaded from a previous path are dropped.
+        """
+        with self._lock:
+            self.path = path
+            self._disk = None
+
+    def get(self, md, prefs_key):
+        """
+        Return the cached HTML for `md`, or `None` when it is not cached.
+        """
+        assert isinstance(md, unicode), "Input `md` is not Unicode"
+        key = self.get_hash(md, prefs_key)
+        with self._lock:
+            self._check_prefs_key(prefs_key)
+            html = self._memory.pop(key, None)
+            if html is None:
+                html = self._get_disk().get(key)
+            if html is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._put_in_memory(key, html)
+            return html
+
+    def put(self, md, prefs_key, html):
+        """
+        Store the HTML `html` that was rendered from `md`.
+        """
+        assert isinstance(html, unicode), "Input `html` is not Unicode"
+        key = self.get_hash(md, prefs_key)
+        with self._lock:
+            self._check_prefs_key(prefs_key)
+            self._memory.pop(key, None)
+            self._put_in_memory(key, html)
+
+    def stats(self):
+        """
+        Return a dictionary with the hit and miss counters and the number of
+        cached entries.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self._disk) if self._disk is not None else 0
+            }
+
+    def clear(self):
+        """
+        Remove all entries and reset the counters.
+        """
+        with self._lock:
+            self._memory.clear()
+            self._disk = dict()
+            self.hits = self.misses = 0
+
+    def save(self):
+        """
+        Write the entries to disk, most recently used entries first. Do
+        nothing when no path is set.
+        """
+        if not self.path:
+            return
+        with self._lock:
+            if self._prefs_key is None:
+                # nothing was rendered, so the file on disk is still current
+                return
+            entries = collections.OrderedDict(reversed(self._memory.items()))
+            for key, html in self._get_disk().iteritems():
+                if len(entries) >= self.max_disk_entries:
+                    break
+                entries.setdefault(key, html)
+            data = {
+                "version": self.VERSION,
+                "prefs_key": self._prefs_key,
+                "entries": entries.items()[:self.max_disk_entries]
+            }
+            try:
+                with codecs.open(self.path, "w", encoding="utf8") as f:
+                    json.dump(data, f)
+            except (IOError, OSError) as e:
+                print e  # TODO: should be logged
+
+    def _check_prefs_key(self, prefs_key):
+        # the rendered HTML depends on the preferences, so everything that
+        # was stored with other preferences is of no use anymore
+        prefs_key = list(prefs_key)
+        if self._prefs_key is None:
+            self._prefs_key = prefs_key
+        elif self._prefs_key != prefs_key:
+            self._prefs_key = prefs_key
+            self._memory.clear()
+            self._disk = dict()
+
+    def _put_in_memory(self, key, html):
+        self._memory[key] = html
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _get_disk(self):
+        if self._disk is None:
+            self._disk = self._load()
+        return self._disk
+
+    def _load(self):
+        if not self.path:
+            return dict()
+        try:
+            with codecs.open(self.path, encoding="utf8") as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return dict()
+        if (not isinstance(data, dict) or
+                data.get("version") != self.VERSION or
+                data.get("prefs_key") != self._prefs_key):
+            return dict()
+        return collections.OrderedDict(
+            (key, html) for key, html in data.get("entries", list()))
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014-2017 Stefan van den Akker <neftas@protonmail.com>
+#
+# This file is part of Power Format Pack.
+#
+# Power Format Pack is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Power Format Pack is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Power Format Pack. If not, see http://www.gnu.org/licenses/.
+
+import itertools
+import sys
+import threading
+
+from PyQt4 import QtCore
+
+
+class RenderWorker(QtCore.QObject):
+    """
+    Run `Markdowner.render` on a worker thread, so that the editor stays
+    responsive while large fields are converted. The result is handed back
+    to the GUI thread with a Qt signal and only applied when it is the most
+    recent request for the same note and field, and the editor still shows
+    that note. Each field has one render running at a time.
+    """
+
+    rendered = QtCore.pyqtSignal(object, object, object, object, object)
+
+    # the number of renders that are running in all workers; forking Anki
+    # while one holds a lock would leave the lock held in the child
+    _running        = 0
+    _running_lock   = threading.Lock()
+
+    def __init__(self, parent=None):
+        super(RenderWorker, self).__init__(parent)
+        self._lock      = threading.Lock()
+        self._counter   = itertools.count(1)
+        self._latest    = dict()
+        self.rendered.connect(self._on_rendered)
+
+    @classmethod
+    def is_rendering(cls):
+        """
+        Return whether a render is running on a worker thread.
+        """
+        with cls._running_lock:
+            return cls._running > 0
+
+    @staticmethod
+    def get_key(markdowner):
+        """
+        Return the key of the note and field `markdowner` works on.
+        """
+        return markdowner.note.id, markdowner.current_field
+
+    def submit(self, markdowner, callback=None):
+        """
+        Prepare `markdowner` on the GUI thread and render it in the
+        background. `callback` is called with `markdowner` on the GUI thread
+        after the result was applied. Return False without doing anything
+        when the same field is still rendering.
+        """
+        key = self.get_key(markdowner)
+        with self._lock:
+            if key in self._latest:
+                # preparing changes the field (see `create_correct_md_for_def_list`),
+                # so preparing it again would work on a half-converted field
+                return False
+            token = next(self._counter)
+            self._latest[key] = token
+        try:
+            markdowner.prepare()
+        except Exception:
+            with self._lock:
+                del self._latest[key]
+            raise
+        markdowner.show_rendering_state()
+        with RenderWorker._running_lock:
+            RenderWorker._running += 1
+        thread = threading.Thread(target=self._run,
+                                  args=(markdowner, token, callback))
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def _run(self, markdowner, token, callback):
+        result = exc_info = None
+        try:
+            result = markdowner.render()
+        except Exception:
+            exc_info = sys.exc_info()
+        finally:
+            with RenderWorker._running_lock:
+                RenderWorker._running -= 1
+        # emitting from this thread queues the call to `_on_rendered` on the
+        # thread this object lives in, i.e. the GUI thread
+        self.rendered.emit(markdowner, token, result, exc_info, callback)
+
+    def _on_rendered(self, markdowner, token, result, exc_info, callback):
+        key = self.get_key(markdowner)
+        with self._lock:
+            if self._latest.get(key) != token:
+                # the result of an older request for the same field
+                return
+            del self._latest[key]
+
+        if not markdowner.is_current():
+            # the editor has moved on to another note, so the field that
+            # was marked as rendering is gone
+            return
+
+        markdowner.hide_rendering_state()
+        if exc_info:
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+        markdowner.apply(result)
+        markdowner.save_profile()
+        if callback:
+            callback(markdowner)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from power_format_pack.benchmarks import bench_lexer_fuzz, corpus, harness
+
+
+class BenchmarksTester(unittest.TestCase):
+
+    def setUp(self):
+        self.baseline = {"a": {"ops_per_sec": 100.0, "peak_kb": 1000}}
+
+    def test_compare_returns_no_regressions_within_tolerance(self):
+        results = {"a": {"ops_per_sec": 80.0, "peak_kb": 1400}}
+        self.assertEqual([], harness.compare(results, self.baseline))
+
+    def test_compare_reports_slower_benchmark(self):
+        results = {"a": {"ops_per_sec": 70.0, "peak_kb": 1000}}
+        self.assertEqual(1, len(harness.compare(results, self.baseline)))
+
+    def test_compare_reports_benchmark_using_more_memory(self):
+        results = {"a": {"ops_per_sec": 100.0, "peak_kb": 1600}}
+        self.assertIn("peak memory", harness.compare(results, self.baseline)[0])
+
+    def test_compare_reports_failed_benchmark(self):
+        results = {"a": {"error": "ValueError()"}}
+        self.assertIn("failed", harness.compare(results, self.baseline)[0])
+
+    def test_compare_ignores_benchmark_without_baseline(self):
+        results = {"b": {"ops_per_sec": 1.0, "peak_kb": 1000}}
+        self.assertEqual([], harness.compare(results, self.baseline))
+
+    def test_load_baseline_returns_saved_results(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "baseline.json")
+            harness.save_baseline(path, self.baseline)
+            self.assertEqual(self.baseline, harness.load_baseline(path))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_get_cards_returns_card_for_every_kind_and_size(self):
+        cards = corpus.get_cards()
+        self.assertEqual(len(corpus.BLOCKS) * len(corpus.SIZES), len(cards))
+        self.assertEqual(corpus.BLOCKS["code"] * corpus.SIZES["medium"], cards["code/medium"])
+
+    def test_get_inputs_returns_same_inputs_on_every_run(self):
+        inputs = bench_lexer_fuzz.get_inputs("Python", 5)
+        self.assertEqual(inputs, bench_lexer_fuzz.get_inputs("Python", 5))
+        self.assertNotEqual(inputs, bench_lexer_fuzz.get_inputs("JSON", 5))
+        self.assertTrue(all(inputs))
+
+    def test_run_lexer_returns_time_for_every_input(self):
+        inputs = bench_lexer_fuzz.get_inputs("JSON", 3)
+        times, error = bench_lexer_fuzz.run_lexer("JSON", inputs, 5.0)
+        self.assertEqual(3, len(times))
+        self.assertIsNone(error)
+
+    def test_summarize_reports_input_that_hangs(self):
+        result = bench_lexer_fuzz.summarize("SCSS", [u"a", u"{\n"], [0.001], "hang")
+        self.assertEqual(0.0, result["worst_chars_per_sec"])
+        self.assertEqual(hashlib.sha1(b"{").hexdigest(), result["worst_sha1"])
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+import sys
+import unittest
+
+import power_format_pack
+
+# the vendored Pygments imports itself as a top-level package
+sys.path.insert(0, os.path.dirname(power_format_pack.__file__))
+
+from power_format_pack.benchmarks import corpus
+from power_format_pack.blockrenderer import BlockRenderer
+from power_format_pack.converterpool import ConverterPool
+from power_format_pack.tests.test_markdown_inline import CORPUS
+
+KEY = (False, u"tango", False)
+# blocks to compose documents of, with definitions that other blocks use
+BLOCKS = [
+    u"para *a* HTML [1] x[^1]", u"    code\n    more", u"```python\ndef f():\n\n    pass\n```",
+    u"* a\n* b", u"1. one\n\n2. two", u"> quote\n> more", u"<div>\nraw\n\n</div>", u"Term\n:   def",
+    u"| a | b |\n|---|---|\n| c | d |", u"[1]: /x \"T\"", u"*[HTML]: Hyper", u"[^1]: note *x*\n\n    more",
+    u"# H {: #id }", u"para  \nbreak", u"<b>inline</b> & &amp;", u"\tcode tab", u"---", u"~~~\nx\n~~~",
+    u"text\n[2]: /y", u"para\n{: #p }", u"* item\n\n    continued", u"[^2]: two", u"x[^2] [2]",
+    u"<!-- c -->", u"<p>html</p>\n\nafter"
+]
+
+
+class BlockRendererTester(unittest.TestCase):
+    """
+    Check that converting Markdown one block at a time gives the same HTML
+    as converting all of it, and renders only the blocks that changed.
+    """
+
+    def setUp(self):
+        self.md = ConverterPool.create_converter(KEY)
+        self.renderer = BlockRenderer()
+
+    def convert(self, text, renderer=None):
+        self.md.reset()
+        if renderer is None:
+            return self.md.convert(text)
+        return renderer.convert(self.md, KEY, text)
+
+    def get_misses(self, text):
+        """Return how many blocks of `text` were not in the cache."""
+        misses = self.renderer.stats()["misses"]
+        self.assertEqual(self.convert(text), self.convert(text, self.renderer), text)
+        return self.renderer.stats()["misses"] - misses
+
+    def assert_converts_to_same_html(self, text):
+        expected = self.convert(text)
+        self.assertEqual(expected, self.convert(text, self.renderer), text)
+        # the second time, from the cached blocks
+        self.assertEqual(expected, self.convert(text, self.renderer), text)
+
+    def test_corpus_converts_to_same_html(self):
+        for text in CORPUS + corpus.get_cards().values():
+            self.assert_converts_to_same_html(text)
+
+    def test_composed_documents_convert_to_same_html(self):
+        rnd = random.Random(1)
+        for _ in xrange(300):
+            self.assert_converts_to_same_html(u"".join(
+                rnd.choice(BLOCKS) + rnd.choice([u"\n", u"\n\n", u"\n\n\n"]) for _ in xrange(rnd.randrange(1, 8))))
+
+    def test_edit_renders_only_edited_block(self):
+        paragraphs = [u"Paragraph {} with *some* `markup`.".format(i) for i in xrange(20)]
+        self.convert(u"\n\n".join(paragraphs), self.renderer)
+        self.assertEqual(20, self.renderer.stats()["misses"])
+        paragraphs[10] += u" More."
+        self.assertEqual(self.convert(u"\n\n".join(paragraphs)),
+                         self.convert(u"\n\n".join(paragraphs), self.renderer))
+        self.assertEqual({"hits": 19, "misses": 21, "entries": 21}, self.renderer.stats())
+
+    def test_changed_definition_renders_blocks_that_use_it(self):
+        text = u"The HTML spec.\n\nA [link][1].\n\nPlain text.\n\n*[HTML]: {}\n[1]: /{}"
+        self.assertEqual(3, self.get_misses(text.format(u"a", u"a")))
+        self.assertEqual(1, self.get_misses(text.format(u"b", u"a")))
+        self.assertEqual(1, self.get_misses(text.format(u"b", u"b")))
+
+    def test_changed_footnotes_render_blocks_that_refer_to_them(self):
+        text = u"First[^1].\n\nSecond.\n\n[^1]: {}"
+        self.assertEqual(3, self.get_misses(text.format(u"a")))
+        # a reference only shows the number of its footnote
+        self.assertEqual(1, self.get_misses(text.format(u"b")))
+        # the footnotes themselves and the paragraph that refers to the new one
+        self.assertEqual(2, self.get_misses(text.format(u"b").replace(u"First[^1]", u"First[^2]") + u"\n[^2]: c"))
+
+    def test_other_preferences_clear_blocks(self):
+        self.convert(u"a\n\nb", self.renderer)
+        self.md.reset()
+        self.renderer.convert(self.md, (True, u"tango", False), u"a\n\nb")
+        self.assertEqual({"hits": 0, "misses": 4, "entries": 2}, self.renderer.stats())
+
+    def test_renderer_without_entries_converts_whole_text(self):
+        renderer = BlockRenderer(max_entries=0)
+        self.assertEqual(self.convert(CORPUS[14]), self.convert(CORPUS[14], renderer))
+        self.assertEqual({"hits": 0, "misses": 0, "entries": 0}, renderer.stats())
+
+    def test_entries_are_limited(self):
+        renderer = BlockRenderer(max_entries=5)
+        self.convert(u"\n\n".join(unicode(i) for i in xrange(10)), renderer)
+        self.assertEqual(5, renderer.stats()["entries"])
+
+    def test_pool_converts_with_renderer(self):
+        prefs = {
+            "markdown_classful_pygments": False,
+            "markdown_syntax_style": "tango",
+            "markdown_line_nums": False
+        }
+        pool = ConverterPool()
+        text = CORPUS[15]
+        self.assertEqual(pool.convert(prefs, text), pool.convert(prefs, text, self.renderer))
+        self.assertEqual(pool.convert(prefs, text), pool.convert(prefs, text, self.renderer))
+        stats = self.renderer.stats()
+        self.assertEqual(stats["misses"], stats["hits"])
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import sys
+import unittest
+
+from power_format_pack import const, utility
+from power_format_pack.bulkconvert import BulkConverter, render_note
+from power_format_pack.renderworker import RenderWorker
+
+
+class Note(object):
+
+    def __init__(self, note_id, fields):
+        self.id = note_id
+        self.fields = fields
+        self.flushed = 0
+
+    def keys(self):
+        return [u"Front", u"Back"][:len(self.fields)]
+
+    def flush(self):
+        self.flushed += 1
+
+
+class Collection(object):
+
+    def __init__(self, notes):
+        self.notes = dict((note.id, note) for note in notes)
+        self.saved = 0
+
+    def getNote(self, note_id):
+        return self.notes[note_id]
+
+    def save(self):
+        self.saved += 1
+
+
+class BulkConvertTester(unittest.TestCase):
+
+    def setUp(self):
+        self.prefs = {"markdown_classful_pygments": False, "markdown_syntax_style": "tango"}
+
+    def test_render_note_converts_fields_without_data(self):
+        note_id, fields = render_note((1, self.prefs, const.MARKDOWN_CONVERT, [(0, u"<div>**text**</div>")]))
+        self.assertEqual(1, note_id)
+        field_no, action, html = fields[0]
+        self.assertEqual(const.MARKDOWN_CONVERT, action)
+        self.assertEqual(u"**text**\n", utility.decompress_and_json_load(
+            utility.get_md_data_from_string(html)).get("md"))
+
+    def test_render_note_skips_converted_fields_when_converting(self):
+        html = utility.insert_md_data(u"1-000", u"True", u"**text**", u"<p><strong>text</strong></p>")
+        _, fields = render_note((1, self.prefs, const.MARKDOWN_CONVERT, [(0, html)]))
+        self.assertEqual([(0, None, None)], fields)
+
+    def test_render_note_reverts_converted_fields(self):
+        _, fields = render_note((1, self.prefs, const.MARKDOWN_CONVERT, [(0, u"<div>**text**</div>")]))
+        _, fields = render_note((1, self.prefs, const.MARKDOWN_REVERT, [(0, fields[0][2])]))
+        self.assertEqual([(0, const.MARKDOWN_REVERT, u"<div>**text**</div>")], fields)
+
+    def test_run_writes_notes_without_saving_and_counts_actions(self):
+        notes = [Note(i, [u"<div>**%d**</div>" % i, u""]) for i in range(5)]
+        col = Collection(notes)
+        counts = BulkConverter(self.prefs, processes=1, batch_size=2).run(
+            col, [note.id for note in notes], None, const.MARKDOWN_CONVERT)
+        self.assertEqual(5, counts[const.MARKDOWN_CONVERT])
+        self.assertEqual(5, counts[const.BULK_SKIPPED])
+        # saving would commit the checkpoint the browser made to undo it
+        self.assertEqual(0, col.saved)
+        self.assertTrue(all(note.flushed == 1 for note in notes))
+
+    def test_run_only_renders_selected_fields(self):
+        note = Note(1, [u"<div>**front**</div>", u"<div>**back**</div>"])
+        BulkConverter(self.prefs, processes=1).run(
+            Collection([note]), [1], [u"Back"], const.MARKDOWN_CONVERT)
+        self.assertEqual(u"<div>**front**</div>", note.fields[0])
+        self.assertIn(u"<strong>back</strong>", note.fields[1])
+
+    def test_run_stops_when_progress_returns_false(self):
+        notes = [Note(i, [u"<div>**%d**</div>" % i]) for i in range(5)]
+        col = Collection(notes)
+        counts = BulkConverter(self.prefs, processes=1).run(
+            col, [note.id for note in notes], None, const.MARKDOWN_CONVERT,
+            lambda done, total: done < 2)
+        self.assertEqual(2, counts[const.MARKDOWN_CONVERT])
+        self.assertEqual(1, counts["cancelled"])
+        self.assertEqual(0, col.saved)
+        self.assertEqual([1, 1, 0, 0, 0], [note.flushed for note in notes])
+
+    def test_get_processes_renders_in_this_process_on_windows_and_mac(self):
+        platform = sys.platform
+        try:
+            for name in ["win32", "darwin"]:
+                sys.platform = name
+                self.assertEqual(1, BulkConverter(self.prefs).get_processes())
+            sys.platform = "linux2"
+            self.assertGreaterEqual(BulkConverter(self.prefs).get_processes(), 1)
+            self.assertEqual(3, BulkConverter(self.prefs, processes=3).get_processes())
+        finally:
+            sys.platform = platform
+
+    def test_get_processes_renders_in_this_process_while_editor_renders(self):
+        platform = sys.platform
+        sys.platform = "linux2"
+        RenderWorker._running += 1
+        try:
+            self.assertEqual(1, BulkConverter(self.prefs).get_processes())
+        finally:
+            RenderWorker._running -= 1
+            sys.platform = platform
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import power_format_pack
+
+# the vendored Pygments imports itself as a top-level package
+sys.path.insert(0, os.path.dirname(power_format_pack.__file__))
+
+from pygments.formatters import get_formatter_by_name
+from pygments.lexers import get_lexer_by_name
+from pygments.util import ClassNotFound
+
+from power_format_pack.markdown.extensions import codehilite
+from power_format_pack.markdown.extensions.codehilite import CodeHilite, HighlighterCache, HighlightWatchdog, IncrementalLexer
+
+
+class HighlighterCacheTester(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = HighlighterCache(max_entries=2)
+
+    def get_formatter(self, style="default", linenos=False, hl_lines=None):
+        return self.cache.get_formatter(linenos=linenos, cssclass="codehilite", style=style,
+                                        noclasses=True, hl_lines=hl_lines or [])
+
+    def test_get_lexer_returns_same_lexer_for_same_language(self):
+        lexer = self.cache.get_lexer("python")
+        self.assertEqual("Python", lexer.name)
+        self.assertIs(lexer, self.cache.get_lexer("python"))
+        self.assertEqual({"hits": 1, "misses": 1, "hit_rate": 0.5}, self.cache.stats()["lexer"])
+
+    def test_get_lexer_remembers_unknown_language(self):
+        self.assertRaises(ClassNotFound, self.cache.get_lexer, "no-such-language")
+        self.assertRaises(ClassNotFound, self.cache.get_lexer, "no-such-language")
+        self.assertEqual(1, self.cache.stats()["lexer"]["hits"])
+
+    def test_least_recently_used_lexer_is_dropped(self):
+        python = self.cache.get_lexer("python")
+        self.cache.get_lexer("c")
+        self.cache.get_lexer("python")
+        self.cache.get_lexer("java")
+        self.assertIs(python, self.cache.get_lexer("python"))
+        self.cache.get_lexer("c")
+        self.assertEqual(4, self.cache.stats()["lexer"]["misses"])
+
+    def test_get_formatter_returns_same_formatter_for_same_options(self):
+        formatter = self.get_formatter()
+        self.assertIs(formatter, self.get_formatter())
+        self.assertIsNot(formatter, self.get_formatter(linenos=True))
+
+    def test_formatter_with_hl_lines_is_not_cached(self):
+        formatter = self.get_formatter(hl_lines=[1])
+        self.assertEqual(set([1]), formatter.hl_lines)
+        self.assertIsNot(formatter, self.get_formatter(hl_lines=[1]))
+        self.assertEqual(set(), self.get_formatter().hl_lines)
+
+    def test_formatters_are_dropped_when_style_changes(self):
+        formatter = self.get_formatter(style="default")
+        self.get_formatter(style="monokai")
+        self.assertIsNot(formatter, self.get_formatter(style="default"))
+        self.assertEqual(0, self.cache.stats()["formatter"]["hits"])
+
+    def test_clear_resets_statistics(self):
+        self.cache.get_lexer("python")
+        self.cache.clear()
+        self.assertEqual({"hits": 0, "misses": 0, "hit_rate": 0.0}, self.cache.stats()["lexer"])
+
+    def test_hilite_output_does_not_change_with_cache(self):
+        src = "def f(x):\n    return x + 1"
+        codehilite.HIGHLIGHTER_CACHE.clear()
+        first = CodeHilite(src, lang="python", noclasses=True, hl_lines=[2]).hilite()
+        second = CodeHilite(src, lang="python", noclasses=True).hilite()
+        third = CodeHilite(src, lang="python", noclasses=True).hilite()
+        self.assertIn("background-color", first)
+        self.assertNotEqual(first, second)
+        self.assertEqual(second, third)
+        self.assertEqual(2, codehilite.HIGHLIGHTER_CACHE.stats()["lexer"]["hits"])
+
+
+class IncrementalLexerTester(unittest.TestCase):
+
+    def setUp(self):
+        self.lexer = IncrementalLexer(min_lines=3, max_texts=2)
+        self.src = "".join("def f{0}(x):\n    return x + {0}\n".format(i) for i in range(50))
+
+    def test_short_text_is_not_lexed_incrementally(self):
+        python = get_lexer_by_name("python")
+        self.assertIsNone(self.lexer.get_tokens(python, "x = 1\n"))
+
+    def test_tokens_of_edited_text_are_reused(self):
+        python = get_lexer_by_name("python")
+        self.lexer.get_tokens(python, self.src)
+        edited = self.src.replace("x + 25", "x - 25")
+        tokens = list(self.lexer.get_tokens(python, edited))
+        self.assertEqual(list(python.get_tokens(edited)), tokens)
+        self.assertGreater(self.lexer.reused_tokens, self.lexer.relexed_tokens // 4)
+
+    def test_hilite_output_does_not_change_with_incremental_lexing(self):
+        codehilite.INCREMENTAL_LEXER.clear()
+        first = CodeHilite(self.src, lang="python", noclasses=True).hilite()
+        edited = self.src.replace("x + 25", "x - 25")
+        second = CodeHilite(edited, lang="python", noclasses=True).hilite()
+        lexer = get_lexer_by_name("python")
+        formatter = get_formatter_by_name("html", cssclass="codehilite", style="default", noclasses=True)
+        self.assertEqual(codehilite.highlight(edited, lexer, formatter), second)
+        self.assertNotEqual(first, second)
+        self.assertGreater(codehilite.INCREMENTAL_LEXER.reused_tokens, 0)
+
+
+class HighlightWatchdogTester(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "watchdog.json")
+        self.watchdog = HighlightWatchdog(step_budget=100, path=self.path)
+        self.lexer = get_lexer_by_name("python")
+        self.src = "x = 1\n" * 50
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def lex(self, watchdog, src):
+        return watchdog.highlight(self.lexer, src, lambda watch: list(watch(self.lexer.get_tokens(src))))
+
+    def test_tokens_within_budget_are_returned(self):
+        self.assertEqual(list(self.lexer.get_tokens("x = 1")), self.lex(self.watchdog, "x = 1"))
+        self.assertEqual({}, self.watchdog.get_failures())
+
+    def test_code_block_over_step_budget_is_recorded(self):
+        self.assertIsNone(self.lex(self.watchdog, self.src))
+        key = HighlightWatchdog.get_key(self.lexer, self.src)
+        self.assertEqual({key: "steps"}, self.watchdog.get_failures())
+        self.assertIsNone(self.lex(self.watchdog, self.src))
+        self.assertEqual(1, self.watchdog.skipped)
+
+    def test_code_block_over_time_budget_is_recorded(self):
+        watchdog = HighlightWatchdog(time_budget=-1)
+        self.assertIsNone(self.lex(watchdog, self.src))
+        self.assertEqual(["time"], list(watchdog.get_failures().values()))
+
+    def test_failures_are_read_by_later_session(self):
+        self.lex(self.watchdog, self.src)
+        self.assertEqual(self.watchdog.get_failures(), HighlightWatchdog(path=self.path).get_failures())
+
+    def write(self, **data):
+        data["version"] = HighlightWatchdog.VERSION
+        with open(self.path, "w") as f:
+            json.dump(data, f)
+
+    def read(self):
+        with open(self.path) as f:
+            return json.load(f)
+
+    def test_code_block_being_lexed_in_two_sessions_is_recorded_as_hang(self):
+        key = HighlightWatchdog.get_key(self.lexer, self.src)
+        self.write(failures=[], pending=[list(key)])
+        self.assertEqual({}, HighlightWatchdog(path=self.path).get_failures())
+        self.write(failures=[], suspects=[list(key)], pending=[list(key)])
+        self.assertEqual({key: "hang"}, HighlightWatchdog(path=self.path).get_failures())
+
+    def test_code_block_lexed_after_session_ended_is_no_longer_suspected(self):
+        key = HighlightWatchdog.get_key(self.lexer, "x = 1")
+        self.write(failures=[], pending=[list(key)])
+        watchdog = HighlightWatchdog(path=self.path)
+        self.lex(watchdog, "x = 1")
+        watchdog.save()
+        self.assertEqual({"version": HighlightWatchdog.VERSION, "failures": [], "suspects": [], "pending": []},
+                         self.read())
+
+    def test_code_block_is_not_pending_after_save(self):
+        self.lex(self.watchdog, "x = 1")
+        self.watchdog.save()
+        self.assertEqual([], self.read()["pending"])
+
+    def test_code_block_lexed_before_is_not_written_again(self):
+        self.lex(self.watchdog, "x = 1")
+        os.remove(self.path)
+        self.lex(self.watchdog, "x = 1")
+        self.assertFalse(os.path.exists(self.path))
+        self.lex(self.watchdog, "y = 1")
+        self.assertEqual([], self.read()["failures"])
+
+    def test_time_failures_are_not_written(self):
+        watchdog = HighlightWatchdog(time_budget=-1, path=self.path)
+        self.assertIsNone(self.lex(watchdog, self.src))
+        watchdog.save()
+        self.assertEqual([], self.read()["failures"])
+        self.assertEqual({}, HighlightWatchdog(path=self.path).get_failures())
+        self.write(failures=[["Python", "0" * 40, "time"]])
+        self.assertEqual({}, HighlightWatchdog(path=self.path).get_failures())
+
+    def test_forked_process_does_not_write(self):
+        self.watchdog._pid = -1
+        self.lex(self.watchdog, self.src)
+        self.watchdog.save()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(1, len(self.watchdog.get_failures()))
+
+    def test_file_is_replaced_without_temporary_files_left(self):
+        self.lex(self.watchdog, self.src)
+        self.assertEqual(["watchdog.json"], os.listdir(self.tmp_dir))
+        self.assertEqual(1, len(self.read()["failures"]))
+
+    def test_broken_file_is_ignored(self):
+        with open(self.path, "w") as f:
+            f.write("{\"version\": 2, \"fail")
+        self.assertEqual({}, HighlightWatchdog(path=self.path).get_failures())
+
+    def test_budgeted_hilite_shows_code_block_over_budget_escaped(self):
+        watchdog = codehilite.HIGHLIGHT_WATCHDOG
+        codehilite.HIGHLIGHT_WATCHDOG = self.watchdog
+        try:
+            html = CodeHilite(self.src + "<b>", lang="python", budgeted=True).hilite()
+            short = CodeHilite("x = 1", lang="python", budgeted=True).hilite()
+        finally:
+            codehilite.HIGHLIGHT_WATCHDOG = watchdog
+        self.assertTrue(html.startswith('<pre align="left" class="codehilite"><code class="language-python">'))
+        self.assertIn("&lt;b&gt;", html)
+        self.assertEqual(CodeHilite("x = 1", lang="python").hilite(), short)
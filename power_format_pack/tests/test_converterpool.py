@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from power_format_pack.converterpool import ConverterPool
+
+
+class ConverterPoolTester(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ConverterPool()
+        self.prefs = {
+            "markdown_classful_pygments": False,
+            "markdown_syntax_style": "tango",
+            "markdown_line_nums": False
+        }
+
+    def test_convert_returns_same_html_as_fresh_converter(self):
+        md = u"this **was** a triumph[^1]\n\n[^1]: a footnote"
+        expected = ConverterPool.create_converter(ConverterPool.get_key(self.prefs)).convert(md)
+        self.assertEqual(expected, self.pool.convert(self.prefs, md))
+        self.assertEqual(expected, self.pool.convert(self.prefs, md))
+
+    def test_acquire_returns_released_converter(self):
+        converter = self.pool.acquire(self.prefs)
+        self.pool.release(self.prefs, converter)
+        self.assertIs(converter, self.pool.acquire(self.prefs))
+
+    def test_acquire_returns_new_converter_when_preferences_change(self):
+        converter = self.pool.acquire(self.prefs)
+        self.pool.release(self.prefs, converter)
+        self.prefs["markdown_line_nums"] = True
+        self.assertIsNot(converter, self.pool.acquire(self.prefs))
+
+    def test_release_discards_converter_with_outdated_preferences(self):
+        converter = self.pool.acquire(self.prefs)
+        new_prefs = dict(self.prefs, markdown_syntax_style=u"monokai")
+        self.pool.acquire(new_prefs)
+        self.pool.release(self.prefs, converter)
+        self.assertIsNot(converter, self.pool.acquire(new_prefs))
+
+    def test_convert_does_not_remember_abbreviations_of_previous_text(self):
+        self.pool.convert(self.prefs, u"HTML\n\n*[HTML]: Hyper Text Markup Language")
+        self.assertEqual(u"<p>HTML</p>", self.pool.convert(self.prefs, u"HTML"))
+
+    def test_acquire_sets_token_cache_path_of_pygments(self):
+        from power_format_pack.markdown.extensions import codehilite
+        self.pool.set_token_cache_path("/tmp/token-cache")
+        try:
+            self.pool.acquire(self.prefs)
+            self.assertEqual("/tmp/token-cache", codehilite.TOKEN_CACHE.directory)
+        finally:
+            codehilite.TOKEN_CACHE.set_directory(None)
+
+    def test_acquire_sets_watchdog_path_of_codehilite(self):
+        from power_format_pack.markdown.extensions import codehilite
+        self.pool.set_watchdog_path("/tmp/watchdog.json")
+        try:
+            self.pool.acquire(self.prefs)
+            self.assertEqual("/tmp/watchdog.json", codehilite.HIGHLIGHT_WATCHDOG.path)
+        finally:
+            codehilite.HIGHLIGHT_WATCHDOG.set_path(None)
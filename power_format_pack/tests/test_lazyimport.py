@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import sys
+import unittest
+
+from power_format_pack import lazyimport
+from power_format_pack.lazyimport import LazyModule
+
+
+class LazyImportTester(unittest.TestCase):
+
+    def test_module_is_not_imported_before_first_use(self):
+        sys.modules.pop("this", None)
+        module = LazyModule("this")
+        self.assertFalse(module.is_loaded())
+        self.assertNotIn("this", sys.modules)
+
+    def test_attribute_access_imports_module_and_records_load_time(self):
+        module = LazyModule("colorsys")
+        self.assertEqual((0.0, 0.0, 0.0), module.rgb_to_hsv(0.0, 0.0, 0.0))
+        self.assertTrue(module.is_loaded())
+        self.assertIn("colorsys", lazyimport.LOAD_TIMES)
+
+    def test_setting_attribute_sets_it_on_module(self):
+        import textwrap
+        module = LazyModule("textwrap")
+        module.lazy_test_attribute = 1
+        self.assertEqual(1, textwrap.lazy_test_attribute)
+        del textwrap.lazy_test_attribute
+
+    def test_lazy_module_returns_same_instance_for_same_name(self):
+        self.assertIs(lazyimport.lazy_module("textwrap"), lazyimport.lazy_module("textwrap"))
+
+    def test_import_error_is_raised_on_first_use(self):
+        module = LazyModule("power_format_pack.does_not_exist")
+        self.assertRaises(ImportError, getattr, module, "anything")
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import re
+import unittest
+
+from power_format_pack.converterpool import ConverterPool
+from power_format_pack.markdown import inlinepatterns
+from power_format_pack.markdown.treeprocessors import InlineProcessor
+
+# Markdown with every inline pattern of the converter, nested and broken
+CORPUS = [
+    u"",
+    u"plain text without any markup at all",
+    u"Some **bold** and *italic* and __bold__ and _italic_ and ***both*** and ___both___.",
+    u"***strong**em* and ***em*strong** and **bold *italic* bold** and *it **bo** it*",
+    u"snake_case_name and 2*3*4 and a * b * c and a _ b _ c and **unclosed and *unclosed",
+    u"`code` and ``co`de`` and `**not bold**` and \\`not code\\` and \\*not em\\* and \\\\",
+    u"[link](http://example.com) and [link](<http://example.com> \"title\") and [a [nested] link](/x)",
+    u"![image](image.jpg) and ![alt *em*](<a b.png> 'title') and ![](image (1).jpg)",
+    u"[ref][1] and [ref] [1] and [short] and ![img ref][1] and [undefined][x]\n\n"
+    u"[1]: http://example.com/ \"Title\"\n[short]: /short",
+    u"<http://example.com/?a=1&b=2> and <me@example.com> and <mailto:me@example.com>",
+    u"inline <b>html</b> and <span class=\"x\">*em*</span> and <!-- comment --> and a < b > c",
+    u"entities &amp; &copy; &#169; &#xA9; and a lone & and AT&T",
+    u"line one  \nline two  \nline three\nline four",
+    u"The HTML and CSS specs are by the W3C.\n\n*[HTML]: Hyper Text Markup Language\n"
+    u"*[CSS]: Cascading Style Sheets\n*[W3C]: World Wide Web Consortium",
+    u"Footnote[^1] and another[^note] and a missing one[^x].\n\n[^1]: The *first* note.\n"
+    u"[^note]: A note with `code` and a [link](http://example.com).",
+    u"# Heading with *em* and `code`\n\n> quote with **bold** and [link](/x)\n\n"
+    u"* item *one*\n* item __two__\n\n1. first `1`\n2. second &amp;",
+    u"Term *one*\n:   Definition with **bold**\n\n| a *b* | `c` |\n|---|---|\n| **d** | [e](/e) |",
+    u"paragraph {@id=x} with attributes\n{: .cls #id }\n\n![img](a.png){: width=10 }",
+    u"* * *\n\n_ _ _\n\n*\n\n_a_b_c_ and *a*b*c* and **a**b**c** and `a`b`c`",
+    u"```python\ndef f(x):\n    return x * 2  # *not em*\n```\n\n    indented `code` *block*",
+    u"unicode é*è*中文 **☃** [é](/é) &eacute; é_x_è",
+    u"\\[not a link\\](/x) and \\<not html\\> and \\&amp; and \\_not em\\_ and \\# and \\!",
+    u"[link with `code`](/x) and [**bold link**](/y \"t\") and [![img](i.png)](/z)",
+    u"*em with [link](/x) inside* and **strong with <b>html</b>** and _em &amp; entity_",
+]
+
+
+def get_long_paragraph(size):
+    """Return a paragraph of about `size` characters with many patterns."""
+    words = [u"word", u"*em*", u"**strong**", u"`code`", u"[link](/x)", u"HTML", u"&amp;",
+             u"text[^1]", u"<b>b</b>", u"snake_case", u"a_b"]
+    text = u" ".join(words[i * 7 % len(words)] for i in xrange(size // 6))
+    return text + u"\n\n[^1]: note\n\n*[HTML]: Hyper Text Markup Language"
+
+
+def create_converter():
+    return ConverterPool.create_converter((False, u"tango", False))
+
+
+def convert(text, filter_patterns):
+    md = create_converter()
+    md.treeprocessors["inline"].filterPatterns = filter_patterns
+    return md.convert(text)
+
+
+class InlinePatternFilterTester(unittest.TestCase):
+    """
+    Check that skipping the inline patterns whose required characters are
+    not in a text gives the same HTML as trying every pattern.
+    """
+
+    def test_corpus_converts_to_same_html_with_and_without_filter(self):
+        for text in CORPUS + [get_long_paragraph(2000)]:
+            self.assertEqual(convert(text, False), convert(text, True), text)
+
+    def test_filter_is_on_by_default(self):
+        self.assertTrue(InlineProcessor.filterPatterns)
+
+    def test_required_chars_of_built_in_patterns(self):
+        patterns = create_converter().inlinePatterns
+
+        def required(key):
+            return inlinepatterns.getRequiredChars(patterns[key].getCompiledRegExp())
+        self.assertEqual(frozenset(u"`"), required("backtick"))
+        self.assertEqual(frozenset(u"["), required("link"))
+        self.assertEqual(frozenset(u"!"), required("image_link"))
+        self.assertEqual(frozenset(u"*_"), required("not_strong"))
+        self.assertEqual(frozenset(u"&"), required("entity"))
+        # a space is less useful than the newline
+        self.assertEqual(frozenset(u"\n"), required("linebreak"))
+
+    def test_required_chars_of_pattern_that_can_match_anything_is_none(self):
+        self.assertIsNone(inlinepatterns.getRequiredChars(re.compile(u"^(.*?)(\\w+)(.*?)$")))
+        self.assertIsNone(inlinepatterns.getRequiredChars(re.compile(u"^(.*?)(a?)(.*?)$")))
+        self.assertIsNone(inlinepatterns.getRequiredChars(re.compile(u"^(.*?)(a|.)(.*?)$")))
+        self.assertIsNone(inlinepatterns.getRequiredChars(re.compile(u"^(.*?)([^a])(.*?)$")))
+        self.assertIsNone(inlinepatterns.getRequiredChars(re.compile(u"^(.*?)(?i)(a)(.*?)$")))
+
+    def test_required_chars_of_repeats_ranges_and_branches(self):
+        self.assertEqual(frozenset(u"ab"), inlinepatterns.getRequiredChars(re.compile(u"x?(a|b)+")))
+        self.assertEqual(frozenset(u"0123"), inlinepatterns.getRequiredChars(re.compile(u"[0-3]{2}")))
+        self.assertEqual(frozenset(u"q"), inlinepatterns.getRequiredChars(re.compile(u"(?<!x)q")))
+
+
+class StrikePattern(inlinepatterns.SimpleTagPattern):
+    """A pattern with the older interface, as third-party extensions have."""
+
+    def handleMatch(self, m):
+        if m.group(1).endswith(u"!"):
+            return None
+        return inlinepatterns.SimpleTagPattern.handleMatch(self, m)
+
+
+class FirstWordProcessor(inlinepatterns.InlineProcessor):
+    """An inline processor that ignores the matches it does not want."""
+
+    def handleMatch(self, m, data):
+        if m.group(1) != u"first":
+            return None, None, None
+        el = inlinepatterns.util.etree.Element(u"b")
+        el.text = m.group(1)
+        return el, m.start(0), m.end(0)
+
+
+class InlineProcessorTester(unittest.TestCase):
+    """
+    Check the inline processors, which search for their regular expression
+    as it is, next to the patterns with the older interface.
+    """
+
+    def test_built_in_patterns_are_inline_processors(self):
+        md = create_converter()
+        for key in [u"backtick", u"escape", u"link", u"reference", u"html", u"strong",
+                    u"strong2", u"footnote", u"nl", u"emphasis2"]:
+            self.assertIsInstance(md.inlinePatterns[key], inlinepatterns.InlineProcessor, key)
+        md.convert(u"HTML\n\n*[HTML]: Hyper Text Markup Language")
+        self.assertIsInstance(md.inlinePatterns[u"abbr-HTML"], inlinepatterns.InlineProcessor)
+
+    def test_pattern_with_older_interface_gets_text_around_match_in_groups(self):
+        md = create_converter()
+        md.inlinePatterns.add(u"strike", StrikePattern(u"(~{2})(.+?)\\2", u"del"), u"<not_strong")
+        self.assertEqual(u"<p>a <del>b</del> <em>c</em> <del>d</del></p>", md.convert(u"a ~~b~~ *c* ~~d~~"))
+        self.assertEqual(u"<p>a!~~b~~ <del>c</del></p>", md.convert(u"a!~~b~~ ~~c~~"))
+
+    def test_ignored_match_continues_search_after_it(self):
+        md = create_converter()
+        md.inlinePatterns.add(u"first", FirstWordProcessor(u"(\\w+)!"), u"_begin")
+        self.assertEqual(u"<p>not! the first <b>first</b> *x</p>", md.convert(u"not! the first first! *x"))
+
+    def test_lookbehind_sees_text_before_match(self):
+        self.assertEqual(u"<p>a_b_c and <em>d</em></p>", convert(u"a_b_c and _d_", True))
+
+    def test_newline_at_end_of_element_text_is_kept(self):
+        self.assertEqual(u"<p><strong>a<br />\nb<br />\n</strong></p>", convert(u"**a\nb\n**", True))
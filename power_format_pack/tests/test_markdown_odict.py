@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import random
+import unittest
+
+from power_format_pack.markdown import odict
+from power_format_pack.tests.test_markdown_inline import create_converter
+
+
+class RegistryTester(unittest.TestCase):
+    """
+    Check that a Registry, which keeps its values in order and the indexes
+    of its keys, behaves as an OrderedDict after every change.
+    """
+
+    def assert_same(self, expected, registry):
+        self.assertEqual(expected.keys(), registry.keys())
+        self.assertEqual(expected.values(), registry.values())
+        self.assertEqual(expected.items(), registry.items())
+        self.assertEqual(list(expected.itervalues()), list(registry.itervalues()))
+        self.assertEqual(tuple(expected.values()), registry.value_tuple())
+        for i, key in enumerate(expected.keys()):
+            self.assertEqual(i, registry.index(key))
+            self.assertEqual(expected.value_for_index(i), registry.value_for_index(i))
+
+    def change(self, rnd, d, key, value):
+        other = rnd.choice(d.keys() or [u"_"])
+        location = rnd.choice([u"_begin", u"_end", u"<" + other, u">" + other])
+        operation = rnd.randrange(8)
+        if operation == 0:
+            d.add(key, value, location)
+        elif operation == 1:
+            d[key] = value
+        elif operation == 2:
+            d.insert(rnd.randrange(len(d) + 1), key, value)
+        elif operation == 3:
+            d.pop(key, None)
+        elif operation == 4 and key in d:
+            del d[key]
+        elif operation == 5 and key in d:
+            d.link(key, location)
+        elif operation == 6:
+            d.setdefault(key, value)
+        elif operation == 7 and rnd.random() < 0.1:
+            d.clear()
+
+    def test_registry_behaves_as_ordered_dict(self):
+        rnd = random.Random(7)
+        expected = odict.OrderedDict()
+        registry = odict.Registry()
+        for n in xrange(2000):
+            key = u"k{}".format(rnd.randrange(15))
+            state = rnd.getstate()
+            errors = list()
+            for d in [expected, registry]:
+                rnd.setstate(state)
+                try:
+                    self.change(rnd, d, key, n)
+                except ValueError as e:
+                    errors.append(unicode(e))
+            # both or neither raise
+            self.assertIn(len(errors), (0, 2))
+            self.assert_same(expected, registry)
+
+    def test_index_of_missing_key_raises_value_error(self):
+        registry = odict.Registry([(u"a", 1)])
+        self.assertRaises(ValueError, registry.index, u"b")
+        self.assertRaises(ValueError, registry.add, u"b", 2, u"<c")
+        self.assertRaises(ValueError, registry.link, u"a", u"<c")
+        self.assertEqual([u"a"], registry.keys())
+
+    def test_copies_are_registries(self):
+        registry = odict.Registry([(u"a", 1), (u"b", 2)])
+        registry.value_tuple()
+        copy = registry.copy()
+        copy.add(u"c", 3, u"_begin")
+        self.assertIsInstance(copy, odict.Registry)
+        self.assertEqual((3, 1, 2), copy.value_tuple())
+        self.assertEqual((1, 2), registry.value_tuple())
+
+    def test_processors_and_patterns_are_registries(self):
+        md = create_converter()
+        for registry in [md.preprocessors, md.parser.blockprocessors, md.treeprocessors,
+                         md.inlinePatterns, md.postprocessors]:
+            self.assertIsInstance(registry, odict.Registry)
+
+    def test_conversion_with_moved_patterns_uses_new_order(self):
+        md = create_converter()
+        self.assertEqual(u"<p><strong>a</strong></p>", md.convert(u"**a**"))
+        md.inlinePatterns.link(u"emphasis", u"_begin")
+        self.assertEqual(u"<p><em><em>a</em></em></p>", md.convert(u"**a**"))
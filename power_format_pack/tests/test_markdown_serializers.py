@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import sys
+import unittest
+
+from power_format_pack.markdown import serializers, util
+from power_format_pack.tests.test_markdown_inline import CORPUS, create_converter
+
+etree = util.etree
+
+
+class SerializerTester(unittest.TestCase):
+    """
+    Check the HTML and XHTML that the serializers, which walk the tree
+    without recursion, write for elements, text, tails and attributes.
+    """
+
+    def test_elements_with_text_tails_and_attributes(self):
+        root = etree.Element("div", {"b": "x\n\"<&", "a": "a"})
+        root.text = "t<"
+        root.tail = "tail&"
+        etree.SubElement(root, "br").tail = "after"
+        etree.SubElement(root, "script").text = "a<b"
+        comment = etree.Comment("c&")
+        comment.tail = "ct"
+        root.append(comment)
+        etree.SubElement(root, "input", {"checked": "checked"})
+        self.assertEqual(u"<div a=\"a\" b=\"x\n&quot;&lt;&amp;\">t&lt;<br />after<script>a<b</script>"
+                         u"<!--c&amp;-->ct<input checked=\"checked\" /></div>tail&amp;",
+                         serializers.to_xhtml_string(root))
+        # an attribute with its own name as value is a boolean attribute in HTML
+        self.assertEqual(u"<div a b=\"x\n&quot;&lt;&amp;\">t&lt;<br>after<script>a<b</script>"
+                         u"<!--c&amp;-->ct<input checked></div>tail&amp;",
+                         serializers.to_html_string(root))
+
+    def test_element_without_tag_writes_only_its_content(self):
+        root = etree.Element("p")
+        wrapper = etree.SubElement(root, None)
+        wrapper.text = "a"
+        etree.SubElement(wrapper, "i").text = "b"
+        wrapper.tail = "c"
+        etree.SubElement(root, "em").text = "d"
+        self.assertEqual(u"<p>a<i>b</i>c<em>d</em></p>", serializers.to_xhtml_string(root))
+
+    def test_repeated_attribute_values_are_escaped_every_time(self):
+        root = etree.Element("p")
+        for _ in xrange(3):
+            etree.SubElement(root, "abbr", {"title": "A & B"}).text = "AB"
+        self.assertEqual(u"<p>" + u"<abbr title=\"A &amp; B\">AB</abbr>" * 3 + u"</p>",
+                         serializers.to_xhtml_string(root))
+
+    def test_tree_deeper_than_recursion_limit(self):
+        root = element = etree.Element("div")
+        depth = sys.getrecursionlimit() + 100
+        for _ in xrange(depth):
+            element = etree.SubElement(element, "span")
+        element.text = "x"
+        self.assertEqual(u"<div>" + u"<span>" * depth + u"x" + u"</span>" * depth + u"</div>",
+                         serializers.to_xhtml_string(root))
+
+    def test_corpus_converts_to_unicode(self):
+        md = create_converter()
+        for text in CORPUS:
+            self.assertIsInstance(md.convert(text), unicode)
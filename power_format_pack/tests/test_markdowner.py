@@ -3,12 +3,24 @@
 import unittest
 import base64
 import json
+import os
 import time
 
 import sys
 if "/usr/share/anki/" not in sys.path:
     sys.path.append("/usr/share/anki/")
+import power_format_pack
+
+# the vendored Pygments imports itself as a top-level package
+sys.path.insert(0, os.path.dirname(power_format_pack.__file__))
+
+from power_format_pack import const, utility
+from power_format_pack.blockrenderer import BlockRenderer
+from power_format_pack.converterpool import ConverterPool
+from power_format_pack.markdown.extensions import codehilite
+from power_format_pack.markdown.extensions.codehilite import HighlightWatchdog
 from power_format_pack.markdowner import Markdowner
+from power_format_pack.rendercache import RenderCache
 
 
 class MarkdownerTester(unittest.TestCase):
@@ -28,6 +40,9 @@ class MarkdownerTester(unittest.TestCase):
     def markdowner_custom__init__(self, html, current_field):
         self.html           = html
         self.current_field  = current_field
+        self.fingerprint    = None
+        self.unchanged      = False
+        self.has_def_list   = False
 
     def test_get_data_from_field_returns_true_when_html_contains_base64_encoded_dict(self):
         expected    = True
@@ -40,6 +55,69 @@ class MarkdownerTester(unittest.TestCase):
         self.assertEqual(self.data.get("isconverted"), self.markdowner.isconverted)
         self.assertEqual(self.data.get("lastmodified"), self.markdowner._lastmodified)
 
+    def test_is_unchanged_returns_false_when_data_has_no_fingerprint(self):
+        self.markdowner.get_data_from_field()
+        self.assertFalse(self.markdowner.is_unchanged())
+
+    def test_is_unchanged_returns_true_when_field_has_same_html_as_at_conversion(self):
+        html = utility.insert_md_data(u"1-000", u"True", u"- **text**", u"<ul>\n<li><strong>text</strong></li>\n</ul>")
+        # the editor adds alignment and drops the newlines
+        html = html.replace(u"\n", u"").replace(u"<li>", u"<li style=\"text-align: left;\">")
+        markdowner = Markdowner(html, 0)
+        markdowner.get_data_from_field()
+        self.assertTrue(markdowner.is_unchanged())
+
+    def test_is_unchanged_returns_false_when_field_has_been_edited(self):
+        html = utility.insert_md_data(u"1-000", u"True", u"**text**", u"<p><strong>text</strong></p>")
+        markdowner = Markdowner(html.replace(u"<strong>text</strong>", u"<em>text</em>"), 0)
+        markdowner.get_data_from_field()
+        self.assertFalse(markdowner.is_unchanged())
+
+    def test_render_returns_convert_and_html_with_data_when_field_has_no_data(self):
+        markdowner = Markdowner(u"<div>**text**</div>", 0)
+        markdowner.p = {"markdown_classful_pygments": False, "markdown_syntax_style": "tango"}
+        markdowner.note_id_field = u"1-000"
+        markdowner.has_data = markdowner.get_data_from_field()
+        action, html = markdowner.render()
+        self.assertEqual(const.MARKDOWN_CONVERT, action)
+        self.assertTrue(html.startswith(u"<p><strong>text</strong></p>"))
+        self.assertEqual(u"**text**\n", utility.decompress_and_json_load(
+            utility.get_md_data_from_string(html)).get("md"))
+
+    def test_render_returns_revert_and_stored_markdown_when_field_is_unchanged(self):
+        html = utility.insert_md_data(u"1-000", u"True", u"**text**", u"<p><strong>text</strong></p>")
+        markdowner = Markdowner(html, 0)
+        markdowner.get_data_from_field()
+        markdowner.unchanged = True
+        self.assertEqual((const.MARKDOWN_REVERT, u"<div>**text**</div>"), markdowner.render())
+
+    def test_render_returns_none_when_field_is_empty(self):
+        markdowner = Markdowner(u"<div></div>", 0)
+        markdowner.has_data = markdowner.get_data_from_field()
+        self.assertIsNone(markdowner.render())
+
+    def test_code_block_out_of_time_is_not_cached(self):
+        markdowner = Markdowner(u"", 0)
+        markdowner.p = {"markdown_classful_pygments": False, "markdown_syntax_style": "tango"}
+        code = u"x = 1\n" * 50
+        prefs_key = ConverterPool.get_key(markdowner.p)
+        caches = Markdowner.RENDER_CACHE, Markdowner.BLOCK_RENDERER, codehilite.HIGHLIGHT_WATCHDOG
+        try:
+            # fenced code is highlighted before the text is split into blocks
+            for text in [u"```python\n" + code + u"```", u"    :::python\n    " + code.replace(u"\n", u"\n    ")]:
+                Markdowner.RENDER_CACHE = RenderCache()
+                Markdowner.BLOCK_RENDERER = BlockRenderer()
+                codehilite.HIGHLIGHT_WATCHDOG = HighlightWatchdog(time_budget=-1)
+                for _ in range(2):
+                    self.assertNotIn(u"<span", markdowner.convert_markdown_to_html(text))
+                self.assertIsNone(Markdowner.RENDER_CACHE.get(text, prefs_key))
+                # the next session has the time to highlight it
+                codehilite.HIGHLIGHT_WATCHDOG = HighlightWatchdog()
+                self.assertIn(u"<span", markdowner.convert_markdown_to_html(text))
+                self.assertIsNotNone(Markdowner.RENDER_CACHE.get(text, prefs_key))
+        finally:
+            Markdowner.RENDER_CACHE, Markdowner.BLOCK_RENDERER, codehilite.HIGHLIGHT_WATCHDOG = caches
+
     def test_get_data_from_field_returns_false_when_html_contains_corrupted_data(self):
         corrupted_data  = u"randomtext"
         html            = u"<div></div><!----SBAdata:{}---->".format(corrupted_data)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from power_format_pack import profiler
+from power_format_pack.profiler import StageProfiler
+
+
+class ProfilerTester(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "profile.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_record_stage_names_include_enclosing_stages(self):
+        record = StageProfiler.new_record("start")
+        with record.stage("compare"):
+            with record.stage("html_to_markdown"):
+                pass
+        self.assertEqual(["compare/html_to_markdown", "compare"], record.stages.keys())
+
+    def test_record_adds_up_stages_with_same_name(self):
+        record = StageProfiler.new_record("start")
+        for _ in range(2):
+            with record.stage("html_to_markdown"):
+                pass
+        self.assertEqual(1, len(record.stages))
+
+    def test_save_appends_record_as_json_line(self):
+        profile = StageProfiler(self.path)
+        record = profile.new_record("start")
+        with record.stage("html_to_markdown"):
+            pass
+        profile.save(record)
+        profile.save(record)
+        with open(self.path) as f:
+            lines = f.readlines()
+        self.assertEqual(2, len(lines))
+        self.assertEqual("start", json.loads(lines[0])["operation"])
+
+    def test_save_ignores_null_record(self):
+        StageProfiler(self.path).save(profiler.NULL_RECORD)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_save_keeps_last_records_when_log_is_full(self):
+        profile = StageProfiler(self.path, max_records=2)
+        for i in range(5):
+            record = profile.new_record(str(i))
+            with record.stage("stage"):
+                pass
+            profile.save(record)
+        self.assertEqual(["3", "4"], [r["operation"] for r in profile.load()])
+
+    def test_summary_returns_percentiles_per_stage(self):
+        with open(self.path, "w") as f:
+            for ms in range(1, 21):
+                f.write(json.dumps({"operation": "start", "stages": {"html_to_markdown": {"ms": ms, "kb": 0}}}))
+                f.write("\n")
+            f.write("{corrupted\n")
+        summary = StageProfiler(self.path).summary()
+        self.assertEqual(20, summary["html_to_markdown"]["count"])
+        self.assertEqual(10, summary["html_to_markdown"]["p50_ms"])
+        self.assertEqual(19, summary["html_to_markdown"]["p95_ms"])
+
+    def test_get_percentile_returns_none_for_no_values(self):
+        self.assertIsNone(profiler.get_percentile([], 50))
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+
+import power_format_pack
+
+# the vendored Pygments imports itself as a top-level package
+sys.path.insert(0, os.path.dirname(power_format_pack.__file__))
+
+from pygments import format, highlight
+from pygments.formatters import HtmlFormatter, html
+from pygments.lexers import get_lexer_by_name
+from pygments.token import Keyword
+
+SOURCE = u"@decorator\ndef f(x):\n    \"\"\"Doc.\"\"\"\n    return [x ** 2, u'%s' % x]  # comment\n"
+
+
+class StyleSheetTester(unittest.TestCase):
+    """
+    Check that the style sheets that HTML formatters share give the same
+    output as a style sheet that was just compiled.
+    """
+
+    def setUp(self):
+        html._stylesheets.clear()
+
+    def highlight(self, **options):
+        return highlight(SOURCE, get_lexer_by_name("python"), HtmlFormatter(**options))
+
+    def test_formatters_with_same_style_share_style_sheet(self):
+        first = HtmlFormatter(style="monokai", noclasses=True)
+        second = HtmlFormatter(style="monokai", hl_lines=[1])
+        self.assertIs(first.class2style, second.class2style)
+        self.assertIsNot(first.class2style, HtmlFormatter(style="tango").class2style)
+        self.assertIsNot(first.class2style, HtmlFormatter(style="monokai", classprefix="x-").class2style)
+
+    def test_output_is_same_with_shared_style_sheet(self):
+        for options in [dict(style="monokai", noclasses=True), dict(style="tango", classprefix="x-"),
+                        dict(style="emacs", noclasses=True, hl_lines=[2], linenos=True)]:
+            html._stylesheets.clear()
+            expected = self.highlight(**options)
+            self.assertEqual(expected, self.highlight(**options))
+            html._stylesheets.clear()
+            self.assertEqual(expected, self.highlight(**options))
+
+    def test_token_type_without_style_gets_inline_style_of_parent(self):
+        formatter = HtmlFormatter(style="default", noclasses=True)
+        output = format([(Keyword.Custom, u"x"), (Keyword, u"y")], formatter)
+        style = formatter.class2style["k"][0]
+        self.assertIn('<span style="{0}">xy</span>'.format(style), output)
+        output = format([(Keyword.Custom, u"x")], HtmlFormatter(style="default"))
+        self.assertIn('<span class="k k-Custom">x</span>', output)
+
+    def test_style_defs_are_same_with_shared_style_sheet(self):
+        formatter = HtmlFormatter(style="vim")
+        defs = [formatter.get_style_defs(), formatter.get_style_defs([".a", "b"]),
+                HtmlFormatter(style="vim", nobackground=True).get_style_defs(".x")]
+        html._stylesheets.clear()
+        formatter = HtmlFormatter(style="vim")
+        self.assertEqual(defs[0], formatter.get_style_defs())
+        self.assertEqual(defs[1], formatter.get_style_defs([".a", "b"]))
+        self.assertEqual(defs[2], HtmlFormatter(style="vim", nobackground=True).get_style_defs(".x"))
+        self.assertNotEqual(defs[0], defs[2])
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+import sys
+import unittest
+
+import power_format_pack
+
+# the vendored Pygments imports itself as a top-level package
+sys.path.insert(0, os.path.dirname(power_format_pack.__file__))
+
+from pygments import incremental, lexers
+
+SOURCE = open(os.path.join(os.path.dirname(power_format_pack.__file__), "markdowner.py")).read().decode("utf-8")
+LANGUAGES = ["python", "java", "c", "js", "html", "bash", "go", "css", "sql", "haskell"]
+INSERTIONS = [u"", u"\"", u"'''", u"/*", u"*/", u"\n", u"x = 1\n", u"#", u"<!--", u"{", u"}", u"(", u"\"\"\"\n"]
+
+
+class IncrementalLexingTester(unittest.TestCase):
+    """
+    Check that lexing a text again after an edit gives the same tokens as
+    lexing all of it.
+    """
+
+    def edit(self, text, rnd):
+        start = rnd.randrange(len(text))
+        end = min(len(text), start + rnd.randrange(30))
+        return text[:start] + rnd.choice(INSERTIONS) + text[end:]
+
+    def test_relex_gives_same_tokens_as_full_lex(self):
+        rnd = random.Random(42)
+        for alias in LANGUAGES:
+            lexer = lexers.get_lexer_by_name(alias)
+            text = lexer._preprocess_text(SOURCE[:8000])
+            lexed = incremental.lex(lexer, text)
+            for _ in range(20):
+                text = lexer._preprocess_text(self.edit(text, rnd))
+                lexed = incremental.relex(lexer, lexed, text)
+                full = list(lexer.get_tokens_unprocessed(text))
+                self.assertEqual(full, lexed.tokens, alias)
+                again = incremental.lex(lexer, text)
+                self.assertEqual(again.checkpoints, lexed.checkpoints, alias)
+                self.assertEqual(again.first_error, lexed.first_error, alias)
+
+    def test_relex_reuses_tokens_after_edit(self):
+        lexer = lexers.get_lexer_by_name("python")
+        text = lexer._preprocess_text(SOURCE)
+        lexed = incremental.lex(lexer, text)
+        middle = text.index("\n", len(text) // 2) + 1
+        edited = text[:middle] + u"x = 1\n" + text[middle:]
+        relexed = incremental.relex(lexer, lexed, edited)
+        self.assertLess(relexed.relexed_tokens, len(relexed.tokens) // 10)
+        self.assertEqual(list(lexer.get_tokens_unprocessed(edited)), relexed.tokens)
+
+    def test_relex_of_same_text_lexes_nothing(self):
+        lexer = lexers.get_lexer_by_name("python")
+        text = lexer._preprocess_text(u"x = 1\ny = 2\n")
+        lexed = incremental.lex(lexer, text)
+        again = incremental.relex(lexer, lexed, text)
+        self.assertEqual(0, again.relexed_tokens)
+        self.assertEqual(lexed.tokens, again.tokens)
+
+    def test_relex_from_start_after_error(self):
+        lexer = lexers.get_lexer_by_name("go")
+        text = lexer._preprocess_text(u"s := \"abc\n" + u"x := 1\n" * 10)
+        lexed = incremental.lex(lexer, text)
+        edited = text[:-1] + u"\"\n"
+        relexed = incremental.relex(lexer, lexed, edited)
+        self.assertEqual(list(lexer.get_tokens_unprocessed(edited)), relexed.tokens)
+
+    def test_relex_keeps_checkpoints_at_same_position(self):
+        # the semicolon starts a state that is left without matching anything
+        lexer = lexers.get_lexer_by_name("js")
+        text = lexer._preprocess_text(u"a = 1;\n" * 5)
+        lexed = incremental.lex(lexer, text)
+        edited = u"a = 12;" + text[6:]
+        relexed = incremental.relex(lexer, lexed, edited)
+        self.assertEqual(incremental.lex(lexer, edited).checkpoints, relexed.checkpoints)
+        self.assertEqual(list(lexer.get_tokens_unprocessed(edited)), relexed.tokens)
+
+    def test_get_tokens_gives_same_tokens_as_lexer(self):
+        lexer = lexers.get_lexer_by_name("python")
+        text = u"def f(x):\n\treturn x"
+        lexed = incremental.lex(lexer, lexer._preprocess_text(text))
+        self.assertEqual(list(lexer.get_tokens(text)), list(incremental.get_tokens(lexed)))
+
+    def test_can_lex_only_plain_regex_lexers(self):
+        self.assertTrue(incremental.can_lex(lexers.get_lexer_by_name("python")))
+        self.assertFalse(incremental.can_lex(lexers.get_lexer_by_name("python", filters=["whitespace"])))
+        # delegates to other lexers
+        self.assertFalse(incremental.can_lex(lexers.get_lexer_by_name("html+django")))
+        # not a RegexLexer
+        self.assertFalse(incremental.can_lex(lexers.get_lexer_by_name("pycon")))
+
+    def test_get_common_length_counts_shared_start_and_end(self):
+        self.assertEqual(0, incremental.get_common_length(u"", u"abc"))
+        self.assertEqual(3, incremental.get_common_length(u"abc", u"abc"))
+        self.assertEqual(4, incremental.get_common_length(u"abXcd", u"abYYcd"))
+        self.assertEqual(2, incremental.get_common_length(u"aa", u"aaa"))
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+
+import power_format_pack
+
+# the vendored Pygments imports itself as a top-level package
+sys.path.insert(0, os.path.dirname(power_format_pack.__file__))
+
+from pygments import lexers
+from pygments.lexer import RegexLexer, ExtendedRegexLexer, bygroups
+from pygments.lexers._mapping import LEXERS
+from pygments.token import Keyword, Name, Text
+
+# snippets in many languages, to lead the lexers into many of their states
+SAMPLES = [
+    u"",
+    u"plain text, with (parentheses) and 'quotes' and \"double quotes\"\n",
+    u"#!/usr/bin/env python\n# -*- coding: utf-8 -*-\n@decorator\ndef f(x, *args, **kwargs):\n"
+    u"    \"\"\"Doc string.\"\"\"\n    return [i ** 2 for i in range(10) if i % 2] + {'a': 1.5e3}\n"
+    u"class A(object):\n    s = u'%s' % r'\\d+' + b\"\\x00\"\n",
+    u"#include <stdio.h>\n#define MAX(a, b) ((a) > (b) ? (a) : (b))\n/* comment */\n"
+    u"int main(int argc, char **argv) {\n    unsigned long x = 0x1Fu; // done\n"
+    u"    printf(\"%d\\n\", argc);\n    return 0;\n}\n",
+    u"public class Main extends Base implements Runnable {\n    @Override\n"
+    u"    public static void main(String[] args) throws Exception {\n"
+    u"        List<String> l = new ArrayList<>(); char c = '\\n'; l.add(\"x\");\n    }\n}\n",
+    u"(defun fact (n)\n  \"Factorial.\"\n  (if (<= n 1) 1 (* n (fact (- n 1)))))\n"
+    u"(let ((x 'symbol) (y #\\a) (z #(1 2 3))) `(,x ,@y))\n; comment\n",
+    u"<!DOCTYPE html>\n<html lang=\"en\">\n<head><style>body { color: #fff; margin: 0 auto; }</style>\n"
+    u"<script type=\"text/javascript\">var x = /re+gex/g; function f() { return x; }</script></head>\n"
+    u"<body><!-- comment --><p class='a'>&amp; {{ var|filter }} {% if x %}y{% endif %}</p></body></html>\n",
+    u"<?php\n$x = array('a' => 1, \"b\" => $y);\necho \"Value: {$x['a']}\\n\";\n"
+    u"function f($a = null) { return $a ?: 0; } // end\n?>\n",
+    u"SELECT n.id, COUNT(*) AS c FROM notes n LEFT JOIN cards c ON c.nid = n.id\n"
+    u"WHERE n.flds LIKE '%foo%' AND n.mod > 1000 GROUP BY n.id ORDER BY c DESC;\n",
+    u"#!/bin/bash\nfor f in *.txt; do\n  if [ -f \"$f\" ]; then echo \"${f%.txt}\" | sed 's/a/b/g' > /dev/null; fi\n"
+    u"done\nexport PATH=$HOME/bin:$PATH  # comment\ncat <<EOF\nheredoc $x\nEOF\n",
+    u"---\nkey: value\nlist:\n  - item 1\n  - {a: 1, b: [x, y]}\ntext: |\n  block\n",
+    u"{\"a\": [1, 2.5, -3e10, true, false, null], \"b\": {\"c\": \"d\\u00e9\"}}\n",
+    u"diff --git a/x b/x\n--- a/x\n+++ b/x\n@@ -1,2 +1,2 @@\n-old\n+new\n context\n",
+    u"\\documentclass{article}\n\\begin{document}\n$x^2 + \\frac{1}{2}$ % comment\n\\end{document}\n",
+    u"module Main where\nimport Data.List (sort)\nmain :: IO ()\nmain = print $ sort [3, 1, 2] -- c\n",
+    u"fn main() {\n    let mut v: Vec<i32> = vec![1, 2]; // c\n    println!(\"{}\", v.len());\n}\n",
+    u"unicode: \u00e9\u00e8 \u4e2d\u6587 \u2603 and tabs\tand \\ backslashes\n\n\n",
+]
+
+# lexers that backtrack for minutes on the samples containing the text
+# (in both modes), mapped to that text
+SLOW_SAMPLES = {"ScssLexer": u'{"'}
+
+
+class MergedRulesTester(unittest.TestCase):
+    """
+    Check that lexing with the rules of each state merged into one regular
+    expression gives the same tokens as trying the rules one by one.
+    """
+
+    def get_tokens(self, lexer, text, merge_rules):
+        lexer.merge_rules = merge_rules
+        try:
+            return list(lexer.get_tokens(text))
+        finally:
+            del lexer.merge_rules
+
+    def test_bundled_lexers_give_same_tokens_with_merged_rules(self):
+        for key in sorted(LEXERS):
+            cls = lexers.find_lexer_class(LEXERS[key][1])
+            if not issubclass(cls, RegexLexer) or issubclass(cls, ExtendedRegexLexer):
+                continue
+            lexer = cls()
+            for text in SAMPLES:
+                if key in SLOW_SAMPLES and SLOW_SAMPLES[key] in text:
+                    continue
+                self.assertEqual(self.get_tokens(lexer, text, False),
+                                 self.get_tokens(lexer, text, True),
+                                 "{}: {!r}".format(key, text[:40]))
+
+    def test_rules_are_merged_into_one_regex(self):
+        lexer = lexers.get_lexer_by_name("python")
+        tokendefs = type(lexer).get_dispatch_tokendefs(lexer._tokens, True)
+        self.assertLess(len(tokendefs["root"]), len(lexer._tokens["root"]))
+        self.assertTrue(any(rules is not None for _, rules, _, _ in tokendefs["root"]))
+
+    def test_rules_with_own_flags_or_group_references_are_not_merged(self):
+        class TestLexer(RegexLexer):
+            tokens = {
+                "root": [
+                    (r"(?i)select", Keyword),
+                    (r"(['\"])(.*?)(\1)", Name),
+                    (r"(?P<word>\w+)", Name),
+                    (r"\s+", Text),
+                    (r"[a-z]+", Name),
+                ]
+            }
+        lexer = TestLexer()
+        tokendefs = TestLexer.get_dispatch_tokendefs(lexer._tokens, True)
+        self.assertEqual([None, None, None], [rules for _, rules, _, _ in tokendefs["root"]][:3])
+        self.assertEqual(4, len(tokendefs["root"]))
+        self.assertEqual([(Keyword, u"SELECT"), (Text, u" "), (Name, u"'a'"), (Text, u"\n")],
+                         list(lexer.get_tokens(u"SELECT 'a'")))
+
+    def test_callbacks_get_groups_of_their_own_rule(self):
+        class TestLexer(RegexLexer):
+            tokens = {
+                "root": [
+                    (r"(a)(b)", bygroups(Keyword, Name)),
+                    (r"(c)(\s*)(d)", bygroups(Name, Text, Keyword)),
+                    (r"\s+", Text),
+                ]
+            }
+        self.assertEqual([(Name, u"c"), (Text, u" "), (Keyword, u"d"), (Keyword, u"a"), (Name, u"b"),
+                          (Text, u"\n")],
+                         list(TestLexer().get_tokens(u"c dab")))
+
+    def test_large_states_are_split_below_group_limit(self):
+        rules = [(r"(x{{{0}}})(y{{{0}}})".format(i), bygroups(Name, Keyword)) for i in range(1, 60)]
+        TestLexer = type("TestLexer", (RegexLexer,), {"tokens": {"root": rules + [(r"\s+", Text)]}})
+        lexer = TestLexer()
+        tokendefs = TestLexer.get_dispatch_tokendefs(lexer._tokens, True)
+        self.assertGreater(len(tokendefs["root"]), 1)
+        for rexmatch, _, _, _ in tokendefs["root"]:
+            self.assertLessEqual(rexmatch.__self__.groups, 99)
+        text = u"x" * 59 + u"y" * 59
+        self.assertEqual([(Name, u"x" * 59), (Keyword, u"y" * 59), (Text, u"\n")], list(lexer.get_tokens(text)))
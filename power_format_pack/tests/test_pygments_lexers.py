@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import threading
+import unittest
+
+import power_format_pack
+
+# the vendored Pygments imports itself as a top-level package
+sys.path.insert(0, os.path.dirname(power_format_pack.__file__))
+
+from pygments import lexers
+from pygments.lexer import Lexer
+from pygments.lexers._mapping import ANALYSERS, LEXERS
+from pygments.modeline import get_filetype_from_buffer
+from pygments.util import ClassNotFound, itervalues
+
+GUESS_SAMPLES = [
+    "",
+    "just some text",
+    "#!/usr/bin/env python\nprint 'hello'",
+    "#!/usr/bin/env python\nimport numpy\nprint 1\n",
+    "#!/usr/bin/env python\nfrom numpy import zeros\n",
+    "#!/usr/bin/python2.7 -u\nimport sys",
+    "#! /bin/bash\necho $HOME",
+    "#!/usr/bin/env node\nconsole.log(1);",
+    "#!/usr/bin/perl -w\nmy $x = 1;",
+    "#!/usr/bin/env ruby\nputs 1",
+    "#!/bin/sh\nexit 0",
+    "#!/usr/bin/env no-such-interpreter\nfoo",
+    "#include <stdio.h>\nint main(void) { return 0; }",
+    "#include <vector>\nusing namespace std;",
+    "<?php echo 'hi'; ?>",
+    "<html><body><p>text</p></body></html>",
+    "<?xml version=\"1.0\"?><root/>",
+    "diff --git a/x b/x\n--- a/x\n+++ b/x",
+    "--- a/x\n+++ b/x\n@@ -1 +1 @@",
+    "{% extends 'base.html' %}{{ title }}",
+    "import numpy as np\nnp.zeros(3)",
+    "def f(x):\n    return x  # vim: set ft=python:",
+    "x = 1 # vim: set filetype=no-such-type:",
+    "SELECT * FROM notes WHERE id = 1;",
+    "grammar Expr;\nprog: expr;",
+    "(* Coq *)\nTheorem t : True.",
+    "model {\n  y ~ dnorm(0, 1)\n}",
+    "$ ls -l\ntotal 0",
+]
+
+
+def guess_lexer_linear(text):
+    """
+    Guess the lexer class the way `guess_lexer` did before the analyser
+    table and the cache, by analysing the text with every lexer.
+    """
+    ft = get_filetype_from_buffer(text)
+    if ft is not None:
+        try:
+            return type(lexers.get_lexer_by_name(ft))
+        except ClassNotFound:
+            pass
+    best_lexer = [0.0, None]
+    for lexer in lexers._iter_lexerclasses():
+        rv = lexer.analyse_text(text)
+        if rv == 1.0:
+            return lexer
+        if rv > best_lexer[0]:
+            best_lexer[:] = (rv, lexer)
+    return best_lexer[1] if best_lexer[0] else None
+
+
+class PygmentsLexersTester(unittest.TestCase):
+    """
+    Check the lexer indexes against the linear scans over `LEXERS` that
+    they replace.
+    """
+
+    def test_alias_index_finds_same_lexer_as_linear_scan_for_all_aliases(self):
+        index = lexers._get_indexes()[0]
+        for alias in set(alias for info in itervalues(LEXERS) for alias in info[2]):
+            expected = next((module_name, name) for module_name, name, aliases, _, _
+                            in itervalues(LEXERS) if alias in aliases)
+            self.assertEqual(expected, index[alias])
+
+    def test_name_index_finds_same_module_as_linear_scan_for_all_names(self):
+        index = lexers._get_indexes()[1]
+        for info in itervalues(LEXERS):
+            expected = next(module_name for module_name, name, _, _, _
+                            in itervalues(LEXERS) if name == info[1])
+            self.assertEqual(expected, index[info[1]])
+
+    def test_filename_index_finds_same_matches_as_linear_scan(self):
+        filenames = set(["Makefile", "a.tar.gz", "x.c.c", "CMakeLists.txt", ".bashrc", "foo.", "x", "test.php5"])
+        for info in itervalues(LEXERS):
+            for pattern in info[3]:
+                filenames.add(pattern.replace("*", "a.b").replace("?", "x").replace("[", "").replace("]", ""))
+        for fn in filenames:
+            expected = [(module_name, name, pattern)
+                        for module_name, name, _, patterns, _ in itervalues(LEXERS)
+                        for pattern in patterns if lexers._fn_matches(fn, pattern)]
+            actual = [match[1:] for match in lexers._find_filename_matches(fn)]
+            self.assertEqual(expected, actual, fn)
+
+    def test_get_lexer_by_name_ignores_case_of_alias(self):
+        self.assertEqual("Python", lexers.get_lexer_by_name("PyThOn").name)
+
+    def test_get_lexer_by_name_throws_class_not_found_for_unknown_alias(self):
+        self.assertRaises(ClassNotFound, lexers.get_lexer_by_name, "no-such-language")
+        self.assertRaises(ClassNotFound, lexers.get_lexer_by_name, "")
+
+    def test_get_lexer_for_filename_returns_lexer_for_extension(self):
+        self.assertEqual("Python", lexers.get_lexer_for_filename("/tmp/test.py").name)
+        self.assertRaises(ClassNotFound, lexers.get_lexer_for_filename, "test.no-such-extension")
+
+    def test_analysers_are_the_lexers_that_implement_analyse_text(self):
+        for key in LEXERS:
+            lexer = lexers.find_lexer_class(LEXERS[key][1])
+            analyser = next(cls for cls in lexer.__mro__ if "analyse_text" in cls.__dict__)
+            self.assertEqual(analyser is not Lexer, key in ANALYSERS, key)
+
+    def test_guess_lexer_finds_same_lexer_as_linear_scan(self):
+        for text in GUESS_SAMPLES:
+            lexers._guess_cache.clear()
+            expected = guess_lexer_linear(text)
+            try:
+                actual = type(lexers.guess_lexer(text))
+            except ClassNotFound:
+                actual = None
+            self.assertEqual(expected, actual, text)
+
+    def test_guess_lexer_remembers_guess_for_same_text(self):
+        lexers._guess_cache.clear()
+        text = "#include <stdio.h>\nint x;"
+        lexer = lexers.guess_lexer(text, stripnl=False)
+        self.assertEqual(1, len(lexers._guess_cache))
+        again = lexers.guess_lexer(text)
+        self.assertIs(type(lexer), type(again))
+        self.assertIsNot(lexer, again)
+        self.assertFalse(lexer.stripnl)
+        self.assertEqual(1, len(lexers._guess_cache))
+
+    def test_guess_lexer_remembers_that_no_lexer_matches(self):
+        lexers._guess_cache.clear()
+        self.assertRaises(ClassNotFound, lexers.guess_lexer, u"just some text")
+        self.assertRaises(ClassNotFound, lexers.guess_lexer, u"just some text")
+        self.assertEqual(1, len(lexers._guess_cache))
+
+    def test_guess_lexer_on_threads_at_once(self):
+        # more texts than the cache holds, so that the threads keep removing
+        # each other's guesses
+        texts = ["#include <stdio.h>\nint x%d;" % i for i in range(lexers._GUESS_CACHE_SIZE + 20)]
+        texts.append(u"just some text")
+        errors = list()
+
+        def guess():
+            try:
+                for text in texts:
+                    try:
+                        self.assertEqual("C", lexers.guess_lexer(text).name)
+                    except ClassNotFound:
+                        self.assertEqual(u"just some text", text)
+            except Exception as e:
+                errors.append(e)
+
+        # switch threads as often as possible
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        try:
+            threads = [threading.Thread(target=guess) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setcheckinterval(interval)
+        self.assertEqual([], errors)
+        self.assertEqual(lexers._GUESS_CACHE_SIZE, len(lexers._guess_cache))
+
+    def test_find_lexer_class_returns_none_for_unknown_name(self):
+        self.assertIsNone(lexers.find_lexer_class("No Such Language"))
+        self.assertEqual("JSON", lexers.find_lexer_class("JSON").name)
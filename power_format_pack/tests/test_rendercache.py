@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from power_format_pack.rendercache import RenderCache
+
+
+class RenderCacheTester(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "render_cache.json")
+        self.prefs_key = (False, u"tango", False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_get_returns_none_and_counts_miss_when_md_is_not_cached(self):
+        cache = RenderCache()
+        self.assertIsNone(cache.get(u"**text**", self.prefs_key))
+        self.assertEqual(1, cache.stats()["misses"])
+
+    def test_get_returns_html_and_counts_hit_when_md_is_cached(self):
+        cache = RenderCache()
+        cache.put(u"**текст**", self.prefs_key, u"<p><strong>текст</strong></p>")
+        self.assertEqual(u"<p><strong>текст</strong></p>", cache.get(u"**текст**", self.prefs_key))
+        self.assertEqual(1, cache.stats()["hits"])
+
+    def test_put_evicts_least_recently_used_entry(self):
+        cache = RenderCache(max_entries=2)
+        cache.put(u"a", self.prefs_key, u"<p>a</p>")
+        cache.put(u"b", self.prefs_key, u"<p>b</p>")
+        cache.get(u"a", self.prefs_key)
+        cache.put(u"c", self.prefs_key, u"<p>c</p>")
+        self.assertIsNone(cache.get(u"b", self.prefs_key))
+        self.assertEqual(u"<p>a</p>", cache.get(u"a", self.prefs_key))
+
+    def test_get_returns_none_after_preferences_change(self):
+        cache = RenderCache()
+        cache.put(u"a", self.prefs_key, u"<p>a</p>")
+        cache.get(u"b", (False, u"monokai", False))
+        self.assertIsNone(cache.get(u"a", self.prefs_key))
+        self.assertEqual(0, cache.stats()["memory_entries"])
+
+    def test_save_persists_entries_for_new_cache_with_same_path(self):
+        cache = RenderCache(path=self.path)
+        cache.put(u"a", self.prefs_key, u"<p>a</p>")
+        cache.save()
+        new_cache = RenderCache(path=self.path)
+        self.assertEqual(u"<p>a</p>", new_cache.get(u"a", self.prefs_key))
+
+    def test_saved_entries_are_ignored_when_preferences_differ(self):
+        cache = RenderCache(path=self.path)
+        cache.put(u"a", self.prefs_key, u"<p>a</p>")
+        cache.save()
+        new_cache = RenderCache(path=self.path)
+        self.assertIsNone(new_cache.get(u"a", (False, u"tango", True)))
+
+    def test_get_returns_none_when_saved_file_is_corrupted(self):
+        with open(self.path, "w") as f:
+            f.write("{corrupted")
+        cache = RenderCache(path=self.path)
+        self.assertIsNone(cache.get(u"a", self.prefs_key))
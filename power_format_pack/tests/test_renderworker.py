@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+
+from power_format_pack.renderworker import RenderWorker
+
+
+class Note(object):
+
+    def __init__(self, note_id):
+        self.id = note_id
+
+
+class Markdowner(object):
+    """
+    Stand-in for `Markdowner` that renders `result` once `release` is set.
+    """
+
+    def __init__(self, note, current_field, result):
+        self.note = note
+        self.current_field = current_field
+        self.result = result
+        self.release = threading.Event()
+        self.prepared = 0
+        self.applied = list()
+
+    def prepare(self):
+        self.prepared += 1
+
+    def render(self):
+        self.release.wait(5)
+        return self.result
+
+    def apply(self, result):
+        self.applied.append(result)
+
+    def is_current(self):
+        return True
+
+    def show_rendering_state(self):
+        pass
+
+    def hide_rendering_state(self):
+        pass
+
+    def save_profile(self):
+        pass
+
+
+class Signal(object):
+    """
+    Call `slot` on the thread that emits, and record that it was called.
+    """
+
+    def __init__(self, slot):
+        self.slot = slot
+        self.emitted = threading.Event()
+
+    def emit(self, *args):
+        self.slot(*args)
+        self.emitted.set()
+
+
+class RenderWorkerTester(unittest.TestCase):
+
+    def setUp(self):
+        self.worker = RenderWorker()
+        self.worker.rendered = Signal(self.worker._on_rendered)
+        self.note = Note(1)
+
+    def test_submit_while_field_renders_is_ignored(self):
+        first = Markdowner(self.note, 0, u"first")
+        second = Markdowner(self.note, 0, u"second")
+        self.assertTrue(self.worker.submit(first))
+        self.assertFalse(self.worker.submit(second))
+        first.release.set()
+        self.assertTrue(self.worker.rendered.emitted.wait(5))
+        self.assertEqual((1, 0), (first.prepared, second.prepared))
+        self.assertEqual([u"first"], first.applied)
+        self.assertEqual([], second.applied)
+        # once the field is rendered, it can be submitted again
+        self.worker.rendered.emitted.clear()
+        second.release.set()
+        self.assertTrue(self.worker.submit(second))
+        self.assertTrue(self.worker.rendered.emitted.wait(5))
+        self.assertEqual([u"second"], second.applied)
+
+    def test_other_fields_render_at_the_same_time(self):
+        first = Markdowner(self.note, 0, u"first")
+        other = Markdowner(self.note, 1, u"other")
+        self.assertTrue(self.worker.submit(first))
+        self.assertTrue(self.worker.submit(other))
+        self.assertEqual((1, 1), (first.prepared, other.prepared))
+        first.release.set()
+        other.release.set()
+
+    def test_only_result_of_newest_token_is_applied(self):
+        old = Markdowner(self.note, 0, u"old")
+        new = Markdowner(self.note, 0, u"new")
+        self.worker._latest[RenderWorker.get_key(new)] = 2
+        self.worker._on_rendered(old, 1, old.result, None, None)
+        self.worker._on_rendered(new, 2, new.result, None, None)
+        self.assertEqual([], old.applied)
+        self.assertEqual([u"new"], new.applied)
+        self.assertEqual({}, self.worker._latest)
+
+    def test_failed_prepare_does_not_block_field(self):
+        markdowner = Markdowner(self.note, 0, u"result")
+        markdowner.prepare = lambda: 1 / 0
+        self.assertRaises(ZeroDivisionError, self.worker.submit, markdowner)
+        self.assertEqual({}, self.worker._latest)
+
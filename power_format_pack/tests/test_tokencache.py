@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+
+import power_format_pack
+
+# the vendored Pygments imports itself as a top-level package
+sys.path.insert(0, os.path.dirname(power_format_pack.__file__))
+
+from pygments import lexer
+from pygments.lexer import words
+from pygments.lexers.python import PythonLexer
+from pygments.tokencache import TokenCache
+
+MODULE = "pygments.lexers.python"
+
+
+class TokenCacheTester(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = TokenCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_compiled_pattern_matches_like_re_compile(self):
+        regex = r"(?P<name>[a-z]+)(\d*)\s*(?:#.*)?$"
+        self.cache.compile(MODULE, regex, re.M)
+        self.cache.save()
+        pattern = TokenCache(self.directory).compile(MODULE, regex, re.M)
+        expected = re.compile(regex, re.M)
+        for text in [u"abc12 # comment", u"ABC", u"x\ny1"]:
+            self.assertEqual(expected.match(text).groups() if expected.match(text) else None,
+                             pattern.match(text).groups() if pattern.match(text) else None)
+        self.assertEqual(expected.groupindex, pattern.groupindex)
+        self.assertEqual(expected.flags, pattern.flags)
+
+    def test_saved_regex_is_not_compiled_again_in_later_session(self):
+        self.cache.compile(MODULE, r"\w+", re.M)
+        self.cache.save()
+        later = TokenCache(self.directory)
+        later.compile(MODULE, r"\w+", re.M)
+        later.compile(MODULE, r"\w+", 0)
+        self.assertEqual((1, 1), (later.hits, later.misses))
+
+    def test_expand_remembers_regex_of_words(self):
+        future = words(("if", "else", "elif"), suffix=r"\b")
+        self.assertEqual(future.get(), self.cache.expand(MODULE, future))
+        self.cache.save()
+        later = TokenCache(self.directory)
+        self.assertEqual(future.get(), later.expand(MODULE, future))
+
+    def test_cache_file_is_ignored_when_it_is_not_valid(self):
+        with open(os.path.join(self.directory, MODULE + ".cache"), "wb") as f:
+            f.write(b"no marshal data")
+        self.cache.compile(MODULE, r"\w+", 0)
+        self.assertEqual(1, self.cache.misses)
+
+    def test_without_directory_nothing_is_saved(self):
+        cache = TokenCache()
+        self.assertEqual(re.compile(r"\w+").pattern, cache.compile(MODULE, r"\w+", 0).pattern)
+        cache.save()
+        self.assertEqual((0, 0), (cache.hits, cache.misses))
+
+    def test_lexer_gives_same_tokens_with_cached_patterns(self):
+        text = u"@decorator\ndef f(x, *args):\n    return [i ** 2 for i in x if i] # c\n"
+        expected = list(PythonLexer().get_tokens(text))
+        original = lexer.TOKEN_CACHE
+        try:
+            for _ in range(2):
+                lexer.TOKEN_CACHE = TokenCache(self.directory)
+                # a new class, so that its token definitions are processed
+                lexer_class = type("CachedPythonLexer", (PythonLexer,), {"__module__": MODULE})
+                self.assertEqual(expected, list(lexer_class().get_tokens(text)))
+            self.assertGreater(lexer.TOKEN_CACHE.hits, 0)
+            self.assertEqual(0, lexer.TOKEN_CACHE.misses)
+        finally:
+            lexer.TOKEN_CACHE = original
@@ -4,6 +4,7 @@ import re
 import base64
 import json
 import sys
+import zlib
 
 import power_format_pack.markdowner
 
@@ -239,6 +240,47 @@ blah
         actual = utility.replace_link_img_matches(self.whitespace_regex, "&#32;", image)
         self.assertEqual(expected, actual)
 
+    def test_replace_link_img_matches_replaces_link_not_earlier_occurrence_of_same_text_in_code(self):
+        image = u"`(a b)` ![](a b)"
+        expected = u"`(a b)` ![](a&#32;b)"
+        actual = utility.replace_link_img_matches(self.whitespace_regex, u"&#32;", image)
+        self.assertEqual(expected, actual)
+
+    def test_replace_link_img_matches_replaces_whitespace_in_10000_imgs(self):
+        image = u"![](image {}.jpg) `![](code {}.jpg)`\n"
+        s = u"".join(image.format(i, i) for i in range(10000))
+        expected = u"".join(u"![](image&#32;{}.jpg) `![](code {}.jpg)`\n".format(i, i) for i in range(10000))
+        actual = utility.replace_link_img_matches(self.whitespace_regex, u"&#32;", s)
+        self.assertEqual(expected, actual)
+
+    # escape_link_img_matches
+    def test_escape_link_img_matches_applies_all_rules_in_order(self):
+        rules = ((self.left_paren_regex, u"&#40;"),
+                 (self.right_paren_regex, u"&#41;"),
+                 (self.whitespace_regex, u"&#32;"))
+        image = u"![](image \\(1\\).jpg) ![](image \\(1\\).jpg)"
+        expected = u"![](image&#32;&#40;1&#41;.jpg) ![](image&#32;&#40;1&#41;.jpg)"
+        actual = utility.escape_link_img_matches(rules, image)
+        self.assertEqual(expected, actual)
+
+    def test_escape_link_img_matches_escapes_10000_imgs_but_not_links_or_code(self):
+        rules = ((self.left_paren_regex, u"&#40;"),
+                 (self.right_paren_regex, u"&#41;"),
+                 (self.whitespace_regex, u"&#32;"))
+        image = u"![{0}](img \\({0}\\).png) [link](a b) ```![](c d)```\n"
+        s = u"".join(image.format(i) for i in range(10000))
+        expected = u"".join(u"![{0}](img&#32;&#40;{0}&#41;.png) [link](a b) ```![](c d)```\n".format(i)
+                            for i in range(10000))
+        actual = utility.escape_link_img_matches(rules, s)
+        self.assertEqual(expected, actual)
+
+    # get_code_spans
+    def test_get_code_spans_returns_empty_lists_when_no_code(self):
+        self.assertEqual(([], []), utility.get_code_spans(u"![](a b)"))
+
+    def test_get_code_spans_ignores_inline_code_inside_fenced_code(self):
+        self.assertEqual(([0], [10]), utility.get_code_spans(u"```a `b` c```"))
+
     # filter_indices
     def test_filter_indices_does_not_change_anything_when_no_overlap(self):
         positions1 = [[0, 20]]
@@ -674,6 +716,31 @@ blah
         actual = utility.strip_html_from_markdown(html)
         self.assertEqual(expected, actual)
 
+    # HtmlToMarkdown
+    def test_html_to_markdown_removes_whitespace_before_definitions_and_abbreviations(self):
+        html = u"<dl><dt>term</dt><dd>definition</dd></dl><div> *[HTML]: Hyper Text</div>"
+        expected = u"term\n: definition\n*[HTML]: Hyper Text\n"
+        pipeline = utility.HtmlToMarkdown(fix_abbreviations=True)
+        actual = pipeline.convert(utility.put_colons_in_html_def_list(html), has_def_list=True)
+        self.assertEqual(expected, actual)
+
+    def test_html_to_markdown_records_timings_of_stages_that_were_run(self):
+        pipeline = utility.HtmlToMarkdown(fix_abbreviations=True)
+        pipeline.convert(u"<div>one</div>")
+        # there is no abbreviation to fix
+        self.assertEqual(["html2text", "lines", "links"], pipeline.timings.keys())
+        pipeline.convert(u"<div>one</div><div> *[HTML]: Hyper Text</div>")
+        self.assertEqual(["html2text", "lines", "links", "abbreviations"], pipeline.timings.keys())
+
+    def test_get_html2text_disables_escaping_of_markdown_characters(self):
+        self.assertIs(utility.escape_md_section_override, utility.get_html2text().escape_md_section)
+        self.assertIs(utility.get_html2text(), utility.get_html2text())
+
+    def test_html_to_markdown_gives_same_result_when_used_twice(self):
+        html = u"<p>![](image (1).jpg)</p><div>two</div>"
+        pipeline = utility.HtmlToMarkdown()
+        self.assertEqual(pipeline.convert(html), pipeline.convert(html))
+
     # convert_clean_md_to_html
     def test_convert_clean_md_to_html_throws_assertion_error_when_input_is_not_unicode(self):
         s = ""
@@ -752,6 +819,24 @@ blah
         actual = utility.convert_clean_md_to_html(s, put_breaks=True)
         self.assertEqual(expected, actual)
 
+    def test_convert_clean_md_to_html_escapes_bare_ampersands_and_brackets_but_not_entities(self):
+        s = u"a & b > c &amp; d &#32; e"
+        expected = u"<div>a &amp; b &gt; c &amp; d &#32; e</div>"
+        actual = utility.convert_clean_md_to_html(s)
+        self.assertEqual(expected, actual)
+
+    def test_convert_clean_md_to_html_returns_div_with_break_when_line_has_nbsp_without_semicolons(self):
+        s = u"a\n&nbsp &nbsp"
+        expected = u"<div>a</div><div><br /></div>"
+        actual = utility.convert_clean_md_to_html(s)
+        self.assertEqual(expected, actual)
+
+    def test_convert_clean_md_to_html_parses_tags_in_input(self):
+        s = u"<b>a\n\nb</b>"
+        expected = u"<div><b>a</b></div><div><br /></div><div>b</div>"
+        actual = utility.convert_clean_md_to_html(s, put_breaks=True)
+        self.assertEqual(expected, actual)
+
     # convert_markdown_to_html
     def test_convert_markdown_to_html_throws_assertion_error_when_input_is_not_unicode(self):
         s = ""
@@ -794,6 +879,12 @@ blah
         actual = utility.get_md_data_from_string(s)
         self.assertEqual(expected, actual)
 
+    def test_get_md_data_from_string_returns_data_when_version_2_markers_are_present(self):
+        s = u"<div></div><!----SBAdata2:eNqrVkpUsjKsBQAIKgIJ---->"
+        expected = u"eNqrVkpUsjKsBQAIKgIJ"
+        actual = utility.get_md_data_from_string(s)
+        self.assertEqual(expected, actual)
+
     def test_get_md_data_from_string_returns_empty_string_when_data_part_is_empty(self):
         s = u"<div></div><!----SBAdata:---->"
         expected = u""
@@ -838,19 +929,57 @@ blah
         actual = utility.decompress_and_json_load(data)
         self.assertEqual(expected, actual)
 
+    def test_decompress_and_json_load_returns_valid_json_when_data_is_zlib_compressed(self):
+        d = dict(a=u"один")
+        data = unicode(base64.b64encode(zlib.compress(json.dumps(d))))
+        expected = d
+        actual = utility.decompress_and_json_load(data)
+        self.assertEqual(expected, actual)
+
+    def test_decompress_and_json_load_returns_corrupted_when_compressed_data_is_truncated(self):
+        data = unicode(base64.b64encode(zlib.compress(json.dumps(dict(a=u"one")))[:-4]))
+        expected = "corrupted"
+        actual = utility.decompress_and_json_load(data)
+        self.assertEqual(expected, actual)
+
     # json_dump_and_compress
-    def test_json_dump_and_compress_returns_base64_string_when_input_is_dict(self):
+    def test_json_dump_and_compress_returns_compressed_base64_string_when_input_is_dict(self):
         data = dict(a="one")
-        expected = unicode(base64.b64encode(json.dumps(data)))
+        expected = unicode(base64.b64encode(zlib.compress(b'{"a":"one"}', 9)))
         actual = utility.json_dump_and_compress(data)
         self.assertEqual(expected, actual)
 
-    def test_json_dump_and_compress_returns_base64_string_when_input_is_russian(self):
+    def test_json_dump_and_compress_returns_compressed_base64_string_when_input_is_russian(self):
         data = u"привет"
-        expected = unicode(base64.b64encode(json.dumps(data)))
+        expected = unicode(base64.b64encode(zlib.compress(json.dumps(data, ensure_ascii=False).encode("utf-8"), 9)))
         actual = utility.json_dump_and_compress(data)
         self.assertEqual(expected, actual)
 
+    def test_json_dump_and_compress_output_is_read_by_decompress_and_json_load(self):
+        data = dict(id=u"1-000", isconverted=u"True", md=u"**привет**\n" * 100)
+        expected = data
+        actual = utility.decompress_and_json_load(utility.json_dump_and_compress(data))
+        self.assertEqual(expected, actual)
+
+    # insert_md_data
+    def test_insert_md_data_appends_data_with_version_2_marker(self):
+        html = utility.insert_md_data(u"1-000", u"True", u"**text**", u"<p><strong>text</strong></p>")
+        self.assertTrue(html.startswith(u"<p><strong>text</strong></p><!----SBAdata2:"))
+        self.assertTrue(html.endswith(u"---->"))
+        md_dict = utility.decompress_and_json_load(utility.get_md_data_from_string(html))
+        self.assertEqual(u"**text**", md_dict.get("md"))
+
+    # find_md_data
+    def test_find_md_data_returns_minus_ones_when_input_contains_no_data(self):
+        self.assertEqual((-1, -1), utility.find_md_data(u"<div></div>"))
+
+    def test_find_md_data_returns_minus_ones_when_end_marker_is_missing(self):
+        self.assertEqual((-1, -1), utility.find_md_data(u"<div></div><!----SBAdata2:abc"))
+
+    def test_find_md_data_returns_span_of_old_data(self):
+        s = u"<div></div><!----SBAdata:abc----><div></div>"
+        self.assertEqual((11, 33), utility.find_md_data(s))
+
     # is_same_markdown
     def test_is_same_markdown_throws_assertion_error_when_input_is_not_unicode(self):
         s1 = ""
@@ -22,18 +22,26 @@ Utility module with helper functions that are needed throughout the addon.
 """
 
 import base64
+import bisect
+import collections
+import contextlib
+import hashlib
 import re
 import string
 import time
+import timeit
+import zlib
 
-import BeautifulSoup
 from PyQt4 import QtGui
 
 import const
 from anki.utils import intTime, json, isMac
 from aqt.utils import isWin
-from html2text import html2text
 from html2text_overrides import escape_md_section_override
+from power_format_pack.lazyimport import lazy_module
+
+BeautifulSoup = lazy_module("BeautifulSoup")
+html2text = lazy_module("power_format_pack.html2text.html2text")
 
 
 def validate_key_sequence(sequence, platform=u""):
@@ -154,6 +162,118 @@ def get_keybinding(keybindings, name_of_key):
     return string.capwords(keybinding, u"+")
 
 
+class HtmlToMarkdown(object):
+    """
+    Convert HTML to Markdown with `html2text`, followed by the fixes that are
+    needed to get back the Markdown that was typed by the user. The pipeline
+    is configured once and can be used for any number of conversions. The
+    time (in seconds) spent in each stage of the last conversion can be found
+    in `timings`.
+
+    The fixes stay separate passes over the Markdown: they depend on their
+    order, and the links and definition lists need the whole text. Each
+    pass is skipped when the text it fixes does not occur.
+
+    >>> HtmlToMarkdown().convert(u"<p>1. this <strong>was</strong></p><p></p>")
+    u'1. this **was**\\n'
+    """
+
+    def __init__(self, keep_empty_lines=False, fix_abbreviations=False,
+                 add_newline_to_dd=False):
+        self.keep_empty_lines   = keep_empty_lines
+        self.fix_abbreviations  = fix_abbreviations
+        self.add_newline_to_dd  = add_newline_to_dd
+        self.timings            = collections.OrderedDict()
+
+    def convert(self, html, has_def_list=False):
+        """
+        Return the Markdown for `html`. When `has_def_list` is `True`, the
+        whitespace before the definitions of a definition list is removed.
+        """
+
+        if not html:
+            return u""
+
+        assert isinstance(html, unicode), "Input `html` is not Unicode"
+
+        timings = collections.OrderedDict()
+        timer = Timer(timings)
+
+        with timer.stage("html2text"):
+            h2t = get_html2text().HTML2Text()
+            h2t.body_width = 0
+            md = h2t.handle(html)
+
+        with timer.stage("lines"):
+            if not self.keep_empty_lines:
+                # remove white lines
+                md = u"".join(line + u"\n" for line in md.split(u"\n") if line)
+            # undo the html2text escaping of dots (which interferes
+            # with the creation of ordered lists)
+            if u"\\." in md:
+                md = const.ESCAPED_DOT_REGEX.sub(ur"\g<1>\g<2>", md)
+
+        with timer.stage("links"):
+            # this is needed to keep inner parentheses and whitespace in
+            # links and images from prematurely ending the Markdown syntax;
+            # e.g. ![](image (1).jpg) would otherwise break on the whitespace
+            # in the filename and the inner parentheses, so we change it to
+            # ![](image&#32;&#40;1&#41;.jpg) to prevent this from happening
+            md = escape_link_img_matches(const.LINK_IMG_ESCAPE_RULES, md)
+
+        if has_def_list:
+            with timer.stage("def_list"):
+                md = remove_leading_whitespace_from_dd_element(md, self.add_newline_to_dd)
+
+        if self.fix_abbreviations and u"*[" in md:
+            with timer.stage("abbreviations"):
+                md = remove_whitespace_before_abbreviation_definition(md)
+
+        self.timings = timings
+
+        assert isinstance(md, unicode)
+        return md
+
+
+def get_html2text():
+    """
+    Return the `html2text` module, with the escaping of Markdown-sensitive
+    characters disabled. The module is imported and changed the first time
+    HTML is converted, not when this module is imported.
+    """
+    global _html2text_patched
+    if not _html2text_patched:
+        html2text.escape_md_section = escape_md_section_override
+        _html2text_patched = True
+    return html2text
+
+
+_html2text_patched = False
+
+
+class Timer(object):
+    """
+    Measure the wall time of named stages and store the results, in
+    seconds, in the dictionary `timings`.
+    """
+
+    def __init__(self, timings):
+        self.timings = timings
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = timeit.default_timer()
+        try:
+            yield
+        finally:
+            self.timings[name] = (self.timings.get(name, 0.0) +
+                                  timeit.default_timer() - start)
+
+
+HTML_TO_MARKDOWN = HtmlToMarkdown()
+HTML_TO_MARKDOWN_WITH_EMPTY_LINES = HtmlToMarkdown(keep_empty_lines=True)
+
+
 def strip_html_from_markdown(org_html, keep_empty_lines=False):
     """
     Take an `org_html` string and return a Markdown string. Empty lines are
@@ -163,47 +283,9 @@ def strip_html_from_markdown(org_html, keep_empty_lines=False):
     u'this **was** a _triumph_!\\n'
     """
 
-    if not org_html:
-        return u""
-
-    assert isinstance(org_html, unicode), "Input `org_html` is not Unicode"
-
-    # disable the escaping of Markdown-sensitive characters
-    html2text.escape_md_section = escape_md_section_override
-    h2t = html2text.HTML2Text()
-    h2t.body_width = 0
-    md_text = h2t.handle(org_html)
-    clean_md = u""
     if keep_empty_lines:
-        clean_md = md_text
-    else:
-        # remove white lines
-        for line in md_text.split(u"\n"):
-            if line:
-                clean_md += (line + u"\n")
-
-    # undo the html2text escaping of dots (which interferes
-    # with the creation of ordered lists)
-    dot_regex = re.compile(ur"(\d+)\\(\.\s)")
-    clean_md = re.sub(dot_regex, ur"\g<1>\g<2>", clean_md)
-
-    # this is needed to keep inner parentheses and whitespace in links and
-    # images from prematurely ending the Markdown syntax; e.g.
-    # ![](image (1).jpg) would otherwise break on the whitespace in the
-    # filename and the inner parentheses, so we change it to
-    # ![](image&#32;&#40;1&#41;.jpg) to prevent this from happening
-    left_paren_regex = re.compile(ur"\\\(")
-    clean_md = replace_link_img_matches(
-            left_paren_regex, u"&#40;", clean_md)
-    right_paren_regex = re.compile(ur"\\\)")
-    clean_md = replace_link_img_matches(
-            right_paren_regex, u"&#41;", clean_md)
-    whitespace_regex = re.compile(ur"\s+")
-    clean_md = replace_link_img_matches(
-            whitespace_regex, u"&#32;", clean_md)
-
-    assert isinstance(clean_md, unicode)
-    return clean_md
+        return HTML_TO_MARKDOWN_WITH_EMPTY_LINES.convert(org_html)
+    return HTML_TO_MARKDOWN.convert(org_html)
 
 
 def get_indices(haystack, needle, needle_end=u""):
@@ -273,33 +355,97 @@ def replace_link_img_matches(regex, new, s):
 
     assert isinstance(s, unicode), "Input `s` is not Unicode"
 
-    # don't escape anything when we're in a (inline) code block
+    return escape_link_img_matches(((regex, new),), s)
+
+
+def get_code_spans(s):
+    """
+    Return a tuple of two lists that together describe where the inline code
+    blocks and the fenced code blocks in `s` are: the start positions, sorted,
+    and for each start position the largest end position of the code blocks
+    that start there or earlier. Inline code blocks are filtered like
+    `filter_indices` does, but without comparing every pair of blocks.
+
+    >>> get_code_spans(u"a `b` c ```d```")
+    ([2, 8], [4, 12])
+    """
     positions1 = get_indices(s, "`")
     positions3 = get_indices(s, "```")
-    filter_indices(positions1, positions3)
-    positions_combined = filter(lambda x: x[0] > -1 and x[1] > -1,
-                                positions1 + positions3)
-
-    result = re.finditer(const.IS_LINK_OR_IMG_REGEX, s)
-    if result:
-        for match in result:
-            # see if match is inside a code block
-            skip = False
-            start_match, end_match = match.span()
-            for (start_code, end_code) in positions_combined:
-                if start_match >= start_code and end_match <= end_code:
-                    skip = True
-                    break
-
-            if not skip:
-                str_to_be_replaced = match.group(1)
-                start = s.find(str_to_be_replaced)
-                end = start + len(str_to_be_replaced)
-                replacement = re.sub(regex, new, str_to_be_replaced)
-                # put string back in original string
-                str_start = s[:start]
-                str_end = s[end:]
-                s = str_start + replacement + str_end
+    fence_starts = [start for start, end in positions3]
+    fence_ends = [end for start, end in positions3 if end > -1]
+    closed_fences = [pos for pos in positions3 if pos[1] > -1]
+    closed_fence_starts = [start for start, end in closed_fences]
+
+    positions_combined = closed_fences[:]
+    for start, end in positions1:
+        if start == -1 or end == -1:
+            continue
+        # a fenced code block starts inside the inline code block
+        index = bisect.bisect_left(fence_starts, start)
+        if index < len(fence_starts) and fence_starts[index] <= end:
+            continue
+        # a fenced code block ends inside (or right before) the inline block
+        index = bisect.bisect_left(fence_ends, start - 2)
+        if index < len(fence_ends) and fence_ends[index] <= end:
+            continue
+        # the inline code block is inside a fenced code block
+        index = bisect.bisect_right(closed_fence_starts, start - 2) - 1
+        if index > -1 and closed_fences[index][1] >= end:
+            continue
+        positions_combined.append([start, end])
+    positions_combined.sort()
+
+    starts = list()
+    max_ends = list()
+    max_end = -1
+    for start, end in positions_combined:
+        max_end = max(max_end, end)
+        starts.append(start)
+        max_ends.append(max_end)
+    return starts, max_ends
+
+
+def escape_link_img_matches(rules, s):
+    """
+    Escape characters in Markdown image links that may break in regular HTML.
+    `rules` is a sequence of `(regex, new)` tuples that are applied in order
+    to the part between parentheses of every image link that is not inside
+    a code block. The string is only traversed once, regardless of the
+    number of links and rules.
+
+    >>> escape_link_img_matches(((re.compile(ur"\s+"), u"&#32;"),), u"`![](a b)` ![](a b)")
+    u'`![](a b)` ![](a&#32;b)'
+    """
+
+    assert isinstance(s, unicode), "Input `s` is not Unicode"
+
+    if u"![" not in s:
+        return s
+
+    # don't escape anything when we're in a (inline) code block
+    code_starts, code_max_ends = get_code_spans(s)
+
+    parts = list()
+    last_end = 0
+    for match in const.IS_LINK_OR_IMG_REGEX.finditer(s):
+        # see if match is inside a code block: the code block that starts
+        # at or before the match and reaches the farthest must enclose it
+        start_match, end_match = match.span()
+        index = bisect.bisect_right(code_starts, start_match) - 1
+        if index > -1 and code_max_ends[index] >= end_match:
+            continue
+
+        start, end = match.span(1)
+        replacement = match.group(1)
+        for regex, new in rules:
+            replacement = regex.sub(new, replacement)
+        parts.append(s[last_end:start])
+        parts.append(replacement)
+        last_end = end
+
+    if parts:
+        parts.append(s[last_end:])
+        s = u"".join(parts)
 
     assert isinstance(s, unicode), "Result `s` is not Unicode"
 
@@ -310,34 +456,67 @@ def convert_clean_md_to_html(md, put_breaks=False):
     """
     Convert a string containing Markdown syntax to a string with HTML that
     Anki expects.
+
+    >>> convert_clean_md_to_html(u"  a\\n\\n   \\nb  c", put_breaks=True)
+    u'<div>&nbsp; a</div><div><br /></div><div><br /></div><div>b &nbsp;c</div>'
     """
 
     assert isinstance(md, unicode), "Input `md` is not Unicode"
 
-    result = u"<div>"
-    location_last_nbsp = -999999999  # take an unlike large previous occurence
-    last_char = u""
-    for index, char in enumerate(md):
-        if char == u"\n":
-            result += u"</div><div>"
-        elif char == " ":
-            if (index - location_last_nbsp) == 1:
-                result += char
-            else:
-                if last_char == u"\n" or last_char in u" ":
-                    result += u"&nbsp;"
-                    location_last_nbsp = index
-                else:
-                    result += char
-        else:
-            result += char
-        last_char = char
-    # remove last opening <div> tag
-    if result.endswith(u"<div>"):
-        result = result[:(len(result) - len(u"<div>"))]
-    # or add a closing <div> tag
+    if u"<" in md:
+        # the text may contain tags, which have to be parsed
+        result = convert_clean_md_with_tags_to_html(md, put_breaks)
     else:
-        result += u"</div>"
+        result = u"".join(generate_clean_md_divs(md, put_breaks))
+
+    assert isinstance(result, unicode), "Result `result` is not Unicode"
+    return result
+
+
+def generate_clean_md_divs(md, put_breaks=False):
+    """
+    Generator that yields a `<div>` for every line in the Markdown string
+    `md`, which should not contain tags. Leading spaces and consecutive
+    spaces alternately become non-breakable spaces, so that they stay
+    visible. A line that consists solely of (non-breakable) whitespace
+    becomes a `<br />`, and so does an empty line when `put_breaks` is
+    `True`. A trailing newline does not create an empty last line. Entities
+    and bare ampersands are written the same way BeautifulSoup writes them.
+    """
+    lines = md.split(u"\n")
+    if not lines[-1]:
+        lines.pop()
+    for line in lines:
+        if not line:
+            yield u"<div><br /></div>" if put_breaks else u"<div></div>"
+            continue
+        line = const.CONSECUTIVE_SPACES_REGEX.sub(replace_spaces, line)
+        line = const.SGML_REFERENCE_REGEX.sub(ur"&\1;", line)
+        if all(word == u"&nbsp;" for word in line.split()):
+            yield u"<div><br /></div>"
+        else:
+            yield u"<div>" + const.BARE_AMPERSAND_OR_BRACKET_REGEX.sub(
+                replace_bare_ampersand_or_bracket, line) + u"</div>"
+
+
+def replace_bare_ampersand_or_bracket(match):
+    """
+    Return the entity for the `&`, `<` or `>` in `match`.
+    """
+    return {u"&": u"&amp;", u"<": u"&lt;", u">": u"&gt;"}[match.group()]
+
+
+def convert_clean_md_with_tags_to_html(md, put_breaks=False):
+    """
+    Convert a string containing Markdown syntax and HTML tags to a string
+    with HTML that Anki expects.
+    """
+
+    result = u"".join(u"<div>" + const.CONSECUTIVE_SPACES_REGEX.sub(
+        replace_spaces, line) + u"</div>" for line in md.split(u"\n"))
+    # remove last (empty) <div>
+    if md.endswith(u"\n"):
+        result = result[:-len(u"<div></div>")]
 
     # <div></div> needs to be a visible empty line
     if put_breaks:
@@ -354,10 +533,23 @@ def convert_clean_md_to_html(md, put_breaks=False):
         if elem.string is not None:
             if all(x in ("&nbsp;", " ") for x in elem.string.split()):
                 elem.setString(BeautifulSoup.Tag(soup, "br"))
-    result = unicode(soup)
+    return unicode(soup)
 
-    assert isinstance(result, unicode), "Result `result` is not Unicode"
-    return result
+
+def replace_spaces(match):
+    """
+    Return the replacement for the run of spaces in `match`. Non-breakable
+    spaces and regular spaces alternate, starting with a non-breakable space
+    at the start of a line, and with a regular space elsewhere.
+
+    >>> replace_spaces(re.match(ur" +", u"   "))
+    u'&nbsp; &nbsp;'
+    """
+    if match.start() == 0:
+        spaces = (u"&nbsp;", u" ")
+    else:
+        spaces = (u" ", u"&nbsp;")
+    return u"".join(spaces[i % 2] for i in xrange(len(match.group())))
 
 
 def is_same_html(html_one, html_two):
@@ -409,19 +601,47 @@ def remove_white_space(s):
     return u"".join(char for char in s if not char.isspace())
 
 
-def markdown_data_to_json(unique_id, isconverted, md):
+def markdown_data_to_json(unique_id, isconverted, md, fingerprint=None):
     """
     Return a dictionary with information that is needed for the database.
     """
 
     assert isinstance(md, unicode), "Input `md` is not Unicode"
 
-    return  {
+    md_dict = {
                 "id": unique_id,
                 "isconverted": isconverted,
                 "md": md,
                 "lastmodified": intTime()
             }
+    if fingerprint:
+        md_dict["fp"] = fingerprint
+    return md_dict
+
+
+def get_html_fingerprint(html):
+    """
+    Return a short hash of `html` that does not change when the editor
+    reformats the HTML without changing its content: whitespace, character
+    entities, the slash of self-closing tags, and the alignment that
+    `Markdowner.align_elements` adds are ignored. Markdown data in `html` is
+    left out.
+
+    >>> get_html_fingerprint(u"<p>a<br />b</p>") == get_html_fingerprint(u"<p style=\"text-align: left;\">a<br>b</p>")
+    True
+    """
+
+    assert isinstance(html, unicode), "Input `html` is not Unicode"
+
+    start, end = find_md_data(html)
+    if start != -1:
+        html = html[:start] + html[end:]
+    html = unescape_html(html)
+    html = const.FINGERPRINT_ALIGNMENT_REGEX.sub(u"", html)
+    html = const.FINGERPRINT_EMPTY_STYLE_REGEX.sub(u"", html)
+    html = const.FINGERPRINT_SELF_CLOSING_REGEX.sub(u">", html)
+    html = const.WHITESPACE_REGEX.sub(u"", html)
+    return unicode(hashlib.sha1(html.encode("utf-8")).hexdigest()[:16])
 
 
 def merge_dicts(existing, new):
@@ -443,11 +663,13 @@ def merge_dicts(existing, new):
 
 def json_dump_and_compress(data):
     """
-    Take a string `data` and JSONify it. Return the resultant string, encoded
-    in base64.
+    Take a string `data` and JSONify it in its most compact form. Return the
+    resultant string, compressed with zlib and encoded in base64.
     """
 
-    encoded = unicode(base64.b64encode(json.dumps(data)))
+    dumped = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+    dumped = dumped.encode("utf-8")
+    encoded = unicode(base64.b64encode(zlib.compress(dumped, 9)))
     assert isinstance(encoded, unicode), "Output `encoded` is not Unicode"
     return encoded
 
@@ -455,6 +677,8 @@ def json_dump_and_compress(data):
 def decompress_and_json_load(data):
     """
     Decode a base64-encoded string and return a string that is valid JSON.
+    Both the zlib-compressed data and the uncompressed data of the first
+    version of the format are accepted.
     """
 
     if not data:
@@ -469,6 +693,14 @@ def decompress_and_json_load(data):
         print e  # TODO: should be logged
         return "corrupted"
 
+    # a zlib stream starts with 0x78, which can never start a JSON document
+    if decoded.startswith(b"\x78"):
+        try:
+            decoded = zlib.decompress(decoded)
+        except zlib.error as e:
+            print e  # TODO: should be logged
+            return "corrupted"
+
     try:
         ret = json.loads(decoded)
         return ret
@@ -502,14 +734,35 @@ def insert_md_data(unique_id, isconverted, md, html):
     Creates a HTML string that contains the Markdown data needed for reversion.
     Returns the input `html` string with the Markdown data appended.
     """
-    md_dict = markdown_data_to_json(unique_id, isconverted, md)
+    md_dict = markdown_data_to_json(unique_id, isconverted, md,
+                                    get_html_fingerprint(html))
     md_dict_compr = json_dump_and_compress(md_dict)
-    wrapped_md_dict_compr = wrap_string(const.START_HTML_MARKER,
+    wrapped_md_dict_compr = wrap_string(const.START_HTML_MARKER_V2,
                                         md_dict_compr,
                                         const.END_HTML_MARKER)
     return concat(html, wrapped_md_dict_compr)
 
 
+def find_md_data(html):
+    """
+    Return a tuple with the start and end position of the Markdown data in
+    `html`, including the markers, or `(-1, -1)` if no data can be found.
+    Both the current and the older marker are recognized.
+
+    >>> find_md_data(u"<div>a</div><!----SBAdata2:eNqrVkpUsjKsBQAIKgIJ---->")
+    (12, 52)
+    """
+    for marker in (const.START_HTML_MARKER_V2, const.START_HTML_MARKER):
+        start = html.find(marker)
+        if start == -1:
+            continue
+        end = html.find(const.END_HTML_MARKER, start + len(marker))
+        if end == -1:
+            return -1, -1
+        return start, end + len(const.END_HTML_MARKER)
+    return -1, -1
+
+
 def get_md_data_from_string(html):
     """
     Read a string `html` and extract compressed Markdown data from it, if
@@ -519,12 +772,11 @@ def get_md_data_from_string(html):
     if not html:
         return u""
     assert isinstance(html, unicode), "Input `html` is not Unicode"
-    if const.START_HTML_MARKER not in html:
-        return u""
-    start = html.find(const.START_HTML_MARKER) + len(const.START_HTML_MARKER)
-    end = html.find(const.END_HTML_MARKER, start)
-    if start == -1 or end == -1:
+    start, end = find_md_data(html)
+    if start == -1:
         return u""
+    start = html.index(":", start) + 1
+    end -= len(const.END_HTML_MARKER)
     compr_str = html[start:end]
     return compr_str
 
@@ -701,8 +953,7 @@ def remove_whitespace_before_abbreviation_definition(md):
     if not md:
         return md
     assert isinstance(md, unicode), "Input `md` is not Unicode"
-    regex = re.compile(r"( |\&nbsp;)+(\*\[[^]]*\]:)")
-    return re.sub(regex, r"\2", md)
+    return const.ABBREVIATION_DEFINITION_WHITESPACE_REGEX.sub(r"\2", md)
 
 
 def remove_leading_whitespace_from_dd_element(md, add_newline=False):
@@ -713,7 +964,7 @@ def remove_leading_whitespace_from_dd_element(md, add_newline=False):
         return md
     assert isinstance(md, unicode), "Input `md` is not Unicode"
     markdown = md
-    regex = re.compile(r"(\n) {4}(: .*?\n)")
+    regex = const.DD_ELEMENT_WHITESPACE_REGEX
     result = re.findall(regex, markdown)
     replacement = r"\1\2\n" if add_newline else r"\1\2"
     markdown = re.sub(regex, replacement, markdown, count=(len(result)-1))